@@ -1,38 +1,120 @@
 # analytics.py — build 6 charts (matplotlib), interactive plotly, and Excel export
 import os
+import io
 import math
-from datetime import datetime
+import numbers
+import time
+import contextlib
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+import matplotlib
 import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.express as px
 from sqlalchemy import text
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill, Font
+from openpyxl.utils import get_column_letter
 from openpyxl.formatting.rule import ColorScaleRule
 import numpy as np
 
+import olist_snapshot
+import sql_registry
 from config import engine
+from result_cache import ResultCache
 
 CHARTS_DIR = "charts"
 EXPORTS_DIR = "exports"
+# каталог Parquet-снимка (olist_snapshot.py): если задан, запросы идут в DuckDB по снимку, а не в Postgres
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR")
+# facts — все графики строятся из одной выборки фактов (Q_FACTS) в pandas; queries — запрос на каждый график
+ANALYTICS_MODE = os.getenv("ANALYTICS_MODE", "queries")
+FACTS_CHUNK_ROWS = 50_000
+# 1 — запросы, для которых есть свёртка (05_rollups.sql, olist_rollups.py), читают её вместо сырых таблиц
+USE_ROLLUPS = os.getenv("ANALYTICS_ROLLUPS", "0") == "1"
+# кэш результатов запросов к Postgres (Parquet-файлы, ключ — SQL + водяной знак данных); пустой каталог — без кэша
+CACHE_DIR = os.getenv("ANALYTICS_CACHE_DIR", "cache/analytics")
+CACHE_MAX_MB = int(os.getenv("ANALYTICS_CACHE_MB", "512"))
+RESULT_CACHE = ResultCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024) if CACHE_DIR else None
+# конвейер main(): запросы — в потоках (по соединению из пула engine на поток), графики — в процессах
+QUERY_WORKERS = int(os.getenv("ANALYTICS_QUERY_WORKERS", "4"))
+RENDER_WORKERS = int(os.getenv("ANALYTICS_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
 os.makedirs(CHARTS_DIR, exist_ok=True)
 os.makedirs(EXPORTS_DIR, exist_ok=True)
 
 # ----------------------------
 # Helpers
 # ----------------------------
-def run_query(sql: str) -> pd.DataFrame:
-    with engine.connect() as conn:
-        df = pd.read_sql(text(sql), conn)
+def run_query(name: str, chunksize: int = None) -> pd.DataFrame:
+    """
+    Выполняет запрос из каталога sql_registry по имени (время — в sql_registry.stats()).
+    chunksize — читать серверным курсором по chunksize строк (память драйвера не растёт с размером выборки).
+    """
+    if SNAPSHOT_DIR:
+        with sql_registry.timed(name):
+            return olist_snapshot.query(SNAPSHOT_DIR, sql_registry.sql(name))
+    if USE_ROLLUPS:
+        name = ROLLUP_QUERIES.get(name, name)
+    key = None
+    if RESULT_CACHE is not None:
+        key = RESULT_CACHE.key(sql_registry.sql(name), data_watermark())
+        df = RESULT_CACHE.get(key)
+        if df is not None:
+            return df
+    if chunksize:
+        with engine.connect().execution_options(stream_results=True) as conn, sql_registry.timed(name):
+            chunks = pd.read_sql(text(sql_registry.sql(name)), conn, chunksize=chunksize)
+            df = pd.concat(list(chunks), ignore_index=True)
+    else:
+        with engine.connect() as conn, sql_registry.timed(name):
+            df = pd.read_sql(text(sql_registry.sql(name)), conn)
+    if key is not None:
+        RESULT_CACHE.put(key, df)
     return df
 
+
+# Водяной знак данных для ключа кэша: последняя дата покупки и счётчики вставок/изменений/удалений по таблицам olist
+# (pg_stat_user_tables — без чтения самих таблиц; MAX — по idx_orders_purchase_ts). Считается раз за запуск.
+Q_DATA_WATERMARK = """
+SELECT (SELECT MAX(order_purchase_timestamp) FROM orders)::text AS max_purchase_ts,
+       COALESCE(string_agg(relname || ':' || (n_tup_ins + n_tup_upd + n_tup_del), ',' ORDER BY relname), '')
+         AS table_writes
+FROM pg_stat_user_tables
+WHERE schemaname = 'olist';
+"""
+sql_registry.register("analytics_data_watermark", Q_DATA_WATERMARK, prepare=False)
+_watermark = None
+_watermark_lock = threading.Lock()
+
+def data_watermark() -> str:
+    global _watermark
+    with _watermark_lock:
+        if _watermark is None:
+            with engine.connect() as conn, sql_registry.timed("analytics_data_watermark"):
+                max_ts, writes = conn.execute(text(sql_registry.sql("analytics_data_watermark"))).one()
+            _watermark = f"{max_ts}|{writes}"
+        return _watermark
+
 def console_report(df: pd.DataFrame, chart_type: str, title: str):
     print(f"[{chart_type}] rows={len(df)} | {title}")
 
+# в процессе рендеринга (_render_chart) PNG не пишутся на диск, а собираются сюда: [(путь, байты), ...]
+_png_sink = None
+
 def save_png_current(fig_name: str):
     # Each chart its own figure, no seaborn, no explicit colors.
     plt.tight_layout()
     out = os.path.join(CHARTS_DIR, fig_name)
+    if _png_sink is not None:
+        buf = io.BytesIO()
+        plt.savefig(buf, format="png", dpi=160, bbox_inches="tight")
+        plt.close()
+        _png_sink.append((out, buf.getvalue()))
+        return
     plt.savefig(out, dpi=160, bbox_inches="tight")
     plt.close()
     print(f"Saved chart: {out}")
@@ -79,7 +161,8 @@ JOIN orders o ON oi.order_id = o.order_id
 JOIN products p ON p.product_id = oi.product_id
 LEFT JOIN product_category_name_translation t
   ON t.product_category_name = p.product_category_name
-WHERE EXTRACT(YEAR FROM o.order_purchase_timestamp) IN (2016,2017,2018)
+-- годы 2016–2018 полуинтервалом по столбцу (sargable, idx_orders_purchase_ts)
+WHERE o.order_purchase_timestamp >= '2016-01-01' AND o.order_purchase_timestamp < '2019-01-01'
 GROUP BY category, year
 ORDER BY SUM(oi.price) DESC
 LIMIT 30;   -- 10 категорий * 3 года
@@ -128,8 +211,8 @@ Q_ORDERS_BY_YEARS = """
             EXTRACT(YEAR FROM order_purchase_timestamp)::int AS year,
             COUNT(*)::int AS order_count
         FROM orders
-        WHERE order_purchase_timestamp IS NOT NULL
-            AND EXTRACT(YEAR FROM order_purchase_timestamp) BETWEEN 2016 AND 2018
+        WHERE order_purchase_timestamp >= '2016-01-01'
+            AND order_purchase_timestamp < '2019-01-01'
         GROUP BY 1, 2
     )
     SELECT month_start::date AS month_start, year, order_count
@@ -137,11 +220,271 @@ Q_ORDERS_BY_YEARS = """
     ORDER BY month_start, year;
 """
 
+# top-5 states by orders, monthly (interactive slider)
+Q_ORDERS_BY_STATE = """
+WITH orders_by_state AS (
+  SELECT
+    DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+    c.customer_state AS state
+  FROM orders o
+  JOIN customers c ON c.customer_id = o.customer_id
+  WHERE o.order_purchase_timestamp IS NOT NULL
+    AND c.customer_state IS NOT NULL
+),
+top5 AS (
+  SELECT state, COUNT(*) AS cnt
+  FROM orders_by_state
+  GROUP BY state
+  ORDER BY cnt DESC
+  LIMIT 5
+)
+SELECT
+  obs.month,
+  obs.state,
+  COUNT(*)::int AS orders_count
+FROM orders_by_state obs
+JOIN top5 t ON t.state = obs.state
+GROUP BY obs.month, obs.state
+ORDER BY obs.month, obs.state;
+"""
+
+# Факты для режима facts: строка на позицию заказа (заказ без позиций — одна строка с пустыми полями позиции).
+# Поля заказа повторяются в каждой его позиции; payment_types — по элементу на платёж, review_sum / review_n —
+# по непустым оценкам заказа. Из этого восстанавливаются все запросы выше, включая кратности их join.
+Q_FACTS = """
+WITH items AS (
+  SELECT oi.order_id,
+         oi.price::float8 AS price,
+         (oi.price + oi.freight_value)::float8 AS item_total,
+         COALESCE(t.product_category_name_english, p.product_category_name) AS category
+  FROM order_items oi
+  LEFT JOIN products p ON p.product_id = oi.product_id
+  LEFT JOIN product_category_name_translation t
+    ON t.product_category_name = p.product_category_name
+),
+pays AS (
+  SELECT order_id, array_agg(payment_type) AS payment_types
+  FROM order_payments
+  GROUP BY order_id
+),
+reviews AS (
+  SELECT order_id, SUM(review_score)::float8 AS review_sum, COUNT(review_score)::int AS review_n
+  FROM order_reviews
+  GROUP BY order_id
+)
+SELECT o.order_id,
+       DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+       EXTRACT(YEAR FROM o.order_purchase_timestamp)::int AS year,
+       (EXTRACT(EPOCH FROM (o.order_delivered_customer_date - o.order_purchase_timestamp))/86400.0)::float8
+         AS delivery_days,
+       c.customer_state AS state,
+       i.category, i.price, i.item_total,
+       r.review_sum, r.review_n,
+       py.payment_types
+FROM orders o
+LEFT JOIN customers c ON c.customer_id = o.customer_id
+LEFT JOIN items i ON i.order_id = o.order_id
+LEFT JOIN pays py ON py.order_id = o.order_id
+LEFT JOIN reviews r ON r.order_id = o.order_id;
+"""
+
+# Те же выборки по свёрткам (ANALYTICS_ROLLUPS=1). Месяцы свёрток — по UTC; заказы без даты покупки в них не входят.
+Q_LINE_ROLLUP = """
+SELECT month, revenue AS monthly_revenue
+FROM rollup_monthly_revenue
+WHERE items_count > 0
+ORDER BY month;
+"""
+
+Q_BAR_ROLLUP = """
+SELECT category,
+       EXTRACT(YEAR FROM month AT TIME ZONE 'UTC')::int AS year,
+       ROUND(SUM(revenue), 2) AS revenue
+FROM rollup_category_revenue
+WHERE month >= '2016-01-01 00:00+00' AND month < '2019-01-01 00:00+00'
+GROUP BY category, year
+ORDER BY SUM(revenue) DESC
+LIMIT 30;
+"""
+
+Q_BARH_REVIEWS_ROLLUP = """
+SELECT category,
+       ROUND(SUM(review_sum)::NUMERIC / SUM(review_n), 3) AS avg_score,
+       SUM(review_n) AS n_reviews
+FROM rollup_category_reviews
+GROUP BY category
+HAVING SUM(review_n) >= 50
+ORDER BY avg_score DESC, n_reviews DESC
+LIMIT 10;
+"""
+
+Q_ORDERS_BY_YEARS_ROLLUP = """
+SELECT (month AT TIME ZONE 'UTC')::date AS month_start,
+       EXTRACT(YEAR FROM month AT TIME ZONE 'UTC')::int AS year,
+       orders_count AS order_count
+FROM rollup_monthly_revenue
+WHERE month >= '2016-01-01 00:00+00' AND month < '2019-01-01 00:00+00'
+ORDER BY month_start, year;
+"""
+
+Q_ORDERS_BY_STATE_ROLLUP = """
+SELECT month, state, orders_count
+FROM rollup_state_orders
+WHERE state IN (
+  SELECT state FROM rollup_state_orders
+  GROUP BY state
+  ORDER BY SUM(orders_count) DESC
+  LIMIT 5
+)
+ORDER BY month, state;
+"""
+
+# запрос по сырым таблицам -> тот же по свёрткам
+ROLLUP_QUERIES = {
+    "analytics_line": "analytics_line_rollup",
+    "analytics_bar": "analytics_bar_rollup",
+    "analytics_barh_reviews": "analytics_barh_reviews_rollup",
+    "analytics_orders_by_years": "analytics_orders_by_years_rollup",
+    "analytics_orders_by_state": "analytics_orders_by_state_rollup",
+}
+
+# Разовые тяжёлые агрегации: в общем каталоге запросов, но без PREPARE (custom-план на каждый запуск)
+for _name, _sql in (
+    ("analytics_line", Q_LINE),
+    ("analytics_pie", Q_PIE),
+    ("analytics_bar", Q_BAR),
+    ("analytics_barh_reviews", Q_BARH_REVIEWS),
+    ("analytics_scatter", Q_SCATTER),
+    ("analytics_orders_by_years", Q_ORDERS_BY_YEARS),
+    ("analytics_orders_by_state", Q_ORDERS_BY_STATE),
+    ("analytics_facts", Q_FACTS),
+    ("analytics_line_rollup", Q_LINE_ROLLUP),
+    ("analytics_bar_rollup", Q_BAR_ROLLUP),
+    ("analytics_barh_reviews_rollup", Q_BARH_REVIEWS_ROLLUP),
+    ("analytics_orders_by_years_rollup", Q_ORDERS_BY_YEARS_ROLLUP),
+    ("analytics_orders_by_state_rollup", Q_ORDERS_BY_STATE_ROLLUP),
+):
+    sql_registry.register(_name, _sql, prepare=False)
+
+
+# ----------------------------
+# Facts mode: те же выборки, что у запросов выше, но из одной выборки фактов (pandas)
+# ----------------------------
+def load_facts() -> pd.DataFrame:
+    """Выборка фактов Q_FACTS одним проходом по базе (серверным курсором, чанками по FACTS_CHUNK_ROWS)."""
+    return run_query("analytics_facts", chunksize=FACTS_CHUNK_ROWS)
+
+
+def _fact_orders(f: pd.DataFrame) -> pd.DataFrame:
+    return f.drop_duplicates("order_id")
+
+
+def _fact_items(f: pd.DataFrame) -> pd.DataFrame:
+    return f[f["price"].notna()]
+
+
+def _fact_payments(f: pd.DataFrame) -> pd.DataFrame:
+    """Строка на платёж: order_id, payment_type."""
+    pays = _fact_orders(f)[["order_id", "payment_types"]].explode("payment_types")
+    return pays.dropna(subset=["payment_types"]).rename(columns={"payment_types": "payment_type"})
+
+
+def facts_line(f: pd.DataFrame) -> pd.DataFrame:
+    return (
+        _fact_items(f).groupby("month", dropna=False)["item_total"].sum()
+        .rename("monthly_revenue").reset_index()
+        .sort_values("month").reset_index(drop=True)
+    )
+
+
+def facts_pie(f: pd.DataFrame) -> pd.DataFrame:
+    # как в Q_PIE: платёж считается столько раз, сколько позиций в заказе
+    n_items = _fact_items(f).groupby("order_id").size()
+    pays = _fact_payments(f)
+    pays = pays.assign(cnt=pays["order_id"].map(n_items)).dropna(subset=["cnt"])
+    return (
+        pays.groupby("payment_type")["cnt"].sum().astype(int).reset_index()
+        .sort_values("cnt", ascending=False).reset_index(drop=True)
+    )
+
+
+def facts_bar(f: pd.DataFrame) -> pd.DataFrame:
+    items = _fact_items(f)
+    items = items[items["year"].between(2016, 2018)]
+    df = (
+        items.groupby(["category", "year"], dropna=False)["price"].sum()
+        .rename("revenue").reset_index()
+        .sort_values("revenue", ascending=False).head(30).reset_index(drop=True)
+    )
+    df["year"] = df["year"].astype(int)
+    df["revenue"] = df["revenue"].round(2)
+    return df
+
+
+def facts_barh_reviews(f: pd.DataFrame) -> pd.DataFrame:
+    # как в Q_BARH_REVIEWS: каждая оценка заказа считается по разу на позицию
+    items = _fact_items(f)
+    items = items[items["review_n"] > 0]
+    df = items.groupby("category", dropna=False).agg(review_sum=("review_sum", "sum"), n_reviews=("review_n", "sum"))
+    df = df[df["n_reviews"] >= 50]
+    df["avg_score"] = (df["review_sum"] / df["n_reviews"]).round(3)
+    return (
+        df.reset_index()[["category", "avg_score", "n_reviews"]]
+        .astype({"n_reviews": int})
+        .sort_values(["avg_score", "n_reviews"], ascending=False).head(10).reset_index(drop=True)
+    )
+
+
+def facts_scatter(f: pd.DataFrame) -> pd.DataFrame:
+    # как в Q_SCATTER: сумма позиций умножается на число платежей заказа (join с order_payments)
+    totals = _fact_items(f).groupby("order_id")["item_total"].sum()
+    n_pays = _fact_payments(f).groupby("order_id").size()
+    orders = _fact_orders(f)
+    orders = orders[orders["delivery_days"].between(0, 60)][["order_id", "delivery_days"]]
+    orders = orders.assign(order_total=orders["order_id"].map(totals) * orders["order_id"].map(n_pays))
+    return orders.dropna(subset=["order_total"]).reset_index(drop=True)
+
+
+def facts_orders_by_years(f: pd.DataFrame) -> pd.DataFrame:
+    orders = _fact_orders(f)
+    orders = orders[orders["year"].between(2016, 2018)]
+    df = orders.groupby(["month", "year"]).size().rename("order_count").reset_index()
+    df["month_start"] = df["month"].dt.date
+    df["year"] = df["year"].astype(int)
+    return df[["month_start", "year", "order_count"]].sort_values(["month_start", "year"]).reset_index(drop=True)
+
+
+def facts_orders_by_state(f: pd.DataFrame) -> pd.DataFrame:
+    orders = _fact_orders(f)
+    orders = orders[orders["month"].notna() & orders["state"].notna()]
+    top5 = orders["state"].value_counts().head(5).index
+    return (
+        orders[orders["state"].isin(top5)].groupby(["month", "state"]).size()
+        .rename("orders_count").reset_index()
+        .sort_values(["month", "state"]).reset_index(drop=True)
+    )
+
+
+# имя запроса в sql_registry -> та же выборка из фактов
+FACT_VIEWS = {
+    "analytics_line": facts_line,
+    "analytics_pie": facts_pie,
+    "analytics_bar": facts_bar,
+    "analytics_barh_reviews": facts_barh_reviews,
+    "analytics_scatter": facts_scatter,
+    "analytics_orders_by_years": facts_orders_by_years,
+    "analytics_orders_by_state": facts_orders_by_state,
+}
+
+
+def frames_from_facts(f: pd.DataFrame) -> dict:
+    return {name: view(f) for name, view in FACT_VIEWS.items()}
+
 # ----------------------------
 # Charts (matplotlib)
 # ----------------------------
-def chart_line_monthly_revenue():
-    df = run_query(Q_LINE)
+def chart_line_monthly_revenue(df: pd.DataFrame = None):
+    df = run_query("analytics_line") if df is None else df
     console_report(df, "line", "Monthly revenue trend")
     plt.figure()
     plt.plot(df["month"], df["monthly_revenue"], marker="o")
@@ -152,8 +495,8 @@ def chart_line_monthly_revenue():
     save_png_current("01_line_monthly_revenue.png")
     return df
 
-def chart_pie_payment_share():
-    df = run_query(Q_PIE)
+def chart_pie_payment_share(df: pd.DataFrame = None):
+    df = run_query("analytics_pie") if df is None else df
     console_report(df, "pie", "Payment method share (count of payments)")
 
     sizes = df["cnt"].values
@@ -183,8 +526,8 @@ def chart_pie_payment_share():
     save_png_current("02_pie_payment_share.png")
     return df
 
-def chart_bar_top_categories_revenue():
-    df = run_query(Q_BAR)
+def chart_bar_top_categories_revenue(df: pd.DataFrame = None):
+    df = run_query("analytics_bar") if df is None else df
     console_report(df, "bar", "Top-10 Categories by Revenue, 2016–2018")
 
     # берём 10 самых прибыльных категорий суммарно
@@ -220,8 +563,8 @@ def chart_bar_top_categories_revenue():
     return df
 
 
-def chart_barh_avg_review_by_category():
-    df = run_query(Q_BARH_REVIEWS)
+def chart_barh_avg_review_by_category(df: pd.DataFrame = None):
+    df = run_query("analytics_barh_reviews") if df is None else df
     console_report(df, "barh", "Top-10 Categories by Avg Review Score")
     plt.figure()
     colors = plt.cm.Set3(np.linspace(0, 1, len(df["category"])))
@@ -233,8 +576,8 @@ def chart_barh_avg_review_by_category():
     save_png_current("04_barh_avg_review_score.png")
     return df
 
-def chart_hist_order_total_distribution():
-    df = run_query(Q_ORDERS_BY_YEARS)
+def chart_hist_order_total_distribution(df: pd.DataFrame = None):
+    df = run_query("analytics_orders_by_years") if df is None else df
     df['month_num'] = pd.to_datetime(df['month_start']).dt.month
     pivot = df.pivot_table(index='month_num', columns='year', values='order_count', aggfunc='sum').fillna(0).astype(int)
     # Ensure rows for all 12 months exist
@@ -253,8 +596,8 @@ def chart_hist_order_total_distribution():
     plt.tight_layout()
     save_png_current("05_hist_order_by_years.png")
 
-def chart_scatter_delivery_vs_total():
-    df = run_query(Q_SCATTER)
+def chart_scatter_delivery_vs_total(df: pd.DataFrame = None):
+    df = run_query("analytics_scatter") if df is None else df
     console_report(df, "scatter", "Delivery time (days) vs Order total")
     plt.figure()
     plt.scatter(df["order_total"], df["delivery_days"], s=10, color='coral', alpha=0.6)
@@ -263,37 +606,8 @@ def chart_scatter_delivery_vs_total():
     plt.ylabel("Delivery Days")
     save_png_current("06_scatter_delivery_vs_total.png")
     return df
-def interactive_time_slider():
-    sql = """
-    SET search_path TO olist, public;
-
-    WITH orders_by_state AS (
-      SELECT
-        DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
-        c.customer_state AS state
-      FROM orders o
-      JOIN customers c ON c.customer_id = o.customer_id
-      WHERE o.order_purchase_timestamp IS NOT NULL
-        AND c.customer_state IS NOT NULL
-    ),
-    top5 AS (
-      SELECT state, COUNT(*) AS cnt
-      FROM orders_by_state
-      GROUP BY state
-      ORDER BY cnt DESC
-      LIMIT 5
-    )
-    SELECT
-      obs.month,
-      obs.state,
-      COUNT(*)::int AS orders_count
-    FROM orders_by_state obs
-    JOIN top5 t ON t.state = obs.state
-    GROUP BY obs.month, obs.state
-    ORDER BY obs.month, obs.state;
-    """
-
-    df = run_query(sql)
+def interactive_time_slider(df: pd.DataFrame = None):
+    df = run_query("analytics_orders_by_state") if df is None else df
     if df.empty:
         print("No data for plot.")
         return {"data": df, "fig": None}
@@ -354,33 +668,103 @@ def interactive_time_slider():
 # ----------------------------
 # Excel export with formatting
 # ----------------------------
-def export_to_excel(dfs: dict, filename: str):
+EXCEL_MAX_WIDTH = 40
+
+
+def _sanitize_df(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    # убрать tz у всех datetime колонок
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]):
+            # если tz-aware -> сделать naive
+            try:
+                df[c] = pd.to_datetime(df[c], utc=True).dt.tz_convert(None)
+            except Exception:
+                df[c] = pd.to_datetime(df[c]).dt.tz_localize(None)
+        # привести category к строке
+        if pd.api.types.is_categorical_dtype(df[c]):
+            df[c] = df[c].astype(str)
+    return df
+
+
+def _excel_column_widths(df: pd.DataFrame) -> list:
+    """Ширины колонок по длине текста значений (как авто-ширина по ячейкам, но по столбцам pandas)."""
+    widths = []
+    for c in df.columns:
+        values = df[c].dropna()
+        if values.empty:
+            body = 0
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            body = 19  # datetime.isoformat() без микросекунд
+        else:
+            body = int(values.astype(str).str.len().max())
+        widths.append(min(max(len(str(c)), body) + 2, EXCEL_MAX_WIDTH))
+    return widths
+
+
+def _excel_numeric_columns(df: pd.DataFrame) -> list:
+    """Номера (с 1) числовых колонок, в которых хотя бы 2 значения — для цветовой шкалы."""
+    return [
+        i for i, c in enumerate(df.columns, 1)
+        if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])
+        and df[c].count() >= 2
+    ]
+
+
+def _write_excel_streaming(dfs: dict, path: str):
     """
-    dfs: {"sheet_name": DataFrame, ...}
+    Write-only книга openpyxl: строки уходят в файл по мере append, ширины / числовые колонки считаются по
+    DataFrame заранее, стили и форматирование задаются при записи — без повторной загрузки книги.
     """
-    from openpyxl import load_workbook
-    from openpyxl.styles import Font
-    from openpyxl.formatting.rule import ColorScaleRule
-    from openpyxl.utils import get_column_letter
-    import numbers
-    import datetime as dt
+    wb = Workbook(write_only=True)
+    for sheet, df in dfs.items():
+        clean = _sanitize_df(df)
+        for c in clean.columns:
+            # NUMERIC из Postgres приходит Decimal-объектами — в float, чтобы колонка считалась числовой
+            first = clean[c].dropna().head(1)
+            if clean[c].dtype == object and len(first) and isinstance(first.iloc[0], Decimal):
+                clean[c] = clean[c].astype(float)
+        ws = wb.create_sheet(title=sheet)
+        # ширины и закрепление шапки — до первой строки (пишутся в начало листа)
+        for col_idx, width in enumerate(_excel_column_widths(clean), 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+        ws.freeze_panes = "A2"
 
-    path = os.path.join(EXPORTS_DIR, filename)
+        last_col = get_column_letter(max(len(clean.columns), 1))
+        last_row = len(clean) + 1
+        ws.auto_filter.ref = f"A1:{last_col}{last_row}"
+        for col_idx in _excel_numeric_columns(clean):
+            col_letter = get_column_letter(col_idx)
+            ws.conditional_formatting.add(f"{col_letter}2:{col_letter}{last_row}", ColorScaleRule(
+                start_type="min", start_color="FFAA0000",  # красный
+                mid_type="percentile", mid_value=50, mid_color="FFFFFF00",  # жёлтый
+                end_type="max", end_color="FF00AA00"  # зелёный
+            ))
+
+        header = []
+        for name in clean.columns:
+            cell = WriteOnlyCell(ws, value=str(name))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+        # NaN/NaT -> пустая ячейка, numpy-скаляры -> Python-значения одним проходом по кадру
+        body = clean.astype(object).where(clean.notna(), None)
+        for row in body.itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(path)
 
-    def _sanitize_df(df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        # убрать tz у всех datetime колонок
-        for c in df.columns:
-            if pd.api.types.is_datetime64_any_dtype(df[c]):
-                # если tz-aware -> сделать naive
-                try:
-                    df[c] = pd.to_datetime(df[c], utc=True).dt.tz_convert(None)
-                except Exception:
-                    df[c] = pd.to_datetime(df[c]).dt.tz_localize(None)
-            # привести category к строке
-            if pd.api.types.is_categorical_dtype(df[c]):
-                df[c] = df[c].astype(str)
-        return df
+
+def export_to_excel(dfs: dict, filename: str, streaming: bool = True):
+    """
+    dfs: {"sheet_name": DataFrame, ...}
+    streaming=False — прежний путь: pandas + openpyxl, затем перезагрузка книги и стилизация по ячейкам.
+    """
+    path = os.path.join(EXPORTS_DIR, filename)
+    if streaming:
+        _write_excel_streaming(dfs, path)
+        total_rows = sum(len(df) for df in dfs.values())
+        print(f'Created file {os.path.basename(path)}, {len(dfs)} sheets, {total_rows} rows at {path}')
+        return path
 
     # 1) записываем чистые данные
     with pd.ExcelWriter(path, engine="openpyxl") as writer:
@@ -405,7 +789,7 @@ def export_to_excel(dfs: dict, filename: str):
             cell.font = Font(bold=True)
 
         # Авто-ширина колонок (аккуратно, с ограничением)
-        max_width = 40
+        max_width = EXCEL_MAX_WIDTH
         for col_idx in range(1, ws.max_column + 1):
             col_letter = get_column_letter(col_idx)
             max_len = 0
@@ -414,7 +798,7 @@ def export_to_excel(dfs: dict, filename: str):
                 # приблизительная длина
                 if v is None:
                     l = 0
-                elif isinstance(v, (dt.date, dt.datetime)):
+                elif isinstance(v, (date, datetime)):
                     l = len(v.isoformat())
                 else:
                     l = len(str(v))
@@ -446,20 +830,122 @@ def export_to_excel(dfs: dict, filename: str):
     print(f'Created file {os.path.basename(path)}, {len(dfs)} sheets, {total_rows} rows at {path}')
     return path
 
+# ----------------------------
+# Pipeline: запросы в потоках, matplotlib в процессах
+# ----------------------------
+# (запрос, график) в порядке отчёта; PNG пишутся и вывод печатается в этом порядке
+CHARTS = (
+    ("analytics_line", chart_line_monthly_revenue),
+    ("analytics_pie", chart_pie_payment_share),
+    ("analytics_bar", chart_bar_top_categories_revenue),
+    ("analytics_barh_reviews", chart_barh_avg_review_by_category),
+    ("analytics_orders_by_years", chart_hist_order_total_distribution),
+    ("analytics_scatter", chart_scatter_delivery_vs_total),
+)
+INTERACTIVE_QUERY = "analytics_orders_by_state"
+
+
+def _render_worker_init():
+    matplotlib.use("Agg")
+
+
+def _render_chart(chart, df: pd.DataFrame):
+    """
+    Строит график в процессе пула (глобальное состояние pyplot не потокобезопасно).
+    Возвращает (результат chart, [(путь, PNG)], вывод в консоль, секунды) — на диск пишет родитель.
+    """
+    global _png_sink
+    _png_sink = []
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            result = chart(df)
+        return result, _png_sink, out.getvalue(), time.perf_counter() - t0
+    finally:
+        _png_sink = None
+
+
+def _timed_query(name: str):
+    t0 = time.perf_counter()
+    df = run_query(name)
+    return df, time.perf_counter() - t0
+
+
+def run_charts(frames: dict) -> dict:
+    """
+    Выполняет недостающие в frames запросы параллельно и отдаёт каждую выборку на рендеринг сразу по готовности.
+    Возвращает {запрос: DataFrame} (для графиков — результат chart), печатает сводку по стадиям.
+    """
+    timings = {}  # запрос -> {стадия: секунды}
+    results = dict(frames)
+    t_start = time.perf_counter()
+    # spawn: дочерние процессы не наследуют соединения пула и потоки ThreadPoolExecutor
+    with ThreadPoolExecutor(QUERY_WORKERS) as queries, ProcessPoolExecutor(
+        RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=_render_worker_init,
+    ) as renders:
+        charts = dict(CHARTS)
+        rendering = {}
+
+        def submit_render(name, df):
+            if name in charts:
+                rendering[name] = renders.submit(_render_chart, charts[name], df)
+
+        pending = {}
+        for name in (*charts, INTERACTIVE_QUERY):
+            if name in frames:
+                submit_render(name, frames[name])
+            else:
+                pending[queries.submit(_timed_query, name)] = name
+        for future in as_completed(pending):
+            name = pending[future]
+            df, seconds = future.result()
+            timings.setdefault(name, {})["query"] = seconds
+            results[name] = df
+            submit_render(name, df)
+        t_queries = time.perf_counter() - t_start
+
+        for name in charts:
+            result, pngs, output, seconds = rendering[name].result()
+            print(output, end="")
+            t0 = time.perf_counter()
+            for path, data in pngs:
+                with open(path, "wb") as f:
+                    f.write(data)
+                print(f"Saved chart: {path}")
+            timings.setdefault(name, {}).update(render=seconds, write=time.perf_counter() - t0)
+            results[name] = result
+    t_charts = time.perf_counter() - t_start
+
+    print(f"{'stage':<28} {'query':>9} {'render':>9} {'write':>9}")
+    for name in (*dict(CHARTS), INTERACTIVE_QUERY):
+        st = timings.get(name)
+        if st is None:
+            continue
+        cells = [f"{st[s] * 1000:>7.1f}ms" if s in st else f"{'-':>9}" for s in ("query", "render", "write")]
+        print(f"{name:<28} {' '.join(cells)}")
+    print(f"queries done in {t_queries:.2f}s, charts done in {t_charts:.2f}s "
+          f"({QUERY_WORKERS} query threads, {RENDER_WORKERS} render processes)")
+    return results
+
+
 # ----------------------------
 # Main
 # ----------------------------
 def main():
-    # 6 charts
-    df_line = chart_line_monthly_revenue()
-    df_pie = chart_pie_payment_share()
-    df_bar = chart_bar_top_categories_revenue()
-    df_barh = chart_barh_avg_review_by_category()
-    hist = chart_hist_order_total_distribution()
-    df_scatter = chart_scatter_delivery_vs_total()
+    # facts: один проход по базе, выборки графиков — из фактов; иначе каждый график выполняет свой запрос
+    frames = frames_from_facts(load_facts()) if ANALYTICS_MODE == "facts" else {}
+
+    # 6 charts: запросы параллельно, рендеринг — в пуле процессов по мере готовности выборок
+    results = run_charts(frames)
+    df_line = results["analytics_line"]
+    df_pie = results["analytics_pie"]
+    df_bar = results["analytics_bar"]
+    df_barh = results["analytics_barh_reviews"]
+    df_scatter = results["analytics_scatter"]
 
-    # interactive
-    interactive_time_slider() 
+    # interactive (plotly, в основном процессе)
+    interactive_time_slider(results[INTERACTIVE_QUERY])
 
     export_to_excel(
         {
@@ -472,5 +958,10 @@ def main():
         f"olist_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
     )
 
+    for name, st in sql_registry.stats().items():
+        print(f"[sql] {name}: {st['total_ms']:.1f} ms")
+    if RESULT_CACHE is not None:
+        print(f"[cache] {RESULT_CACHE.stats()}")
+
 if __name__ == "__main__":
     main()
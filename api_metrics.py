@@ -0,0 +1,158 @@
+# api_metrics.py — Prometheus-метрики для API (server.py / server_async.py)
+#
+#   olist_api_request_duration_seconds{method,route,status}  — гистограмма латентности запросов
+#   olist_api_requests_in_progress{method,route}             — запросы в работе
+#   olist_db_query_duration_seconds{query}                   — время именованных SQL-запросов
+#   olist_api_serialize_duration_seconds{endpoint}           — сериализация тела ответа
+#   olist_db_pool_checkout_wait_seconds                      — ожидание соединения из пула
+#   olist_db_pool_connections{state="in_use"|"idle"}         — состояние пула (на момент scrape)
+#   olist_api_cache_*                                        — счётчики кэша ответов
+#
+# route — шаблон пути FastAPI ("/orders/by-customer-id/{customer_id}"), а не сырой URL,
+# чтобы не плодить серии на каждый customer_id.
+#
+# При запуске нескольких воркеров (serve.py) задаётся PROMETHEUS_MULTIPROC_DIR: гистограммы и счётчики
+# всех воркеров суммируются через файлы prometheus_client.multiprocess, а снимок пула/кэша
+# (olist_db_pool_*, olist_api_cache_*) — от того воркера, который обслужил scrape.
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.responses import Response
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "olist_api_request_duration_seconds", "API request latency, seconds",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+IN_PROGRESS = Gauge(
+    "olist_api_requests_in_progress", "API requests currently being served",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+DB_QUERY_SECONDS = Histogram(
+    "olist_db_query_duration_seconds", "Duration of named DB queries, seconds",
+    ["query"], buckets=LATENCY_BUCKETS,
+)
+SERIALIZE_SECONDS = Histogram(
+    "olist_api_serialize_duration_seconds", "Response body serialisation time, seconds",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+POOL_WAIT_SECONDS = Histogram(
+    "olist_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection, seconds",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+def observe_db_query(name: str, seconds: float):
+    DB_QUERY_SECONDS.labels(query=name).observe(seconds)
+
+
+@contextmanager
+def db_query(name: str):
+    """with db_query("orders_by_city"): cur.execute(...)"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_db_query(name, time.perf_counter() - t0)
+
+
+class _StatsCollector:
+    """Снимает состояние пула и кэша в момент scrape (без фоновых потоков)."""
+
+    def __init__(self):
+        self.pool_stats: Callable[[], Optional[dict]] = lambda: None
+        self.cache_stats: Optional[Callable[[], dict]] = None
+
+    def collect(self):
+        stats = self.pool_stats()
+        if stats:
+            g = GaugeMetricFamily("olist_db_pool_connections", "Pooled DB connections by state", labels=["state"])
+            g.add_metric(["in_use"], stats["in_use"])
+            g.add_metric(["idle"], stats["idle"])
+            yield g
+            yield GaugeMetricFamily("olist_db_pool_max_connections", "Pool size limit", value=stats["maxconn"])
+            if "timeouts" in stats:
+                yield CounterMetricFamily("olist_db_pool_checkout_timeouts", "Checkouts that timed out",
+                                          value=stats["timeouts"])
+        if self.cache_stats:
+            cs = self.cache_stats()
+            yield GaugeMetricFamily("olist_api_cache_entries", "Entries in the response cache", value=cs["size"])
+            for name in ("hits", "misses", "evictions", "expirations", "invalidations"):
+                yield CounterMetricFamily(f"olist_api_cache_{name}", f"Response cache {name}", value=cs[name])
+
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware: не буферизует ответы, поэтому подходит и для StreamingResponse."""
+
+    def __init__(self, app, routes_app):
+        self.app = app
+        self.routes_app = routes_app
+
+    def _route_template(self, scope) -> str:
+        for route in self.routes_app.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = self._route_template(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = IN_PROGRESS.labels(method=method, route=route)
+        in_progress.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            REQUEST_SECONDS.labels(method=method, route=route, status=str(status["code"])).observe(
+                time.perf_counter() - t0
+            )
+
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_collector)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+_collector = _StatsCollector()
+REGISTRY.register(_collector)
+
+
+def install(app, pool_stats: Callable[[], Optional[dict]], cache_stats: Optional[Callable[[], dict]] = None):
+    """
+    Подключает middleware и GET /metrics к приложению FastAPI. pool_stats/cache_stats
+    опрашиваются при каждом scrape; источник один на процесс — побеждает последний install().
+    """
+    _collector.pool_stats = pool_stats
+    _collector.cache_stats = cache_stats
+    app.add_middleware(MetricsMiddleware, routes_app=app)
+    app.add_api_route("/metrics", metrics_response, methods=["GET"], include_in_schema=False)
+    if MULTIPROCESS:
+        # livesum-гейджи завершившегося воркера не должны попадать в сумму
+        app.router.add_event_handler("shutdown", lambda: multiprocess.mark_process_dead(os.getpid()))
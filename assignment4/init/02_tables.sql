@@ -89,8 +89,31 @@ CREATE TABLE IF NOT EXISTS product_category_name_translation (
   product_category_name_english TEXT
 );
 
+-- 10) прогресс генератора синтетических заказов (order_insert.py): последний день, число заказов, шаг прироста
+CREATE TABLE IF NOT EXISTS generator_checkpoint (
+  generator     TEXT PRIMARY KEY,
+  last_day      DATE NOT NULL,
+  last_count    INTEGER NOT NULL,
+  increment_max INTEGER NOT NULL,
+  updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Нормализация названий городов: нижний регистр, без диакритики и крайних пробелов
+-- ("São Paulo" и "sao paulo" -> "sao paulo"). IMMUTABLE, чтобы по ней можно было строить индекс.
+CREATE OR REPLACE FUNCTION norm_city(city TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$
+  SELECT lower(btrim(translate(city,
+    'ÁÀÂÃÄáàâãäÉÈÊËéèêëÍÌÎÏíìîïÓÒÔÕÖóòôõöÚÙÛÜúùûüÇçÑñ',
+    'AAAAAaaaaaEEEEeeeeIIIIiiiiOOOOOoooooUUUUuuuuCcNn')))
+$$;
+
 -- Индексы и внешние ключи (необязательно, но полезно)
+-- поиск заказов по городу (/orders/by-city): WHERE norm_city(customer_city) = norm_city($1)
+CREATE INDEX IF NOT EXISTS idx_customers_city_norm ON customers(norm_city(customer_city));
 CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders(customer_id);
+-- keyset-пагинация /orders/by-customer-id: (order_purchase_timestamp DESC NULLS LAST, order_id DESC)
+CREATE INDEX IF NOT EXISTS idx_orders_customer_ts_id
+  ON orders(customer_id, order_purchase_timestamp DESC NULLS LAST, order_id DESC);
 CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
 CREATE INDEX IF NOT EXISTS idx_order_items_seller_id ON order_items(seller_id);
 CREATE INDEX IF NOT EXISTS idx_order_payments_order_id ON order_payments(order_id);
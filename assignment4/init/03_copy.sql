@@ -137,7 +137,7 @@ SELECT
   order_purchase_timestamp, order_approved_at,
   order_delivered_carrier_date, order_delivered_customer_date, order_estimated_delivery_date
 FROM orders_stg
-ON CONFLICT (order_id) DO NOTHING;
+ON CONFLICT DO NOTHING;  -- без списка колонок: в секционированном варианте ключ — (order_id, order_purchase_timestamp)
 
 -------------------------------------------------------------------------------
 -- 7) order_items (конфликт по (order_id, order_item_id))
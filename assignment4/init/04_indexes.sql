@@ -0,0 +1,27 @@
+-- 04_indexes.sql
+-- Индексы под фильтры по дате покупки и поиск по префиксу id (синтетика генератора, load_* нагрузочного скрипта).
+-- Выполняется после загрузки данных (03_copy.sql); на живой базе — отдельно, без блокировки записи:
+--   psql -h localhost -U postgres -f assignment4/init/04_indexes.sql
+-- Планы и время до/после: python explain_bench.py --apply assignment4/init/04_indexes.sql
+--
+-- Выражения DATE(ts), DATE_TRUNC('month', ts), EXTRACT(YEAR FROM ts) по TIMESTAMPTZ зависят от TimeZone
+-- сессии (STABLE), поэтому индекс по ним построить нельзя. Фильтры по дню/году в запросах проекта
+-- записаны полуинтервалами по самому столбцу (ts >= начало AND ts < конец) и идут по idx_orders_purchase_ts.
+-- GROUP BY по месяцам/годам читает таблицу целиком — ему индекс не нужен.
+
+SET search_path TO olist, public;
+
+-- диапазоны и MAX по дате покупки: стартовый день генератора, «последние 30 дней / 1 час» в 001_loader,
+-- годы 2016–2018 в analytics.py
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_purchase_ts
+  ON orders(order_purchase_timestamp);
+
+-- LIKE 'prefix%' по индексу при любой collation базы (первичный ключ подходит для LIKE только при "C")
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_id_pattern
+  ON orders(order_id text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_customers_id_pattern
+  ON customers(customer_id text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sellers_id_pattern
+  ON sellers(seller_id text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_id_pattern
+  ON products(product_id text_pattern_ops);
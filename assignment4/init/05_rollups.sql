@@ -0,0 +1,272 @@
+-- 05_rollups.sql
+-- Свёртки для дашбордов (analytics.py, main.py, Superset): помесячные агрегаты вместо пересчёта по сырым строкам.
+--   psql -h localhost -U postgres -f assignment4/init/05_rollups.sql
+--   python olist_rollups.py                       # обновить все свёртки (первый раз — полностью)
+--   python olist_rollups.py --rollup state_orders # только одну
+--
+-- Месяц свёртки — DATE_TRUNC по UTC (date_trunc('month', ts, 'UTC')), не зависит от TimeZone сессии; заказы без
+-- даты покупки в свёртки не попадают. Инкрементальность: statement-триггеры с transition-таблицами на orders /
+-- order_items / order_reviews пишут в rollup_dirty затронутые месяцы (для каждой зависящей свёртки), TRUNCATE —
+-- NULL («всё»). refresh_rollup(name) забирает свои месяцы из очереди (DELETE ... RETURNING видит только
+-- закоммиченные отметки — незакоммиченные останутся до следующего обновления) и пересчитывает только их.
+-- Изменения products / translation / customers не отслеживаются — после них refresh_rollup(name, true).
+-- В секционированном варианте (partitioned/) применять после него: изменения order_items через родителя
+-- отмечаются как обычно (transition-таблицы включают строки дочерних); правки прямо в дочерних — полным обновлением.
+
+SET search_path TO olist, public;
+
+-- одна отметка на (свёртку, месяц): повторные правки того же месяца очередь не раздувают
+CREATE TABLE IF NOT EXISTS rollup_dirty (
+  rollup TEXT NOT NULL,
+  month  TIMESTAMPTZ,         -- NULL — пересчитать всё
+  CONSTRAINT rollup_dirty_uq UNIQUE NULLS NOT DISTINCT (rollup, month)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+  rollup           TEXT PRIMARY KEY,
+  refreshed_at     TIMESTAMPTZ NOT NULL,
+  months_refreshed INTEGER NOT NULL,     -- пересчитано месяцев последним обновлением (NULL-отметка — все)
+  full_refresh     BOOLEAN NOT NULL
+);
+
+-- выручка и число заказов по месяцам (analytics_line, analytics_orders_by_years, report_monthly_orders_revenue)
+CREATE TABLE IF NOT EXISTS rollup_monthly_revenue (
+  month        TIMESTAMPTZ PRIMARY KEY,
+  orders_count INTEGER NOT NULL,   -- все заказы месяца
+  items_count  INTEGER NOT NULL,   -- строк orders ⋈ order_items
+  revenue      NUMERIC NOT NULL    -- SUM(price + freight_value)
+);
+
+-- выручка по категориям (analytics_bar: категория × год)
+CREATE TABLE IF NOT EXISTS rollup_category_revenue (
+  month       TIMESTAMPTZ NOT NULL,
+  category    TEXT,
+  items_count INTEGER NOT NULL,
+  revenue     NUMERIC NOT NULL,    -- SUM(price)
+  CONSTRAINT rollup_category_revenue_uq UNIQUE NULLS NOT DISTINCT (month, category)
+);
+
+-- оценки по категориям (analytics_barh_reviews): как в join reviews ⋈ orders ⋈ items — оценка на каждую позицию
+CREATE TABLE IF NOT EXISTS rollup_category_reviews (
+  month      TIMESTAMPTZ NOT NULL,
+  category   TEXT,
+  review_sum BIGINT NOT NULL,
+  review_n   BIGINT NOT NULL,
+  CONSTRAINT rollup_category_reviews_uq UNIQUE NULLS NOT DISTINCT (month, category)
+);
+
+-- заказы по штатам и месяцам (analytics_orders_by_state)
+CREATE TABLE IF NOT EXISTS rollup_state_orders (
+  month        TIMESTAMPTZ NOT NULL,
+  state        TEXT NOT NULL,
+  orders_count INTEGER NOT NULL,
+  PRIMARY KEY (month, state)
+);
+
+-- заказы указанных месяцев (NULL — все с датой): полуинтервалы по столбцу, идут по idx_orders_purchase_ts
+CREATE OR REPLACE FUNCTION rollup_orders(p_months TIMESTAMPTZ[]) RETURNS SETOF orders
+LANGUAGE sql STABLE AS $$
+  SELECT o.* FROM orders o
+  WHERE p_months IS NULL AND o.order_purchase_timestamp IS NOT NULL
+  UNION ALL
+  SELECT o.* FROM unnest(p_months) m
+  JOIN orders o
+    ON o.order_purchase_timestamp >= m
+   AND o.order_purchase_timestamp < (m AT TIME ZONE 'UTC' + interval '1 month') AT TIME ZONE 'UTC'
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_build_monthly_revenue(p_months TIMESTAMPTZ[]) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM rollup_monthly_revenue WHERE p_months IS NULL OR month = ANY(p_months);
+  INSERT INTO rollup_monthly_revenue(month, orders_count, items_count, revenue)
+  SELECT date_trunc('month', o.order_purchase_timestamp, 'UTC'),
+         COUNT(DISTINCT o.order_id),
+         COUNT(oi.order_id),
+         COALESCE(SUM(oi.price + oi.freight_value), 0)
+  FROM rollup_orders(p_months) o
+  LEFT JOIN order_items oi ON oi.order_id = o.order_id
+  GROUP BY 1;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_build_category_revenue(p_months TIMESTAMPTZ[]) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM rollup_category_revenue WHERE p_months IS NULL OR month = ANY(p_months);
+  INSERT INTO rollup_category_revenue(month, category, items_count, revenue)
+  SELECT date_trunc('month', o.order_purchase_timestamp, 'UTC'),
+         COALESCE(t.product_category_name_english, p.product_category_name),
+         COUNT(*),
+         SUM(oi.price)
+  FROM rollup_orders(p_months) o
+  JOIN order_items oi ON oi.order_id = o.order_id
+  JOIN products p ON p.product_id = oi.product_id
+  LEFT JOIN product_category_name_translation t
+    ON t.product_category_name = p.product_category_name
+  GROUP BY 1, 2;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_build_category_reviews(p_months TIMESTAMPTZ[]) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM rollup_category_reviews WHERE p_months IS NULL OR month = ANY(p_months);
+  INSERT INTO rollup_category_reviews(month, category, review_sum, review_n)
+  SELECT date_trunc('month', o.order_purchase_timestamp, 'UTC'),
+         COALESCE(t.product_category_name_english, p.product_category_name),
+         SUM(orv.review_score),
+         COUNT(*)
+  FROM rollup_orders(p_months) o
+  JOIN order_reviews orv ON orv.order_id = o.order_id
+  JOIN order_items oi ON oi.order_id = o.order_id
+  JOIN products p ON p.product_id = oi.product_id
+  LEFT JOIN product_category_name_translation t
+    ON t.product_category_name = p.product_category_name
+  WHERE orv.review_score IS NOT NULL
+  GROUP BY 1, 2;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_build_state_orders(p_months TIMESTAMPTZ[]) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM rollup_state_orders WHERE p_months IS NULL OR month = ANY(p_months);
+  INSERT INTO rollup_state_orders(month, state, orders_count)
+  SELECT date_trunc('month', o.order_purchase_timestamp, 'UTC'), c.customer_state, COUNT(*)
+  FROM rollup_orders(p_months) o
+  JOIN customers c ON c.customer_id = o.customer_id
+  WHERE c.customer_state IS NOT NULL
+  GROUP BY 1, 2;
+END;
+$$;
+
+-- Обновляет одну свёртку: только месяцы из очереди rollup_dirty, полностью — при p_full, NULL-отметке
+-- (TRUNCATE) или если свёртка ещё ни разу не строилась. Возвращает число пересчитанных месяцев (-1 — всё).
+CREATE OR REPLACE FUNCTION refresh_rollup(p_rollup TEXT, p_full BOOLEAN DEFAULT false) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_months TIMESTAMPTZ[];
+  v_truncated BOOLEAN;
+BEGIN
+  IF p_rollup NOT IN ('monthly_revenue', 'category_revenue', 'category_reviews', 'state_orders') THEN
+    RAISE EXCEPTION 'unknown rollup %', p_rollup;
+  END IF;
+  -- параллельные обновления одной свёртки — по очереди; разных свёрток — независимо
+  PERFORM pg_advisory_xact_lock(hashtext('rollup_' || p_rollup));
+
+  WITH taken AS (
+    DELETE FROM rollup_dirty WHERE rollup = p_rollup RETURNING month
+  )
+  SELECT array_agg(DISTINCT month) FILTER (WHERE month IS NOT NULL), COALESCE(bool_or(month IS NULL), false)
+  INTO v_months, v_truncated
+  FROM taken;
+
+  p_full := p_full OR v_truncated OR NOT EXISTS (SELECT 1 FROM rollup_state WHERE rollup = p_rollup);
+  IF p_full THEN
+    v_months := NULL;
+  ELSIF v_months IS NULL THEN
+    v_months := '{}';
+  END IF;
+
+  IF p_full OR cardinality(v_months) > 0 THEN
+    EXECUTE format('SELECT rollup_build_%s($1)', p_rollup) USING v_months;
+  END IF;
+
+  INSERT INTO rollup_state(rollup, refreshed_at, months_refreshed, full_refresh)
+  VALUES (p_rollup, now(), COALESCE(cardinality(v_months), -1), p_full)
+  ON CONFLICT (rollup) DO UPDATE
+    SET refreshed_at = EXCLUDED.refreshed_at,
+        months_refreshed = EXCLUDED.months_refreshed,
+        full_refresh = EXCLUDED.full_refresh;
+  RETURN COALESCE(cardinality(v_months), -1);
+END;
+$$;
+
+-- Отметка затронутых месяцев; TG_ARGV — свёртки, зависящие от таблицы.
+-- orders: месяц — из самой строки; остальные таблицы — из заказа по order_id.
+-- Уже отмеченный месяц пропускается (ON CONFLICT DO NOTHING); ORDER BY — один порядок вставки ключей
+-- у параллельных транзакций, чтобы ожидания на одном ключе не сцеплялись в deadlock.
+CREATE OR REPLACE FUNCTION rollup_mark_dirty() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO rollup_dirty(rollup, month) SELECT r, NULL FROM unnest(TG_ARGV) r
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+  END IF;
+
+  IF TG_TABLE_NAME = 'orders' THEN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+      INSERT INTO rollup_dirty(rollup, month)
+      SELECT r, m FROM unnest(TG_ARGV) r,
+        (SELECT DISTINCT date_trunc('month', order_purchase_timestamp, 'UTC') AS m
+         FROM new_rows WHERE order_purchase_timestamp IS NOT NULL) x
+      ORDER BY 1, 2
+      ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+      INSERT INTO rollup_dirty(rollup, month)
+      SELECT r, m FROM unnest(TG_ARGV) r,
+        (SELECT DISTINCT date_trunc('month', order_purchase_timestamp, 'UTC') AS m
+         FROM old_rows WHERE order_purchase_timestamp IS NOT NULL) x
+      ORDER BY 1, 2
+      ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO rollup_dirty(rollup, month)
+    SELECT r, m FROM unnest(TG_ARGV) r,
+      (SELECT DISTINCT date_trunc('month', o.order_purchase_timestamp, 'UTC') AS m
+       FROM (SELECT DISTINCT order_id FROM new_rows) n
+       JOIN orders o ON o.order_id = n.order_id
+       WHERE o.order_purchase_timestamp IS NOT NULL) x
+    ORDER BY 1, 2
+    ON CONFLICT DO NOTHING;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO rollup_dirty(rollup, month)
+    SELECT r, m FROM unnest(TG_ARGV) r,
+      (SELECT DISTINCT date_trunc('month', o.order_purchase_timestamp, 'UTC') AS m
+       FROM (SELECT DISTINCT order_id FROM old_rows) d
+       JOIN orders o ON o.order_id = d.order_id
+       WHERE o.order_purchase_timestamp IS NOT NULL) x
+    ORDER BY 1, 2
+    ON CONFLICT DO NOTHING;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+-- триггеры: transition-таблицы допускаются только у триггера на одно событие — по триггеру на событие
+DO $$
+DECLARE
+  deps CONSTANT TEXT[][] := ARRAY[
+    ['orders',        '''monthly_revenue'', ''category_revenue'', ''category_reviews'', ''state_orders'''],
+    ['order_items',   '''monthly_revenue'', ''category_revenue'', ''category_reviews'''],
+    ['order_reviews', '''category_reviews''']
+  ];
+  i INT;
+  tbl TEXT;
+  args TEXT;
+BEGIN
+  FOR i IN 1 .. array_length(deps, 1) LOOP
+    tbl := deps[i][1];
+    args := deps[i][2];
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_rollup_ins', tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_rollup_upd', tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_rollup_del', tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_rollup_trunc', tbl);
+    EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty(%s)', tbl || '_rollup_ins', tbl, args);
+    EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty(%s)', tbl || '_rollup_upd', tbl, args);
+    EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty(%s)', tbl || '_rollup_del', tbl, args);
+    EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty(%s)', tbl || '_rollup_trunc', tbl, args);
+  END LOOP;
+END;
+$$;
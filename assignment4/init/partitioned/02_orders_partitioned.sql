@@ -0,0 +1,307 @@
+-- 02_orders_partitioned.sql
+-- Необязательный вариант схемы: orders секционирована по order_purchase_timestamp (месяц, границы в UTC),
+-- order_items / order_payments разложены по тем же месяцам. Старые данные снимаются целыми месяцами
+-- (DETACH + DROP), без построчных DELETE и раздувания таблиц.
+--
+-- Выполняется один раз на пустой базе, сразу после 01_schema.sql и 02_tables.sql, вместо 04_indexes.sql
+-- (CREATE INDEX CONCURRENTLY на секционированной таблице не поддерживается — те же индексы создаются здесь):
+--   psql -f 01_schema.sql -f 02_tables.sql -f partitioned/02_orders_partitioned.sql -f 03_copy.sql
+--
+-- Устройство:
+-- * order_keys — несекционированный реестр id заказов: order_id PRIMARY KEY + дата покупки. Уникальный ключ
+--   секционированной таблицы обязан включать ключ секционирования, поэтому уникальность order_id держит реестр:
+--   BEFORE INSERT-триггер orders регистрирует id; повтор id с другой датой — unique_violation, повтор той же
+--   строки доходит до orders_uq (ON CONFLICT DO NOTHING пропускает его, как на обычной схеме). FK order_items,
+--   order_payments, order_reviews и самой orders ссылаются на order_keys.
+-- * orders — PARTITION BY RANGE, секции orders_YYYY_MM и orders_default (NULL и даты вне созданных месяцев,
+--   например POST /orders без даты покупки). Вставки пишутся как ON CONFLICT DO NOTHING без списка колонок —
+--   так они работают на обоих вариантах.
+-- * order_items / order_payments — наследование: строки оператора ложатся в родителя, AFTER-триггер на
+--   оператор (transition-таблица) одним INSERT ... SELECT на месяц переносит их в дочернюю таблицу месяца
+--   заказа (order_items_YYYY_MM, *_default; дата — из order_keys по первичному ключу) и очищает родителя.
+--   Дата хранится в колонке _route_ts, а не order_purchase_timestamp: неквалифицированные ссылки
+--   на order_purchase_timestamp в существующих запросах orders ⋈ order_items остаются однозначными.
+--   Декларативно их секционировать нельзя: в строках позиций/платежей нет даты, а триггер не может менять
+--   секцию строки. Все строки одного заказа лежат в одной дочерней таблице, поэтому её первичный ключ
+--   (order_id, order_item_id) уникален и глобально. Колонки, ON CONFLICT (...) и COPY в родителя работают
+--   как раньше; повторы ключа отбрасываются при переносе (DO NOTHING), DO UPDATE в дочерние не доходит.
+-- * дата покупки заказа меняется вместе с реестром, позиции и платежи заказа переезжают в новый месяц.
+
+SET search_path TO olist, public;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM olist.orders) THEN
+    RAISE EXCEPTION 'olist.orders is not empty: the partitioned variant is created on an empty database only';
+  END IF;
+END $$;
+
+DROP TABLE IF EXISTS order_payments, order_items, orders CASCADE;
+
+CREATE TABLE order_keys (
+  order_id                 TEXT PRIMARY KEY,
+  order_purchase_timestamp TIMESTAMPTZ
+);
+CREATE INDEX idx_order_keys_purchase_ts ON order_keys(order_purchase_timestamp);
+
+CREATE TABLE orders (
+  order_id                       TEXT NOT NULL REFERENCES order_keys(order_id),
+  customer_id                    TEXT,
+  order_status                   TEXT,
+  order_purchase_timestamp       TIMESTAMPTZ,
+  order_approved_at              TIMESTAMPTZ,
+  order_delivered_carrier_date   TIMESTAMPTZ,
+  order_delivered_customer_date  TIMESTAMPTZ,
+  order_estimated_delivery_date  TIMESTAMPTZ,
+  CONSTRAINT orders_uq UNIQUE NULLS NOT DISTINCT (order_id, order_purchase_timestamp)
+) PARTITION BY RANGE (order_purchase_timestamp);
+
+CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+
+CREATE TABLE order_items (
+  order_id            TEXT REFERENCES order_keys(order_id),
+  order_item_id       INTEGER,
+  product_id          TEXT,
+  seller_id           TEXT,
+  shipping_limit_date TIMESTAMPTZ,
+  price               NUMERIC(10,2),
+  freight_value       NUMERIC(10,2),
+  _route_ts           TIMESTAMPTZ,  -- дата заказа, заполняется при переносе в дочернюю таблицу
+  PRIMARY KEY (order_id, order_item_id)
+);
+
+CREATE TABLE order_payments (
+  order_id             TEXT REFERENCES order_keys(order_id),
+  payment_sequential   INTEGER,
+  payment_type         TEXT,
+  payment_installments INTEGER,
+  payment_value        NUMERIC(10,2),
+  _route_ts            TIMESTAMPTZ  -- дата заказа, заполняется при переносе в дочернюю таблицу
+);
+
+-- индексы родителей: у orders они наследуются секциями, у order_items / order_payments копируются
+-- в каждую дочернюю таблицу через LIKE ... INCLUDING INDEXES (order_payments_uq нужен 03_copy.sql для ON CONFLICT)
+CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders(customer_id);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_ts_id
+  ON orders(customer_id, order_purchase_timestamp DESC NULLS LAST, order_id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_purchase_ts ON orders(order_purchase_timestamp);
+CREATE INDEX IF NOT EXISTS idx_orders_id_pattern ON orders(order_id text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_seller_id ON order_items(seller_id);
+CREATE INDEX IF NOT EXISTS idx_order_payments_order_id ON order_payments(order_id);
+CREATE UNIQUE INDEX IF NOT EXISTS order_payments_uq ON order_payments(order_id, payment_sequential);
+
+ALTER TABLE orders ADD CONSTRAINT fk_orders_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id);
+ALTER TABLE order_reviews DROP CONSTRAINT IF EXISTS fk_reviews_order;
+ALTER TABLE order_reviews ADD CONSTRAINT fk_reviews_order FOREIGN KEY (order_id) REFERENCES order_keys(order_id);
+
+-- Дочерняя таблица order_items / order_payments (FK наследованием не копируются — добавляются здесь).
+-- Для месяца (lo, hi) — с CHECK по дате, строки этого месяца из *_default переносятся в неё.
+CREATE OR REPLACE FUNCTION create_order_child(parent TEXT, sfx TEXT, lo TIMESTAMPTZ, hi TIMESTAMPTZ)
+RETURNS BOOLEAN LANGUAGE plpgsql AS $$
+DECLARE
+  child TEXT := parent || '_' || sfx;
+BEGIN
+  IF to_regclass('olist.' || child) IS NOT NULL THEN
+    RETURN FALSE;
+  END IF;
+  EXECUTE format(
+    'CREATE TABLE olist.%I (LIKE olist.%I INCLUDING DEFAULTS INCLUDING INDEXES%s) INHERITS (olist.%I)',
+    child, parent,
+    CASE WHEN lo IS NULL THEN ''
+         ELSE format(', CHECK (_route_ts >= %L AND _route_ts < %L)', lo, hi) END,
+    parent);
+  EXECUTE format('ALTER TABLE olist.%I ADD FOREIGN KEY (order_id) REFERENCES olist.order_keys(order_id)', child);
+  IF lo IS NOT NULL THEN
+    EXECUTE format(
+      'WITH moved AS (DELETE FROM ONLY olist.%I WHERE _route_ts >= $1 AND _route_ts < $2
+                      RETURNING *)
+       INSERT INTO olist.%I SELECT * FROM moved',
+      parent || '_default', child) USING lo, hi;
+  END IF;
+  RETURN TRUE;
+END $$;
+
+SELECT create_order_child('order_items', 'default', NULL, NULL);
+SELECT create_order_child('order_payments', 'default', NULL, NULL);
+
+-- Создаёт недостающие месячные секции orders и дочерние таблицы order_items / order_payments
+-- для [from_ts, to_ts). Заказы этих месяцев, попавшие раньше в orders_default, переносятся в новую секцию.
+-- Возвращает число созданных секций orders.
+CREATE OR REPLACE FUNCTION ensure_order_partitions(from_ts TIMESTAMPTZ, to_ts TIMESTAMPTZ)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+  m    TIMESTAMP := date_trunc('month', from_ts AT TIME ZONE 'UTC');
+  lo   TIMESTAMPTZ;
+  hi   TIMESTAMPTZ;
+  sfx  TEXT;
+  made INTEGER := 0;
+BEGIN
+  WHILE m < to_ts AT TIME ZONE 'UTC' LOOP
+    lo  := m AT TIME ZONE 'UTC';
+    hi  := (m + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    sfx := to_char(m, 'YYYY_MM');
+    IF to_regclass('olist.orders_' || sfx) IS NULL THEN
+      EXECUTE format('CREATE TABLE olist.%I (LIKE olist.orders INCLUDING DEFAULTS)', 'orders_' || sfx);
+      -- заказы только переезжают между секциями — реестр и FK на него не трогаем
+      ALTER TABLE olist.orders_default DISABLE TRIGGER orders_unregister_key;
+      EXECUTE format(
+        'WITH moved AS (DELETE FROM olist.orders_default WHERE order_purchase_timestamp >= $1 AND order_purchase_timestamp < $2
+                        RETURNING *)
+         INSERT INTO olist.%I SELECT * FROM moved',
+        'orders_' || sfx) USING lo, hi;
+      ALTER TABLE olist.orders_default ENABLE TRIGGER orders_unregister_key;
+      EXECUTE format('ALTER TABLE olist.orders ATTACH PARTITION olist.%I FOR VALUES FROM (%L) TO (%L)',
+        'orders_' || sfx, lo, hi);
+      made := made + 1;
+    END IF;
+    PERFORM create_order_child('order_items', sfx, lo, hi);
+    PERFORM create_order_child('order_payments', sfx, lo, hi);
+    m := m + INTERVAL '1 month';
+  END LOOP;
+  RETURN made;
+END $$;
+
+-- Снимает месяцы, целиком лежащие раньше before: DROP дочерних order_items / order_payments, отзывов
+-- и записей реестра этих заказов, DETACH + DROP секции orders. С ids_like снимаются только непустые
+-- месяцы, где все order_id подходят под шаблон (так 001_loader.py чистит свои load_order_* и не трогает
+-- данные Olist). Возвращает число снятых месяцев.
+CREATE OR REPLACE FUNCTION retire_order_partitions(before TIMESTAMPTZ, ids_like TEXT DEFAULT NULL)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+  sfx     TEXT;
+  lo      TIMESTAMPTZ;
+  hi      TIMESTAMPTZ;
+  retired INTEGER := 0;
+  only_matching BOOLEAN;
+BEGIN
+  FOR sfx IN
+    SELECT substr(c.relname, length('orders_') + 1)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'olist.orders'::regclass AND c.relname ~ '^orders_\d{4}_\d{2}$'
+    ORDER BY c.relname
+  LOOP
+    lo := to_date(sfx, 'YYYY_MM')::TIMESTAMP AT TIME ZONE 'UTC';
+    hi := (to_date(sfx, 'YYYY_MM')::TIMESTAMP + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    CONTINUE WHEN hi > before;
+    IF ids_like IS NOT NULL THEN
+      EXECUTE format(
+        'SELECT EXISTS (SELECT 1 FROM olist.%1$I) AND NOT EXISTS (SELECT 1 FROM olist.%1$I WHERE order_id NOT LIKE $1)',
+        'orders_' || sfx) INTO only_matching USING ids_like;
+      CONTINUE WHEN NOT only_matching;
+    END IF;
+    EXECUTE format('DROP TABLE IF EXISTS olist.%I, olist.%I', 'order_items_' || sfx, 'order_payments_' || sfx);
+    DELETE FROM olist.order_reviews r
+    USING olist.order_keys k
+    WHERE r.order_id = k.order_id AND k.order_purchase_timestamp >= lo AND k.order_purchase_timestamp < hi;
+    EXECUTE format('ALTER TABLE olist.orders DETACH PARTITION olist.%I', 'orders_' || sfx);
+    EXECUTE format('DROP TABLE olist.%I', 'orders_' || sfx);
+    DELETE FROM olist.order_keys WHERE order_purchase_timestamp >= lo AND order_purchase_timestamp < hi;
+    retired := retired + 1;
+  END LOOP;
+  RETURN retired;
+END $$;
+
+-- Реестр id: BEFORE INSERT / UPDATE на orders (копируется в секции).
+-- При смене даты покупки реестр обновляется до переноса строки orders в другую секцию (перенос — это DELETE
+-- + INSERT, BEFORE INSERT новой секции видит уже новую дату), позиции и платежи заказа переезжают вслед за ним:
+-- AFTER UPDATE при переносе строки между секциями не срабатывает, поэтому всё делается здесь.
+CREATE OR REPLACE FUNCTION register_order_key() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+  registered TIMESTAMPTZ;
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    IF NEW.order_id IS DISTINCT FROM OLD.order_id THEN
+      RAISE EXCEPTION 'order_id of an order cannot be changed (%)', OLD.order_id;
+    END IF;
+    IF NEW.order_purchase_timestamp IS DISTINCT FROM OLD.order_purchase_timestamp THEN
+      UPDATE olist.order_keys SET order_purchase_timestamp = NEW.order_purchase_timestamp
+      WHERE order_id = NEW.order_id;
+      WITH moved AS (
+        DELETE FROM olist.order_items WHERE order_id = NEW.order_id
+        RETURNING order_id, order_item_id, product_id, seller_id, shipping_limit_date, price, freight_value
+      )
+      INSERT INTO olist.order_items (order_id, order_item_id, product_id, seller_id, shipping_limit_date, price, freight_value)
+      SELECT * FROM moved;
+      WITH moved AS (
+        DELETE FROM olist.order_payments WHERE order_id = NEW.order_id
+        RETURNING order_id, payment_sequential, payment_type, payment_installments, payment_value
+      )
+      INSERT INTO olist.order_payments (order_id, payment_sequential, payment_type, payment_installments, payment_value)
+      SELECT * FROM moved;
+    END IF;
+    RETURN NEW;
+  END IF;
+
+  INSERT INTO olist.order_keys (order_id, order_purchase_timestamp)
+  VALUES (NEW.order_id, NEW.order_purchase_timestamp)
+  ON CONFLICT (order_id) DO NOTHING;
+  IF FOUND THEN
+    RETURN NEW;
+  END IF;
+  -- id уже есть; перенос строки при UPDATE тоже приходит сюда — реестр к этому моменту уже обновлён
+  SELECT order_purchase_timestamp INTO registered FROM olist.order_keys WHERE order_id = NEW.order_id;
+  IF registered IS NOT DISTINCT FROM NEW.order_purchase_timestamp THEN
+    RETURN NEW;  -- та же строка: дальше решает orders_uq (ON CONFLICT DO NOTHING или ошибка)
+  END IF;
+  RAISE EXCEPTION 'duplicate key value violates unique constraint "order_keys_pkey"'
+    USING ERRCODE = 'unique_violation', CONSTRAINT = 'order_keys_pkey', TABLE = 'order_keys',
+          DETAIL = format('Key (order_id)=(%s) already exists.', NEW.order_id);
+END $$;
+
+-- AFTER DELETE на orders: удалённый заказ уходит из реестра (позиции, платежи и отзывы держат FK на реестр —
+-- как FK на orders в обычной схеме). Перенос строки в другую секцию тоже даёт AFTER DELETE, но реестр
+-- к этому моменту уже хранит новую дату, и запись остаётся.
+CREATE OR REPLACE FUNCTION unregister_order_key() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM olist.order_keys
+  WHERE order_id = OLD.order_id AND order_purchase_timestamp IS NOT DISTINCT FROM OLD.order_purchase_timestamp;
+  RETURN NULL;
+END $$;
+
+CREATE TRIGGER orders_register_key BEFORE INSERT OR UPDATE ON orders
+  FOR EACH ROW EXECUTE FUNCTION register_order_key();
+CREATE TRIGGER orders_unregister_key AFTER DELETE ON orders
+  FOR EACH ROW EXECUTE FUNCTION unregister_order_key();
+
+-- AFTER INSERT на оператор у родителя order_items / order_payments: строки оператора (new_rows) переносятся
+-- в дочерние таблицы месяца заказа — по INSERT ... SELECT на месяц, — затем родитель очищается. DELETE видит
+-- только строки своей транзакции (чужие незакоммиченные невидимы, закоммиченных в родителе не бывает).
+CREATE OR REPLACE FUNCTION route_order_children() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+  cols   TEXT;
+  sfx    TEXT;
+  target TEXT;
+BEGIN
+  SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO cols
+  FROM pg_attribute
+  WHERE attrelid = TG_RELID AND attnum > 0 AND NOT attisdropped AND attname <> '_route_ts';
+
+  FOR sfx IN
+    SELECT DISTINCT to_char(k.order_purchase_timestamp AT TIME ZONE 'UTC', 'YYYY_MM')
+    FROM new_rows n LEFT JOIN olist.order_keys k ON k.order_id = n.order_id
+  LOOP
+    target := TG_TABLE_NAME || '_' || sfx;
+    IF sfx IS NULL OR to_regclass('olist.' || target) IS NULL THEN
+      target := TG_TABLE_NAME || '_default';
+    END IF;
+    EXECUTE format(
+      'INSERT INTO olist.%1$I (%2$s, _route_ts)
+       SELECT %3$s, k.order_purchase_timestamp
+       FROM new_rows n LEFT JOIN olist.order_keys k ON k.order_id = n.order_id
+       WHERE to_char(k.order_purchase_timestamp AT TIME ZONE ''UTC'', ''YYYY_MM'') IS NOT DISTINCT FROM $1
+       ON CONFLICT DO NOTHING',
+      target, cols, regexp_replace(cols, '([^, ]+)', 'n.\1', 'g')) USING sfx;
+  END LOOP;
+  EXECUTE format('DELETE FROM ONLY olist.%I', TG_TABLE_NAME);
+  RETURN NULL;
+END $$;
+
+CREATE TRIGGER order_items_route AFTER INSERT ON order_items
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION route_order_children();
+CREATE TRIGGER order_payments_route AFTER INSERT ON order_payments
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION route_order_children();
+
+-- месяцы датасета Olist (2016-09..2018-10) и запас вперёд для генератора и нагрузочного скрипта;
+-- дальше секции добавляет 001_loader.py (ensure_order_partitions) или вызов вручную
+SELECT ensure_order_partitions('2016-01-01 00:00+00', date_trunc('month', now()) + INTERVAL '3 months');
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import os
+import sys
 import psycopg2
 import time
 import random
@@ -6,6 +8,81 @@ import threading
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from id_sampler import olist_samplers  # noqa: E402
+
+# Тестовые ключи (load_*) выбираются в памяти, а не ORDER BY random() в подзапросах;
+# новые ключи подтягиваются refresh() по high-water mark.
+LOAD_SAMPLERS = olist_samplers(weighted=False, where={
+    "customers": "customer_id LIKE 'load_cust_%'",
+    "sellers": "seller_id LIKE 'load_seller_%'",
+    "products": "product_id LIKE 'load_prod_%'",
+})
+
+# Запросы с фильтром по дате покупки / префиксу id — вынесены, чтобы explain_bench.py сравнивал их планы
+# до и после assignment4/init/04_indexes.sql (idx_orders_purchase_ts, idx_orders_id_pattern).
+SQL_RECENT_DAILY_ORDERS = """
+        SELECT DATE(order_purchase_timestamp) as order_date, COUNT(*) as daily_orders
+        FROM orders 
+        WHERE order_purchase_timestamp > NOW() - INTERVAL '30 days'
+        GROUP BY order_date 
+        ORDER BY order_date DESC
+        """
+
+SQL_DELIVER_SHIPPED = """
+                UPDATE orders 
+                SET order_status = 'delivered',
+                    order_delivered_customer_date = NOW()
+                WHERE order_status = 'shipped' 
+                AND order_purchase_timestamp < NOW() - INTERVAL '2 days'
+                AND order_id IN (
+                    SELECT order_id FROM orders 
+                    WHERE order_status = 'shipped'
+                    AND order_purchase_timestamp < NOW() - INTERVAL '2 days'
+                    ORDER BY order_purchase_timestamp 
+                    LIMIT 5
+                )
+                """
+
+# '_' в LIKE — любой символ, поэтому экранирован: иначе индексный диапазон сужается только до 'load'
+SQL_CLEANUP_LOAD_ORDERS = r"""
+                DELETE FROM orders 
+                WHERE order_id LIKE 'load\_order\_%' 
+                AND order_purchase_timestamp < NOW() - INTERVAL '1 hour'
+                AND order_id IN (
+                    SELECT order_id FROM orders 
+                    WHERE order_id LIKE 'load\_order\_%'
+                    AND order_purchase_timestamp < NOW() - INTERVAL '1 hour'
+                    ORDER BY order_purchase_timestamp 
+                    LIMIT 15
+                )
+            """
+
+# Секционированный вариант схемы (assignment4/init/partitioned/): load_order_* снимаются целыми месяцами
+# (DETACH + DROP) вместо DELETE по 15 строк; заодно держим секции на LOAD_PARTITIONS_AHEAD вперёд.
+LOAD_RETENTION = os.getenv("LOAD_RETENTION", "1 month")
+LOAD_PARTITIONS_AHEAD = os.getenv("LOAD_PARTITIONS_AHEAD", "3 months")
+
+SQL_ORDERS_PARTITIONED = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('olist.orders'))
+"""
+
+SQL_RETIRE_LOAD_PARTITIONS = r"""
+    SELECT retire_order_partitions(NOW() - %s::interval, 'load\_order\_%%'),
+           ensure_order_partitions(NOW(), NOW() + %s::interval)
+"""
+
+def refresh_load_samplers():
+    conn = create_connection()
+    try:
+        with conn.cursor() as cursor:
+            for name, sampler in LOAD_SAMPLERS.items():
+                added = sampler.refresh(cursor)
+                print(f"🎯 Sampler {name}: {len(sampler)} keys (+{added})")
+        conn.rollback()
+    finally:
+        conn.close()
+
 def create_connection():
     conn = psycopg2.connect(
         host="localhost",
@@ -251,13 +328,7 @@ def read_workload():
         """,
         
         # Фильтрация по дате
-        """
-        SELECT DATE(order_purchase_timestamp) as order_date, COUNT(*) as daily_orders
-        FROM orders 
-        WHERE order_purchase_timestamp > NOW() - INTERVAL '30 days'
-        GROUP BY order_date 
-        ORDER BY order_date DESC
-        """
+        SQL_RECENT_DAILY_ORDERS,
     ]
     
     query_count = 0
@@ -307,7 +378,7 @@ def write_workload():
             for _ in range(batch_size):
                 # Создание нового заказа
                 order_id = f"load_order_{int(time.time())}_{random.randint(1000, 9999)}"
-                customer_id = f"load_cust_{random.randint(0, 499):05d}"
+                customer_id = LOAD_SAMPLERS["customers"].one()
                 
                 # Вставка заказа
                 cursor.execute("""
@@ -315,7 +386,7 @@ def write_workload():
                                       order_purchase_timestamp, order_approved_at,
                                       order_estimated_delivery_date)
                     VALUES (%s, %s, %s, NOW(), NOW(), NOW() + INTERVAL '10 days')
-                    ON CONFLICT (order_id) DO NOTHING
+                    ON CONFLICT DO NOTHING
                 """, (order_id, customer_id, random.choice(['processing', 'approved', 'shipped', 'created'])))
                 operations_in_batch += 1
                 
@@ -329,8 +400,8 @@ def write_workload():
                             ON CONFLICT (order_id, order_item_id) DO NOTHING
                         """, (
                             order_id, item_id, 
-                            f"load_prod_{random.randint(0, 199):05d}",
-                            f"load_seller_{random.randint(0, 99):05d}",
+                            LOAD_SAMPLERS["products"].one(),
+                            LOAD_SAMPLERS["sellers"].one(),
                             round(random.uniform(10, 500), 2),
                             round(random.uniform(5, 50), 2)
                         ))
@@ -388,30 +459,12 @@ def update_workload():
         try:
             # Исправленные запросы без LIMIT в неправильных местах
             update_operations = [
-                """
-                UPDATE orders 
-                SET order_status = 'delivered',
-                    order_delivered_customer_date = NOW()
-                WHERE order_status = 'shipped' 
-                AND order_purchase_timestamp < NOW() - INTERVAL '2 days'
-                AND order_id IN (
-                    SELECT order_id FROM orders 
-                    WHERE order_status = 'shipped'
-                    AND order_purchase_timestamp < NOW() - INTERVAL '2 days'
-                    ORDER BY order_purchase_timestamp 
-                    LIMIT 5
-                )
-                """,
+                SQL_DELIVER_SHIPPED,
                 """
                 UPDATE products 
                 SET product_weight_g = product_weight_g + (random() * 10),
                     product_photos_qty = GREATEST(1, product_photos_qty - 1)
-                WHERE product_id IN (
-                    SELECT product_id FROM products 
-                    WHERE product_id LIKE 'load_prod_%'
-                    ORDER BY random() 
-                    LIMIT 3
-                )
+                WHERE product_id = ANY(%(products)s)
                 """,
                 """
                 UPDATE order_items 
@@ -431,12 +484,7 @@ def update_workload():
                         WHEN customer_city = 'Rio de Janeiro' THEN 'Rio'
                         ELSE customer_city
                     END
-                WHERE customer_id IN (
-                    SELECT customer_id FROM customers 
-                    WHERE customer_id LIKE 'load_cust_%'
-                    ORDER BY random() 
-                    LIMIT 8
-                )
+                WHERE customer_id = ANY(%(customers)s)
                 """,
                 """
                 UPDATE order_payments 
@@ -453,8 +501,12 @@ def update_workload():
             ]
             
             query = random.choice(update_operations)
+            params = {
+                "products": LOAD_SAMPLERS["products"].sample(3),
+                "customers": LOAD_SAMPLERS["customers"].sample(8),
+            }
             start_time = time.time()
-            cursor.execute(query)
+            cursor.execute(query, params)
             affected_rows = cursor.rowcount
             
             # Коммит после каждого UPDATE
@@ -493,6 +545,9 @@ def maintenance_workload():
     """Операции обслуживания - исправлен синтаксис"""
     conn = create_connection()
     cursor = conn.cursor()
+    cursor.execute(SQL_ORDERS_PARTITIONED)
+    partitioned = cursor.fetchone()[0]
+    conn.commit()
     
     maintenance_count = 0
     
@@ -516,25 +571,19 @@ def maintenance_workload():
                 cursor.execute(f"ANALYZE {table}")
                 print(f"🔧 Maintenance: ANALYZE {table} executed")
             
-            # Очистка старых тестовых данных с правильным синтаксисом
-            cursor.execute("""
-                DELETE FROM orders 
-                WHERE order_id LIKE 'load_order_%' 
-                AND order_purchase_timestamp < NOW() - INTERVAL '1 hour'
-                AND order_id IN (
-                    SELECT order_id FROM orders 
-                    WHERE order_id LIKE 'load_order_%'
-                    AND order_purchase_timestamp < NOW() - INTERVAL '1 hour'
-                    ORDER BY order_purchase_timestamp 
-                    LIMIT 15
-                )
-            """)
-            deleted_orders = cursor.rowcount
+            # Очистка старых тестовых данных: месяцами при секционировании, иначе DELETE по 15 строк
+            if partitioned:
+                cursor.execute(SQL_RETIRE_LOAD_PARTITIONS, (LOAD_RETENTION, LOAD_PARTITIONS_AHEAD))
+                retired, created = cursor.fetchone()
+                cleaned = f"retired {retired} month partitions, created {created}"
+            else:
+                cursor.execute(SQL_CLEANUP_LOAD_ORDERS)
+                cleaned = f"Cleaned {cursor.rowcount} old orders"
             
             conn.commit()
             maintenance_count += 1
             
-            print(f"🔧 Maintenance #{maintenance_count}: Cleaned {deleted_orders} old orders")
+            print(f"🔧 Maintenance #{maintenance_count}: {cleaned}")
             
             # Случайный откат (10% chance)
             if random.random() < 0.1:
@@ -569,6 +618,7 @@ def start_load_test():
     generate_customers()
     generate_products()
     generate_sellers()
+    refresh_load_samplers()
     
     # Запуск различных типов нагрузки в отдельных потоках
     with ThreadPoolExecutor(max_workers=12) as executor:  # Увеличено количество workers
@@ -0,0 +1,139 @@
+# batch_ingest.py — пакетная загрузка строк API через COPY -> *_stg -> INSERT ... ON CONFLICT
+#
+# Тот же приём, что и в assignment4/init/03_copy.sql: строки льются во временную staging-таблицу
+# (LIKE <table>, ON COMMIT DROP) через COPY FROM STDIN, затем одним INSERT ... SELECT переносятся
+# в основную таблицу с ON CONFLICT DO NOTHING. Количество пропущенных = получено - вставлено.
+import io
+import json
+from dataclasses import dataclass
+from typing import AsyncIterable, Callable, List, Tuple, Type
+
+from pydantic import BaseModel
+
+# сколько строк копим в буфере перед очередным COPY (память на запрос остаётся ограниченной)
+COPY_CHUNK_ROWS = 5000
+
+
+@dataclass(frozen=True)
+class BatchSpec:
+    table: str
+    model: Type[BaseModel]
+    columns: Tuple[str, ...]
+    conflict: Tuple[str, ...]  # пусто — ON CONFLICT DO NOTHING по любому уникальному ключу
+    to_row: Callable[[BaseModel], tuple]
+
+    @property
+    def staging(self) -> str:
+        return f"{self.table}_stg"
+
+
+class BatchRowError(ValueError):
+    """Строка пакета не прошла разбор/валидацию; line — номер строки (с 1)."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"row {line}: {message}")
+        self.line = line
+
+
+def begin_staging(conn, spec: BatchSpec):
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TEMP TABLE {spec.staging} (LIKE {spec.table} INCLUDING DEFAULTS) ON COMMIT DROP;"
+        )
+
+
+def copy_rows(conn, spec: BatchSpec, buf: io.StringIO):
+    """COPY содержимого CSV-буфера в staging-таблицу."""
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(
+            f"COPY {spec.staging} ({', '.join(spec.columns)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+
+
+def merge_staging(conn, spec: BatchSpec) -> int:
+    """Переносит staging в основную таблицу и коммитит; возвращает число вставленных строк."""
+    cols = ", ".join(spec.columns)
+    target = f"({', '.join(spec.conflict)})" if spec.conflict else ""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {spec.table} ({cols})
+            SELECT {cols} FROM {spec.staging}
+            ON CONFLICT {target} DO NOTHING;
+        """)
+        inserted = cur.rowcount
+    conn.commit()
+    return inserted
+
+
+def copy_chunk(conn, spec: BatchSpec, items: List, first_line: int, decode: bool = False):
+    """
+    Проверяет чанк строк пакета и одним COPY льёт его в staging-таблицу. Блокирующая и CPU-работа
+    (json.loads строк NDJSON при decode, pydantic, CSV, COPY) — вызывать через run_in_threadpool.
+    """
+    buf = io.StringIO()
+    for line, obj in enumerate(items, first_line):
+        if decode:
+            try:
+                obj = json.loads(obj)
+            except ValueError as e:
+                raise BatchRowError(line, f"invalid JSON: {e}")
+        buf.write(",".join(map(_csv_field, validate_row(spec, obj, line))))
+        buf.write("\n")
+    copy_rows(conn, spec, buf)
+
+
+def _csv_field(value) -> str:
+    """
+    Поле CSV для COPY: None — пустое поле без кавычек (COPY читает его как NULL), всё остальное — в кавычках,
+    так что пустая строка сохраняется как '' — как при вставке одной строки через POST.
+    (csv.writer пишет None и "" одинаково, а QUOTE_NONNUMERIC берёт в кавычки и None.)
+    """
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def validate_row(spec: BatchSpec, obj, line: int) -> tuple:
+    if not isinstance(obj, dict):
+        raise BatchRowError(line, "expected a JSON object")
+    try:
+        return spec.to_row(spec.model(**obj))
+    except Exception as e:
+        raise BatchRowError(line, str(e))
+
+
+async def iter_ndjson_lines(chunks: AsyncIterable[bytes]):
+    """Склеивает поток байтовых чанков в строки NDJSON (пустые строки пропускаются)."""
+    tail = b""
+    async for chunk in chunks:
+        tail += chunk
+        *lines, tail = tail.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+async def iter_ndjson_chunks(chunks: AsyncIterable[bytes], size: int = COPY_CHUNK_ROWS):
+    """Строки NDJSON (ещё не разобранные) пачками по size — разбор и проверка идут в copy_chunk."""
+    batch = []
+    async for line in iter_ndjson_lines(chunks):
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_json_array(body: bytes) -> List:
+    try:
+        data = json.loads(body or b"[]")
+    except ValueError as e:
+        raise BatchRowError(0, f"invalid JSON: {e}")
+    if not isinstance(data, list):
+        raise BatchRowError(0, "body must be a JSON array (or NDJSON with Content-Type: application/x-ndjson)")
+    return data
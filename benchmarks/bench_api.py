@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# bench_api.py — сравнение sync (server.py) и async (server_async.py) API: p50/p99 и RPS
+#
+# Пример:
+#   uvicorn server:app --port 8000 &
+#   uvicorn server_async:app --port 8001 &
+#   python benchmarks/bench_api.py --url http://localhost:8000 --url http://localhost:8001 \
+#       --path "/orders/by-customer-id/{customer_id}" --concurrency 64 --duration 20
+#
+# Зависимости — только стандартная библиотека: каждый поток держит своё keep-alive соединение.
+import argparse
+import http.client
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+import psycopg2
+
+DEFAULT_PATHS = [
+    "/orders/by-customer-id/{customer_id}",
+    "/orders/by-city?city={city}",
+]
+
+def load_sample_keys(dsn: str, limit: int = 500):
+    """Берём реальные customer_id/города, чтобы запросы попадали в данные."""
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT customer_id FROM orders ORDER BY random() LIMIT %s;", (limit,))
+            customer_ids = [r[0] for r in cur.fetchall()]
+            cur.execute("SELECT DISTINCT customer_city FROM customers LIMIT %s;", (limit,))
+            cities = [r[0] for r in cur.fetchall()]
+    finally:
+        conn.close()
+    return customer_ids, cities
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return float("nan")
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+def worker(base_url, paths, keys, deadline, latencies, statuses, lock):
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    customer_ids, cities = keys
+    local_lat, local_status = [], Counter()
+    while time.perf_counter() < deadline:
+        path = random.choice(paths).format(
+            customer_id=random.choice(customer_ids) if customer_ids else "x",
+            city=quote(random.choice(cities) if cities else "x"),
+        )
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            resp.read()
+            local_status[resp.status] += 1
+        except Exception:
+            local_status["error"] += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        local_lat.append(time.perf_counter() - t0)
+    conn.close()
+    with lock:
+        latencies.extend(local_lat)
+        statuses.update(local_status)
+
+def run(base_url, paths, keys, concurrency, duration):
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(base_url, paths, keys, deadline, latencies, statuses, lock))
+        for _ in range(concurrency)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "url": base_url,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.fmean(latencies) * 1000) if latencies else float("nan"),
+        "statuses": dict(statuses),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Olist API latency/throughput benchmark")
+    parser.add_argument("--url", action="append", required=True,
+                        help="базовый URL сервиса (можно указать несколько раз)")
+    parser.add_argument("--path", action="append", default=None,
+                        help="шаблон пути; подставляются {customer_id} и {city}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0, help="секунд на каждый URL")
+    parser.add_argument("--warmup", type=float, default=2.0, help="секунд прогрева перед замером")
+    parser.add_argument("--dsn", default="host=localhost port=5432 dbname=postgres user=postgres password=postgres")
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    keys = load_sample_keys(args.dsn)
+
+    results = []
+    for url in args.url:
+        if args.warmup > 0:
+            run(url, paths, keys, args.concurrency, args.warmup)
+        res = run(url, paths, keys, args.concurrency, args.duration)
+        results.append(res)
+        print(f"{res['url']}: {res['requests']} req, {res['rps']:.1f} req/s, "
+              f"p50={res['p50_ms']:.2f} ms, p99={res['p99_ms']:.2f} ms, statuses={res['statuses']}")
+
+    print()
+    print(f"{'url':<32} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    for r in results:
+        print(f"{r['url']:<32} {r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['mean_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
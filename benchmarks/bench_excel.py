@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# bench_excel.py — время export_to_excel: прежний путь (pandas + openpyxl, перезагрузка книги и стилизация
+# по ячейкам) против потоковой write-only записи
+#
+# Пример:
+#   python benchmarks/bench_excel.py --rows 1000000
+#   python benchmarks/bench_excel.py --rows 10000 100000 1000000 --skip-legacy-above 100000
+#
+# Лист синтетический, той же формы, что delivery_vs_total из analytics.py (БД не нужна).
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("ANALYTICS_CACHE_DIR", "")  # бенчмарку кэш результатов не нужен
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import analytics  # noqa: E402
+
+
+def make_sheet(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": [f"{i:032x}" for i in range(n)],
+        "delivery_days": rng.gamma(2.0, 6.0, n).round(6),
+        "order_total": rng.lognormal(4.5, 0.8, n).round(2),
+    })
+
+
+def bench(dfs, streaming):
+    t0 = time.perf_counter()
+    path = analytics.export_to_excel(dfs, f"bench_{'stream' if streaming else 'legacy'}.xlsx", streaming=streaming)
+    return time.perf_counter() - t0, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark export_to_excel: legacy vs streaming")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="не запускать прежний путь для листов больше N строк (он медленный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        analytics.EXPORTS_DIR = tmp
+        print(f"{'rows':>10} {'mode':<10} {'seconds':>9} {'MB':>8}")
+        for n in args.rows:
+            dfs = {"delivery_vs_total": make_sheet(n)}
+            modes = [True]
+            if args.skip_legacy_above is None or n <= args.skip_legacy_above:
+                modes.append(False)
+            for streaming in modes:
+                seconds, size = bench(dfs, streaming)
+                print(f"{n:>10} {'streaming' if streaming else 'legacy':<10} {seconds:>9.2f} {size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# bench_ingest.py — rows/sec: пакетные эндпоинты (/customers:batch, COPY) против построчных POST /customers
+#
+# Пример:
+#   uvicorn server:app --port 8000 &
+#   python benchmarks/bench_ingest.py --url http://localhost:8000 --rows 20000 --batch-size 5000
+#
+# Строки получают префикс bench_<timestamp>_, после замера они удаляются (если не указан --keep).
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import psycopg2
+
+def _conn(url):
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+
+def make_customers(prefix, n, offset=0):
+    return [
+        {
+            "customer_id": f"{prefix}{offset + i:08d}",
+            "customer_zip_code_prefix": (offset + i) % 99999,
+            "customer_city": "sao paulo",
+            "customer_state": "SP",
+        }
+        for i in range(n)
+    ]
+
+def bench_single(url, rows, concurrency):
+    """Построчно: один HTTP-запрос и одна транзакция на строку."""
+    chunks = [rows[i::concurrency] for i in range(concurrency)]
+    errors = []
+
+    def worker(part):
+        conn = _conn(url)
+        for row in part:
+            conn.request("POST", "/customers", body=json.dumps(row),
+                         headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 201:
+                errors.append(resp.status)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in chunks]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, len(errors)
+
+def bench_batch(url, rows, batch_size, ndjson):
+    """Пакетно: NDJSON или JSON-массив по batch_size строк на запрос."""
+    conn = _conn(url)
+    inserted = skipped = 0
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        part = rows[i:i + batch_size]
+        if ndjson:
+            body = "\n".join(json.dumps(r) for r in part)
+            ctype = "application/x-ndjson"
+        else:
+            body = json.dumps(part)
+            ctype = "application/json"
+        conn.request("POST", "/customers:batch", body=body, headers={"Content-Type": ctype})
+        resp = conn.getresponse()
+        data = json.loads(resp.read())
+        if resp.status != 200:
+            raise RuntimeError(f"batch failed: {resp.status} {data}")
+        inserted += data["inserted"]
+        skipped += data["skipped"]
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed, inserted, skipped
+
+def cleanup(dsn, prefix):
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    with conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM customers WHERE customer_id LIKE %s || '%%';", (prefix,))
+        deleted = cur.rowcount
+    conn.close()
+    return deleted
+
+def main():
+    parser = argparse.ArgumentParser(description="Olist API ingestion benchmark (single-row vs batch)")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=20000, help="строк для пакетного режима")
+    parser.add_argument("--single-rows", type=int, default=2000, help="строк для построчного режима")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8, help="потоков в построчном режиме")
+    parser.add_argument("--dsn", default="host=localhost port=5432 dbname=postgres user=postgres password=postgres")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые строки")
+    args = parser.parse_args()
+
+    prefix = f"bench_{int(time.time())}_"
+    results = []
+
+    rows = make_customers(prefix, args.single_rows)
+    elapsed, errors = bench_single(args.url, rows, args.concurrency)
+    results.append(("single-row POST /customers", len(rows), elapsed))
+    if errors:
+        print(f"single-row: {errors} non-201 responses")
+
+    for ndjson in (False, True):
+        rows = make_customers(prefix, args.rows, offset=(1 + int(ndjson)) * 10_000_000)
+        elapsed, inserted, skipped = bench_batch(args.url, rows, args.batch_size, ndjson)
+        label = f"batch {'NDJSON' if ndjson else 'JSON array'} x{args.batch_size}"
+        results.append((label, len(rows), elapsed))
+        print(f"{label}: inserted={inserted} skipped={skipped}")
+
+    # повторная загрузка тех же строк: всё уходит в skipped через ON CONFLICT
+    elapsed, inserted, skipped = bench_batch(args.url, rows, args.batch_size, True)
+    results.append(("batch NDJSON re-run (all conflicts)", len(rows), elapsed))
+    print(f"re-run: inserted={inserted} skipped={skipped}")
+
+    print()
+    print(f"{'mode':<40} {'rows':>8} {'sec':>8} {'rows/s':>10}")
+    for label, n, elapsed in results:
+        print(f"{label:<40} {n:>8} {elapsed:>8.2f} {n / elapsed:>10.0f}")
+
+    if not args.keep:
+        print(f"\ncleanup: deleted {cleanup(args.dsn, prefix)} rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# bench_json.py — время сериализации списка заказов: прежний путь (dict-строки + jsonable_encoder
+# + json.dumps) против fast_json (orjson из кортежей, форматы objects и compact)
+#
+# Пример:
+#   python benchmarks/bench_json.py --rows 1000 10000 100000
+#
+# Строки синтетические, той же формы, что отдаёт /orders/by-* (БД не нужна).
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import fast_json  # noqa: E402
+
+COLUMNS = [
+    "order_id", "customer_id", "order_status", "order_purchase_timestamp",
+    "order_approved_at", "order_delivered_carrier_date", "order_delivered_customer_date",
+    "order_estimated_delivery_date", "customer_city", "customer_state",
+]
+
+def make_rows(n):
+    base = datetime(2017, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(n):
+        ts = base + timedelta(minutes=i)
+        rows.append((
+            f"{i:032x}", f"c{i % 5000}", "delivered", ts,
+            ts + timedelta(hours=1), ts + timedelta(days=2), None if i % 10 == 0 else ts + timedelta(days=7),
+            ts + timedelta(days=14), "são paulo", "SP",
+        ))
+    return rows
+
+def legacy(columns, rows):
+    dicts = [dict(zip(columns, r)) for r in rows]  # так строки отдавал RealDictCursor
+    return json.dumps(
+        jsonable_encoder(dicts), ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON serialisation micro-benchmark for order rows")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    variants = [
+        ("jsonable_encoder+json", lambda c, r: legacy(c, r)),
+        ("orjson objects", lambda c, r: fast_json.encode_rows(c, r, "objects")),
+        ("orjson compact", lambda c, r: fast_json.encode_rows(c, r, "compact")),
+    ]
+    print(f"{'rows':>8}  {'variant':<22} {'ms':>10} {'MB':>8} {'speedup':>8}")
+    for n in args.rows:
+        rows = make_rows(n)
+        baseline = None
+        for name, fn in variants:
+            secs, size = best_of(lambda: fn(COLUMNS, rows), args.repeat)
+            baseline = baseline or secs
+            print(f"{n:>8}  {name:<22} {secs * 1000:>10.1f} {size / 1e6:>8.2f} {baseline / secs:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
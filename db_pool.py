@@ -0,0 +1,241 @@
+# db_pool.py — потокобезопасный пул psycopg2-соединений для sync-API
+#
+# Отличия от psycopg2.pool.SimpleConnectionPool:
+#   * соединение настраивается ОДИН раз при создании (search_path через options + хук on_connect),
+#     поэтому на каждый checkout нет лишнего round trip;
+#   * дешёвая проверка здоровья: статус libpq без запроса, SELECT 1 — только после долгого простоя;
+#   * пересоздание соединений по возрасту (max_lifetime) и простою (max_idle);
+#   * ожидание свободного соединения с таймаутом (PoolTimeout) и статистика времени ожидания.
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    """Не дождались свободного соединения за timeout секунд."""
+
+
+class _PooledConn:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class PgPool:
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = 1,
+        maxconn: int = 10,
+        schema: Optional[str] = None,
+        on_connect: Optional[Callable] = None,
+        timeout: float = 5.0,
+        max_lifetime: float = 3600.0,
+        max_idle: float = 600.0,
+        check_after_idle: float = 30.0,
+        **connect_kwargs,
+    ):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.schema = schema
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after_idle = check_after_idle
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = deque()     # свободные _PooledConn, последний использованный — справа
+        self._used = {}          # id(conn) -> _PooledConn
+        self._pending = 0        # соединения, которые сейчас создаются
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # статистика
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+
+        try:
+            for _ in range(minconn):
+                self._idle.append(self._connect())
+        except Exception:
+            # часть соединений уже открыта — не оставляем их висеть
+            self.closeall()
+            raise
+
+    # ---------- создание / проверка ----------
+    def _connect(self) -> _PooledConn:
+        kwargs = dict(self.connect_kwargs)
+        if self.schema:
+            kwargs["options"] = f"-c search_path={self.schema},public"
+        conn = psycopg2.connect(self.dsn, **kwargs)
+        if self.on_connect:
+            self.on_connect(conn)
+            conn.commit()
+        with self._cond:
+            self._created += 1
+        return _PooledConn(conn)
+
+    def _is_usable(self, pc: _PooledConn, now: float) -> bool:
+        """Проверка вне блокировки (может быть SELECT 1); счётчики отбраковки — под self._cond."""
+        reason = self._unusable_reason(pc, now)
+        if reason is None:
+            return True
+        with self._cond:
+            if reason == "recycled":
+                self._recycled += 1
+            else:
+                self._broken += 1
+        return False
+
+    def _unusable_reason(self, pc: _PooledConn, now: float) -> Optional[str]:
+        conn = pc.conn
+        if conn.closed:
+            return "broken"
+        if now - pc.created_at > self.max_lifetime or now - pc.last_used > self.max_idle:
+            return "recycled"
+        # статус соединения на стороне libpq — без обращения к серверу
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return "broken"
+        if now - pc.last_used > self.check_after_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                return "broken"
+        return None
+
+    @staticmethod
+    def _discard(pc: _PooledConn):
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+
+    # ---------- checkout / return ----------
+    def getconn(self, timeout: Optional[float] = None):
+        timeout = self.timeout if timeout is None else timeout
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("DB pool is closed")
+                if self._idle:
+                    pc = self._idle.pop()
+                    self._used[id(pc.conn)] = pc
+                    break
+                if len(self._used) + self._pending < self.maxconn:
+                    # место под новое соединение резервируем сразу, создаём вне блокировки
+                    pc = None
+                    self._pending += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"no free connection in {timeout:.1f}s (maxconn={self.maxconn})")
+                self._cond.wait(remaining)
+
+        if pc is not None and not self._is_usable(pc, time.monotonic()):
+            self._discard(pc)
+            with self._cond:
+                self._used.pop(id(pc.conn), None)
+                self._pending += 1
+            pc = None
+
+        if pc is None:
+            try:
+                pc = self._connect()
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    if pc is not None:
+                        self._used[id(pc.conn)] = pc
+                    else:
+                        self._cond.notify()
+
+        waited = time.monotonic() - t0
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            if waited > self._wait_max:
+                self._wait_max = waited
+        return pc.conn
+
+    def putconn(self, conn, close: bool = False):
+        with self._cond:
+            pc = self._used.pop(id(conn), None)
+            if pc is None:
+                # не из пула или пул уже закрыт (closeall() забыл выданные соединения) — просто закрываем
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                return
+            if not close and not conn.closed and not self._closed:
+                # незакрытая транзакция не должна утечь к следующему пользователю
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        close = True
+            if close or conn.closed or self._closed:
+                self._discard(pc)
+            else:
+                pc.last_used = time.monotonic()
+                self._idle.append(pc)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            for pc in list(self._used.values()):
+                self._discard(pc)
+            self._used.clear()
+            self._cond.notify_all()
+
+    # ---------- статистика ----------
+    def stats(self) -> dict:
+        with self._cond:
+            in_use = len(self._used) + self._pending
+            idle = len(self._idle)
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "in_use": in_use,
+                "idle": idle,
+                "checkouts": self._checkouts,
+                "wait_avg_ms": (self._wait_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+                "wait_total_ms": self._wait_total * 1000,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "broken": self._broken,
+            }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# explain_bench.py — планы и время запросов с фильтрами по дате покупки и префиксу id до/после миграции индексов
+#
+# Каждый запрос выполняется как EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) --repeat раз (берётся самый быстрый
+# прогон), DML — внутри транзакции с откатом. В JSON-отчёт пишутся время выполнения/планирования,
+# буферы (hit/read) и полный план, так что отчёты разных прогонов можно сравнить.
+#
+#   python explain_bench.py --out plans_before.json
+#   psql -h localhost -U postgres -f assignment4/init/04_indexes.sql
+#   python explain_bench.py --out plans_after.json --compare plans_before.json
+#
+# Или одной командой (before -> миграция -> after -> сравнение):
+#   python explain_bench.py --apply assignment4/init/04_indexes.sql --out plans
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+
+import psycopg2
+
+import analytics  # noqa: F401 — регистрирует запросы analytics_* в sql_registry
+import main as reports  # noqa: F401 — регистрирует запросы report_*
+import order_insert
+import sql_registry
+from explain_checks import DEFAULT_DSN, explain, walk_plan
+
+def _load_loader():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assignment4", "scripts", "001_loader.py")
+    spec = importlib.util.spec_from_file_location("loader_001", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def bench_queries():
+    """(имя, SQL, параметры) — запросы проекта, которые фильтруют/группируют по дате или префиксу id."""
+    loader = _load_loader()
+    prefix = order_insert.ORDER_ID_PREFIX
+    return [
+        ("generator_last_day", order_insert.SQL_LAST_DAY, None),
+        ("generator_last_synthetic_day", order_insert.SQL_LAST_SYNTHETIC_DAY, (prefix,)),
+        ("generator_last_synthetic_day_count", order_insert.SQL_LAST_SYNTHETIC_DAY_COUNT,
+         (prefix, order_insert.FALLBACK_START_DATE, prefix)),
+        ("loader_recent_daily_orders", loader.SQL_RECENT_DAILY_ORDERS, None),
+        ("loader_deliver_shipped", loader.SQL_DELIVER_SHIPPED, None),
+        ("loader_cleanup_load_orders", loader.SQL_CLEANUP_LOAD_ORDERS, None),
+        ("analytics_bar", sql_registry.sql("analytics_bar"), None),
+        ("analytics_orders_by_years", sql_registry.sql("analytics_orders_by_years"), None),
+        ("analytics_line", sql_registry.sql("analytics_line"), None),
+        ("report_monthly_orders_revenue", sql_registry.sql("report_monthly_orders_revenue"), None),
+    ]
+
+def plan_summary(plan):
+    """Время, буферы верхнего узла и список чтений таблиц (тип узла + индекс)."""
+    top = plan[0]["Plan"]
+    scans = [
+        f"{n['Node Type']} on {n['Relation Name']}" + (f" using {n['Index Name']}" if "Index Name" in n else "")
+        for n in walk_plan(top) if "Relation Name" in n
+    ]
+    return {
+        "execution_ms": round(plan[0].get("Execution Time", 0.0), 3),
+        "planning_ms": round(plan[0].get("Planning Time", 0.0), 3),
+        "shared_hit": top.get("Shared Hit Blocks", 0),
+        "shared_read": top.get("Shared Read Blocks", 0),
+        "scans": scans,
+    }
+
+def run_bench(dsn, repeat=3):
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    results = {}
+    try:
+        with conn.cursor() as cur:
+            for name, sql, params in bench_queries():
+                best = None
+                for _ in range(repeat):
+                    plan = explain(cur, sql, params, analyze=True)
+                    conn.rollback()  # EXPLAIN ANALYZE выполняет DML по-настоящему
+                    if best is None or plan[0]["Execution Time"] < best[0]["Execution Time"]:
+                        best = plan
+                results[name] = {**plan_summary(best), "plan": best}
+                print(f"{name:<36} {results[name]['execution_ms']:>10.2f} ms  "
+                      f"{'; '.join(results[name]['scans'])}")
+    finally:
+        conn.close()
+    return results
+
+def apply_migration(dsn, path):
+    """Выполняет SQL-файл по одной команде в autocommit (CREATE INDEX CONCURRENTLY нельзя в транзакции)."""
+    with open(path, encoding="utf-8") as f:
+        text = re.sub(r"--[^\n]*", "", f.read())
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for stmt in filter(None, (s.strip() for s in text.split(";"))):
+                t0 = time.perf_counter()
+                cur.execute(stmt)
+                print(f"[migration] {stmt.splitlines()[0][:70]} ({time.perf_counter() - t0:.2f}s)")
+            cur.execute("ANALYZE olist.orders;")
+    finally:
+        conn.close()
+
+def save(path, label, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"label": label, "taken_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "queries": results},
+                  f, ensure_ascii=False, indent=2, default=str)
+    print(f"Saved: {path}")
+
+def compare(before, after):
+    print(f"\n{'query':<36} {'before ms':>10} {'after ms':>10} {'speedup':>8} {'buffers':>17}")
+    for name, a in after.items():
+        b = before.get(name)
+        if b is None:
+            continue
+        speedup = b["execution_ms"] / a["execution_ms"] if a["execution_ms"] else float("inf")
+        buffers = f"{b['shared_hit'] + b['shared_read']}->{a['shared_hit'] + a['shared_read']}"
+        print(f"{name:<36} {b['execution_ms']:>10.2f} {a['execution_ms']:>10.2f} {speedup:>7.1f}x {buffers:>17}")
+        if b["scans"] != a["scans"]:
+            print(f"    before: {'; '.join(b['scans'])}\n    after:  {'; '.join(a['scans'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN (ANALYZE, BUFFERS) before/after index migration")
+    parser.add_argument("--dsn", default=DEFAULT_DSN)
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов на запрос, берётся самый быстрый")
+    parser.add_argument("--out", default="plans", help="JSON-отчёт (с --apply — префикс: <out>_before/_after.json)")
+    parser.add_argument("--compare", default=None, help="сравнить с ранее сохранённым отчётом")
+    parser.add_argument("--apply", default=None, help="SQL-миграция: прогон до, миграция, прогон после")
+    args = parser.parse_args()
+
+    if args.apply:
+        base = args.out[:-5] if args.out.endswith(".json") else args.out
+        print("=== before ===")
+        before = run_bench(args.dsn, args.repeat)
+        save(f"{base}_before.json", "before", before)
+        apply_migration(args.dsn, args.apply)
+        print("=== after ===")
+        after = run_bench(args.dsn, args.repeat)
+        save(f"{base}_after.json", "after", after)
+        compare(before, after)
+        return
+
+    out = args.out if args.out.endswith(".json") else f"{args.out}.json"
+    results = run_bench(args.dsn, args.repeat)
+    save(out, os.path.splitext(os.path.basename(out))[0], results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f)["queries"], results)
+
+if __name__ == "__main__":
+    main()
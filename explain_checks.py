@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# explain_checks.py — регрессионная проверка планов горячих запросов API через EXPLAIN
+#
+# Для каждой проверки запрос выполняется как EXPLAIN (FORMAT JSON) при SET enable_seqscan = off:
+# если для предиката есть подходящий индекс, планировщик обязан им воспользоваться. Оставшийся
+# Seq Scan по «запрещённой» таблице (или полный Index Scan без Index Cond — тот же seq scan,
+# только по индексу) означает, что индекс потерян или не подходит к выражению.
+# Код возврата 1, если хотя бы одна проверка упала.
+#
+#   python explain_checks.py
+import argparse
+import json
+import sys
+
+import psycopg2
+
+import server  # noqa: F401 — регистрирует запросы API в sql_registry
+import sql_registry
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=postgres user=postgres password=postgres"
+
+# (имя проверки, запрос из каталога sql_registry, параметры, таблицы, которые нельзя читать полным сканированием)
+CHECKS = [
+    ("orders_by_city", "orders_by_city", ("São Paulo",), {"customers", "orders"}),
+    ("orders_by_city_folded", "orders_by_city", ("SAO PAULO",), {"customers", "orders"}),
+    ("orders_by_city_page", "orders_by_city_page_first", ("São Paulo", 100), {"customers", "orders"}),
+    ("orders_by_customer_id", "orders_by_customer_id", ("c1",), {"customers", "orders"}),
+    ("orders_by_customer_id_page", "orders_by_customer_id_page_first", ("c1", 100), {"customers", "orders"}),
+]
+
+def walk_plan(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk_plan(child)
+
+def is_full_scan(node):
+    if node["Node Type"] == "Seq Scan":
+        return True
+    return node["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" not in node
+
+def seq_scans(plan_json, tables):
+    return sorted({
+        f"{n['Relation Name']} ({n['Node Type']})"
+        for n in walk_plan(plan_json[0]["Plan"])
+        if n.get("Relation Name") in tables and is_full_scan(n)
+    })
+
+def explain(cur, sql, params, analyze=False):
+    opts = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({opts}) {sql.rstrip().rstrip(';')}", params)
+    plan = cur.fetchone()[0]
+    return plan if isinstance(plan, list) else json.loads(plan)
+
+def run_checks(dsn, verbose=False):
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    failed = 0
+    try:
+        with conn.cursor() as cur:
+            for name, query, params, forbidden in CHECKS:
+                sql = sql_registry.sql(query)
+                cur.execute("SET enable_seqscan = off;")
+                bad = seq_scans(explain(cur, sql, params), forbidden)
+                cur.execute("RESET enable_seqscan;")
+                status = "FAIL" if bad else "ok"
+                print(f"[{status}] {name}" + (f": full scan on {', '.join(bad)}" if bad else ""))
+                if verbose or bad:
+                    # для наглядности — фактический план с настройками по умолчанию
+                    plan = explain(cur, sql, params, analyze=True)
+                    top = plan[0]["Plan"]
+                    print(f"       default plan: {top['Node Type']}, "
+                          f"time={plan[0].get('Execution Time', 0):.2f} ms")
+                    for n in walk_plan(top):
+                        if "Relation Name" in n:
+                            print(f"         {n['Node Type']} on {n['Relation Name']}"
+                                  + (f" using {n['Index Name']}" if "Index Name" in n else ""))
+                failed += bool(bad)
+        conn.rollback()
+    finally:
+        conn.close()
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN-based plan regression checks")
+    parser.add_argument("--dsn", default=DEFAULT_DSN)
+    parser.add_argument("-v", "--verbose", action="store_true", help="печатать планы и для успешных проверок")
+    args = parser.parse_args()
+    failed = run_checks(args.dsn, args.verbose)
+    if failed:
+        print(f"{failed} plan check(s) failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# fast_json.py — быстрая сериализация строк БД в JSON (orjson) прямо из кортежей курсора
+#
+# Стандартный путь FastAPI: RealDictCursor -> list[dict] -> jsonable_encoder (обход каждого поля
+# в Python) -> json.dumps. Здесь строки берутся обычным (tuple) курсором и кодируются orjson,
+# который сам сериализует datetime/date/UUID в C.
+#
+# Форматы:
+#   "objects" — [{"col": value, ...}, ...] — та же форма, что и раньше;
+#   "compact" — {"columns": [...], "rows": [[...], ...]} — без промежуточных dict вообще.
+from decimal import Decimal
+from typing import Optional, Sequence
+
+import orjson
+
+FORMATS = ("objects", "compact")
+
+
+def _default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, memoryview):
+        return v.tobytes().decode()
+    raise TypeError(f"Type is not JSON serializable: {type(v).__name__}")
+
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=_default)
+
+
+def _objects(columns: Sequence[str], rows):
+    cols = tuple(columns)
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def encode_rows(columns: Sequence[str], rows, fmt: str = "objects") -> bytes:
+    if fmt == "compact":
+        return orjson.dumps({"columns": list(columns), "rows": rows}, default=_default)
+    return orjson.dumps(_objects(columns, rows), default=_default)
+
+
+def encode_page(columns: Sequence[str], rows, next_token: Optional[str], fmt: str = "objects") -> bytes:
+    if fmt == "compact":
+        return orjson.dumps({"columns": list(columns), "rows": rows, "next": next_token}, default=_default)
+    return orjson.dumps({"items": _objects(columns, rows), "next": next_token}, default=_default)
+
+
+def encode_ndjson(columns: Sequence[str], rows) -> bytes:
+    cols = tuple(columns)
+    return b"".join(orjson.dumps(dict(zip(cols, r)), default=_default) + b"\n" for r in rows)
@@ -0,0 +1,118 @@
+# id_sampler.py — локальная выборка случайных customer_id / seller_id / product_id для генераторов
+#
+# Вместо SELECT ... ORDER BY RANDOM() LIMIT 1 на каждую строку (полное сканирование и сортировка таблицы)
+# ключи загружаются один раз в компактный массив NumPy (байтовые строки фиксированной длины),
+# а выборка — равномерная или взвешенная — делается в памяти.
+#
+# Веса (weighted=True) пропорциональны числу исторических заказов (+1, чтобы ключи без заказов тоже
+# выпадали), так что синтетика сохраняет реальный перекос «популярных» клиентов/товаров/продавцов.
+#
+# refresh() подтягивает новые ключи инкрементально: ключи больше high-water mark (максимального
+# уже загруженного ключа). Для монотонных id (load_cust_00042, синтетика) этого достаточно; если
+# COUNT(*) расходится с локальным числом ключей (новые ключи «внутри» диапазона, например md5-id
+# из CSV, или удаления), выполняется полная перезагрузка.
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_rng = np.random.default_rng()
+
+# (таблица, ключ, SQL весов: key -> число заказов)
+OLIST_KEYS = {
+    "customers": ("customers", "customer_id",
+                  "SELECT customer_id, COUNT(*) FROM orders GROUP BY customer_id"),
+    "sellers": ("sellers", "seller_id",
+                "SELECT seller_id, COUNT(*) FROM order_items GROUP BY seller_id"),
+    "products": ("products", "product_id",
+                 "SELECT product_id, COUNT(*) FROM order_items GROUP BY product_id"),
+}
+
+
+class IdSampler:
+    def __init__(self, table: str, key: str, weights_sql: Optional[str] = None, where: Optional[str] = None):
+        self.table = table
+        self.key = key
+        self.weights_sql = weights_sql
+        self.where = where
+        self._keys = np.empty(0, dtype="S1")
+        self._cum = None           # накопленные веса (None — равномерная выборка)
+        self._hwm: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def high_water_mark(self) -> Optional[str]:
+        return self._hwm
+
+    def _filter(self, extra: str = "") -> str:
+        # запросы всегда выполняются с параметрами, поэтому % из where экранируется
+        conds = [c for c in ((self.where or "").replace("%", "%%"), extra) if c]
+        return f" WHERE {' AND '.join(conds)}" if conds else ""
+
+    def load(self, cur) -> int:
+        """Полная загрузка ключей (и весов); возвращает число ключей."""
+        cur.execute(f"SELECT {self.key} FROM {self.table}{self._filter()} ORDER BY {self.key};", ())
+        keys = [r[0] for r in cur.fetchall()]
+        weights = None
+        if self.weights_sql:
+            cur.execute(self.weights_sql)
+            counts = dict(cur.fetchall())
+            weights = np.fromiter((counts.get(k, 0) + 1 for k in keys), dtype=np.float64, count=len(keys))
+        self._set(keys, weights)
+        return len(keys)
+
+    def refresh(self, cur) -> int:
+        """Добирает ключи выше high-water mark; при расхождении счётчиков — полная перезагрузка."""
+        if self._hwm is None:
+            return self.load(cur)
+        cur.execute(f"SELECT {self.key} FROM {self.table}{self._filter(f'{self.key} > %s')} ORDER BY {self.key};",
+                    (self._hwm,))
+        new_keys = [r[0] for r in cur.fetchall()]
+        cur.execute(f"SELECT COUNT(*) FROM {self.table}{self._filter()};", ())
+        total = cur.fetchone()[0]
+        if total != len(self._keys) + len(new_keys):
+            before = len(self._keys)
+            return self.load(cur) - before
+        if new_keys:
+            old = [k.decode() for k in self._keys]
+            weights = None
+            if self._cum is not None:
+                old_w = np.diff(self._cum, prepend=0.0)
+                weights = np.concatenate([old_w, np.ones(len(new_keys))])
+            self._set(old + new_keys, weights)
+        return len(new_keys)
+
+    def _set(self, keys: List[str], weights: Optional[np.ndarray]):
+        width = max((len(k.encode()) for k in keys), default=1)
+        arr = np.array([k.encode() for k in keys], dtype=f"S{width}")
+        cum = np.cumsum(weights) if weights is not None and len(keys) else None
+        with self._lock:
+            self._keys, self._cum = arr, cum
+            self._hwm = keys[-1] if keys else self._hwm
+
+    def sample(self, n: int, rng: Optional[np.random.Generator] = None) -> List[str]:
+        rng = rng or _rng
+        with self._lock:
+            keys, cum = self._keys, self._cum
+        if not len(keys):
+            raise LookupError(f"no keys loaded for {self.table}.{self.key}")
+        if cum is None:
+            idx = rng.integers(0, len(keys), n)
+        else:
+            idx = np.searchsorted(cum, rng.random(n) * cum[-1], side="right")
+        return [k.decode() for k in keys[idx]]
+
+    def one(self, rng: Optional[np.random.Generator] = None) -> str:
+        return self.sample(1, rng)[0]
+
+
+def olist_samplers(weighted: bool = True, where: Optional[Dict[str, str]] = None) -> Dict[str, IdSampler]:
+    """Сэмплеры для customers/sellers/products; where — необязательный фильтр по имени таблицы."""
+    where = where or {}
+    return {
+        name: IdSampler(table, key, weights_sql if weighted else None, where.get(name))
+        for name, (table, key, weights_sql) in OLIST_KEYS.items()
+    }
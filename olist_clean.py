@@ -0,0 +1,172 @@
+# olist_clean.py — потоковая очистка CSV Olist перед COPY (используется olist_loader.py)
+#
+# Файл читается чанками по CHUNK_ROWS строк; каждая строка приводится к виду, в котором её сохранит Postgres:
+# города — norm_city() (нижний регистр, без диакритики, как SQL-функция в 02_tables.sql), штаты — верхний
+# регистр, числа — округление до масштаба NUMERIC колонки, даты/целые проверяются разбором. Строки с
+# неразбираемыми значениями отбрасываются (rejected), точные дубли (после нормализации) — по 64-битному
+# отпечатку строки в множестве ограниченного размера. Когда множество заполнено, оно сбрасывается: оставшиеся
+# дубли досчитает ON CONFLICT на стороне базы. Очищенные чанки сериализуются в CSV и отдаются COPY FROM STDIN
+# через CsvStream — без временных файлов.
+import csv
+import io
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from hashlib import blake2b
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from text_norm import norm_city
+
+CHUNK_ROWS = int(os.getenv("CLEAN_CHUNK_ROWS", "20000"))
+DEDUP_LIMIT = int(os.getenv("CLEAN_DEDUP_LIMIT", "1000000"))  # отпечатков в памяти (~60 байт на отпечаток)
+MAX_REJECT_SAMPLES = 5
+
+
+def _numeric(scale: int) -> Callable[[str], str]:
+    quantum = Decimal(1).scaleb(-scale)
+
+    def parse(value: str) -> str:
+        # ROUND_HALF_UP = округление NUMERIC в Postgres (половина — от нуля)
+        return str(Decimal(value).quantize(quantum, rounding=ROUND_HALF_UP))
+    return parse
+
+
+def _integer(value: str) -> str:
+    return str(int(value))
+
+
+def _timestamp(value: str) -> str:
+    datetime.fromisoformat(value)
+    return value
+
+
+def _state(value: str) -> str:
+    return value.strip().upper()
+
+
+# нормализация/проверка по имени колонки (имена в датасете Olist уникальны между таблицами);
+# колонки, которых здесь нет, — текст без изменений
+COLUMN_KINDS: Dict[str, Callable[[str], str]] = {
+    **dict.fromkeys(("customer_city", "seller_city", "geolocation_city"), norm_city),
+    **dict.fromkeys(("customer_state", "seller_state", "geolocation_state"), _state),
+    **dict.fromkeys((
+        "customer_zip_code_prefix", "seller_zip_code_prefix", "geolocation_zip_code_prefix",
+        "order_item_id", "payment_sequential", "payment_installments", "review_score",
+        "product_name_lenght", "product_description_lenght", "product_photos_qty",
+        "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm",
+    ), _integer),
+    **dict.fromkeys(("geolocation_lat", "geolocation_lng"), _numeric(6)),
+    **dict.fromkeys(("price", "freight_value", "payment_value"), _numeric(2)),
+    **dict.fromkeys((
+        "order_purchase_timestamp", "order_approved_at", "order_delivered_carrier_date",
+        "order_delivered_customer_date", "order_estimated_delivery_date", "shipping_limit_date",
+        "review_creation_date", "review_answer_timestamp",
+    ), _timestamp),
+}
+
+
+@dataclass
+class CleanStats:
+    read: int = 0
+    written: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    dedup_resets: int = 0
+    reject_samples: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (f"read {self.read}, written {self.written}, duplicates {self.duplicates}, "
+                f"rejected {self.rejected}" + (f", dedup resets {self.dedup_resets}" if self.dedup_resets else ""))
+
+
+def iter_chunks(path: str, columns: Sequence[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[List[List[str]]]:
+    """Строки CSV чанками, колонки переставлены в порядок columns (по заголовку файла)."""
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"{os.path.basename(path)}: no columns {', '.join(missing)} in header")
+        positions = [header.index(c) for c in columns]
+        chunk = []
+        for row in reader:
+            chunk.append([row[i] if i < len(row) else "" for i in positions])
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class RowCleaner:
+    """Нормализует, проверяет и дедуплицирует строки одной таблицы; статистика — в stats."""
+
+    def __init__(self, columns: Sequence[str], dedup_limit: int = DEDUP_LIMIT):
+        self.parsers = [COLUMN_KINDS.get(c) for c in columns]
+        self.columns = tuple(columns)
+        self.dedup_limit = dedup_limit
+        self.seen = set()
+        self.stats = CleanStats()
+
+    def clean(self, chunk: Iterable[List[str]]) -> List[List[str]]:
+        out = []
+        stats = self.stats
+        for row in chunk:
+            stats.read += 1
+            try:
+                # пустое значение — NULL, его не нормализуем
+                row = [p(v) if p is not None and v != "" else v for p, v in zip(self.parsers, row)]
+            except (ValueError, InvalidOperation) as e:
+                stats.rejected += 1
+                if len(stats.reject_samples) < MAX_REJECT_SAMPLES:
+                    stats.reject_samples.append(f"row {stats.read}: {e}")
+                continue
+            key = int.from_bytes(blake2b("\x1f".join(row).encode(), digest_size=8).digest(), "little")
+            if key in self.seen:
+                stats.duplicates += 1
+                continue
+            if len(self.seen) >= self.dedup_limit:
+                self.seen.clear()
+                stats.dedup_resets += 1
+            self.seen.add(key)
+            out.append(row)
+        stats.written += len(out)
+        return out
+
+    @property
+    def exact(self) -> bool:
+        """True — все дубли отброшены здесь (множество ни разу не сбрасывалось)."""
+        return not self.stats.dedup_resets
+
+
+def encode_csv(rows: Iterable[Sequence[str]]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+class CsvStream(io.TextIOBase):
+    """Файлоподобный поток для copy_expert: read() отдаёт CSV очередных чанков по мере чтения."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._buf = ""
+        self._pos = 0  # позиция в текущем чанке: без копирования остатка на каждый read(8192)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            data = self._buf[self._pos:] + "".join(self._chunks)
+            self._buf, self._pos = "", 0
+            return data
+        while self._pos >= len(self._buf):
+            piece = next(self._chunks, None)
+            if piece is None:
+                return ""
+            self._buf, self._pos = piece, 0
+        data = self._buf[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# olist_loader.py — параллельная, возобновляемая загрузка CSV Olist (замена монолитного assignment4/init/03_copy.sql)
+#
+# Каждая таблица грузится в своей транзакции и на своём соединении тем же приёмом, что и 03_copy.sql:
+# COPY FROM STDIN -> временная *_stg -> INSERT ... SELECT ... ON CONFLICT DO NOTHING. Таблицы без
+# зависимостей (geolocation, customers, sellers, products, translation) идут одновременно; orders ждёт
+# customers, order_items — orders/products/sellers, order_payments и order_reviews — orders (порядок FK).
+#
+# В той же транзакции, что и данные, пишется строка в load_checkpoint: при повторном запуске готовые
+# таблицы пропускаются, упавшая таблица откатывается целиком и не мешает независимым. Неуникальные индексы
+# пустой таблицы снимаются перед загрузкой и создаются заново после всех таблиц (определения хранятся в
+# load_deferred_index, так что прерванный запуск их не теряет). Уникальные индексы остаются — по ним работает
+# ON CONFLICT.
+#
+# CSV по пути в базу проходит olist_clean.py: нормализация городов/штатов, проверка типов, отбрасывание точных
+# дублей — прямо в поток COPY FROM STDIN. --raw отключает очистку (файл копируется как есть, как в 03_copy.sql).
+#
+#   python olist_loader.py --data-dir data --jobs 4
+#   python olist_loader.py --force orders --force order_items   # перезалить выбранные таблицы
+#   python olist_loader.py --delta                               # ежедневное обновление: только изменения
+#
+# Каждая загрузка запоминает отпечаток файла (размер, mtime) и blake2b каждого чанка из CHUNK_ROWS строк
+# (load_file_fingerprint / load_chunk_fingerprint). В режиме --delta файл с прежними размером и mtime не читается,
+# а из остальных в COPY идут только чанки с новым отпечатком; строки с существующим ключом обновляются
+# (ON CONFLICT DO UPDATE, только если что-то изменилось). Строки, удалённые из CSV, в базе остаются. Вставка
+# в середину файла сдвигает границы всех следующих чанков — для дописываемых в конец выгрузок это не важно.
+import argparse
+import os
+import sys
+import time
+from hashlib import blake2b
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import olist_clean
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=postgres user=postgres password=postgres"
+DEFAULT_DATA_DIR = os.getenv("OLIST_DATA_DIR", "data")
+
+
+@dataclass(frozen=True)
+class TableLoad:
+    table: str
+    csv: str
+    columns: Tuple[str, ...]
+    conflict: Tuple[str, ...]          # пусто — ON CONFLICT DO NOTHING по любому уникальному ключу
+    depends: Tuple[str, ...] = ()
+    distinct: bool = False             # в CSV есть полные дубли строк (geolocation)
+
+    @property
+    def staging(self) -> str:
+        return f"{self.table}_stg"
+
+
+TABLES = (
+    TableLoad("customers", "olist_customers_dataset.csv",
+              ("customer_id", "customer_unique_id", "customer_zip_code_prefix", "customer_city", "customer_state"),
+              ("customer_id",)),
+    TableLoad("geolocation", "olist_geolocation_dataset.csv",
+              ("geolocation_zip_code_prefix", "geolocation_lat", "geolocation_lng",
+               "geolocation_city", "geolocation_state"),
+              ("geolocation_zip_code_prefix", "geolocation_lat", "geolocation_lng",
+               "geolocation_city", "geolocation_state"),
+              distinct=True),
+    TableLoad("product_category_name_translation", "product_category_name_translation.csv",
+              ("product_category_name", "product_category_name_english"),
+              ("product_category_name",)),
+    TableLoad("products", "olist_products_dataset.csv",
+              ("product_id", "product_category_name", "product_name_lenght", "product_description_lenght",
+               "product_photos_qty", "product_weight_g", "product_length_cm", "product_height_cm",
+               "product_width_cm"),
+              ("product_id",)),
+    TableLoad("sellers", "olist_sellers_dataset.csv",
+              ("seller_id", "seller_zip_code_prefix", "seller_city", "seller_state"),
+              ("seller_id",)),
+    # без списка колонок: в секционированном варианте ключ orders — (order_id, order_purchase_timestamp)
+    TableLoad("orders", "olist_orders_dataset.csv",
+              ("order_id", "customer_id", "order_status", "order_purchase_timestamp", "order_approved_at",
+               "order_delivered_carrier_date", "order_delivered_customer_date", "order_estimated_delivery_date"),
+              (), depends=("customers",)),
+    TableLoad("order_items", "olist_order_items_dataset.csv",
+              ("order_id", "order_item_id", "product_id", "seller_id", "shipping_limit_date", "price",
+               "freight_value"),
+              ("order_id", "order_item_id"), depends=("orders", "products", "sellers")),
+    TableLoad("order_payments", "olist_order_payments_dataset.csv",
+              ("order_id", "payment_sequential", "payment_type", "payment_installments", "payment_value"),
+              ("order_id", "payment_sequential"), depends=("orders",)),
+    TableLoad("order_reviews", "olist_order_reviews_dataset.csv",
+              ("review_id", "order_id", "review_score", "review_comment_title", "review_comment_message",
+               "review_creation_date", "review_answer_timestamp"),
+              ("review_id",), depends=("orders",)),
+)
+
+# Уникальные индексы под ON CONFLICT (как в 03_copy.sql) — нужны до загрузки
+SQL_SETUP = """
+    CREATE TABLE IF NOT EXISTS load_checkpoint (
+        table_name    text PRIMARY KEY,
+        rows_copied   bigint NOT NULL,
+        rows_inserted bigint NOT NULL,
+        seconds       double precision NOT NULL,
+        finished_at   timestamptz NOT NULL DEFAULT now()
+    );
+    ALTER TABLE load_checkpoint ADD COLUMN IF NOT EXISTS rows_rejected bigint NOT NULL DEFAULT 0;
+    CREATE TABLE IF NOT EXISTS load_file_fingerprint (
+        table_name text PRIMARY KEY,
+        size       bigint NOT NULL,
+        mtime_ns   bigint NOT NULL,
+        chunk_rows integer NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS load_chunk_fingerprint (
+        table_name text,
+        chunk_no   integer,
+        rows       integer NOT NULL,
+        digest     bytea NOT NULL,
+        PRIMARY KEY (table_name, chunk_no)
+    );
+    CREATE TABLE IF NOT EXISTS load_deferred_index (
+        index_name text PRIMARY KEY,
+        table_name text NOT NULL,
+        indexdef   text NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS geolocation_uq
+      ON geolocation(geolocation_zip_code_prefix, geolocation_lat, geolocation_lng, geolocation_city, geolocation_state);
+    CREATE UNIQUE INDEX IF NOT EXISTS product_category_name_translation_uq
+      ON product_category_name_translation(product_category_name);
+    CREATE UNIQUE INDEX IF NOT EXISTS order_payments_uq
+      ON order_payments(order_id, payment_sequential);
+"""
+
+# неуникальные индексы, не обслуживающие ограничения, — их дешевле построить один раз по готовым данным
+SQL_SECONDARY_INDEXES = """
+    SELECT ci.relname, pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_class ci ON ci.oid = i.indexrelid
+    WHERE i.indrelid = %s::regclass
+      AND NOT i.indisunique
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+"""
+
+# уникальные индексы по простым колонкам (без выражений и WHERE), от самого короткого
+SQL_UNIQUE_KEYS = """
+    SELECT array_agg(a.attname::text ORDER BY k.ord)
+    FROM pg_index i
+    CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+    WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indpred IS NULL AND i.indexprs IS NULL
+    GROUP BY i.indexrelid
+    ORDER BY count(*), i.indexrelid
+"""
+
+
+def connect(dsn: str):
+    return psycopg2.connect(dsn, options="-c search_path=olist,public")
+
+
+def finished_tables(cur) -> Dict[str, tuple]:
+    cur.execute("SELECT table_name, rows_copied, rows_inserted, seconds FROM load_checkpoint;")
+    return {name: rest for name, *rest in cur.fetchall()}
+
+
+def defer_indexes(cur, table: str) -> int:
+    """Снимает неуникальные индексы пустой таблицы, сохраняя определения в load_deferred_index."""
+    cur.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table});")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute(SQL_SECONDARY_INDEXES, (table,))
+    indexes = cur.fetchall()
+    for name, indexdef in indexes:
+        cur.execute("""
+            INSERT INTO load_deferred_index (index_name, table_name, indexdef) VALUES (%s, %s, %s)
+            ON CONFLICT (index_name) DO NOTHING
+        """, (name, table, indexdef))
+        cur.execute(f'DROP INDEX "{name}";')
+    return len(indexes)
+
+
+def chunk_digest(chunk) -> bytes:
+    h = blake2b(digest_size=16)
+    for row in chunk:
+        h.update("\x1f".join(row).encode())
+        h.update(b"\n")
+    return h.digest()
+
+
+def stored_fingerprints(cur, table: str):
+    """((size, mtime_ns, chunk_rows) файла или None, {chunk_no: (rows, digest)}) с прошлой загрузки."""
+    cur.execute("SELECT size, mtime_ns, chunk_rows FROM load_file_fingerprint WHERE table_name = %s;", (table,))
+    file_fp = cur.fetchone()
+    cur.execute("SELECT chunk_no, rows, digest FROM load_chunk_fingerprint WHERE table_name = %s;", (table,))
+    return file_fp, {no: (rows, bytes(digest)) for no, rows, digest in cur.fetchall()}
+
+
+def save_fingerprints(cur, table: str, file_fp: tuple, chunks: Dict[int, tuple], n_chunks: int):
+    cur.execute("""
+        INSERT INTO load_file_fingerprint (table_name, size, mtime_ns, chunk_rows) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (table_name) DO UPDATE
+        SET size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns, chunk_rows = EXCLUDED.chunk_rows, updated_at = now()
+    """, (table, *file_fp))
+    cur.execute("DELETE FROM load_chunk_fingerprint WHERE table_name = %s AND chunk_no >= %s;", (table, n_chunks))
+    execute_values(cur, """
+        INSERT INTO load_chunk_fingerprint (table_name, chunk_no, rows, digest) VALUES %s
+        ON CONFLICT (table_name, chunk_no) DO UPDATE SET rows = EXCLUDED.rows, digest = EXCLUDED.digest
+    """, [(table, no, rows, digest) for no, (rows, digest) in chunks.items()])
+
+
+def upsert_key(cur, spec: TableLoad) -> Tuple[str, ...]:
+    """Самый короткий уникальный ключ таблицы, целиком лежащий в колонках CSV (для ON CONFLICT DO UPDATE)."""
+    cur.execute(SQL_UNIQUE_KEYS, (spec.table,))
+    for (key,) in cur.fetchall():
+        if set(key) <= set(spec.columns):
+            return tuple(key)
+    return ()
+
+
+def copy_staging(cur, spec: TableLoad, path: str, cleaner: Optional[olist_clean.RowCleaner],
+                 stored: Dict[int, tuple], changed: Dict[int, tuple]) -> int:
+    """
+    COPY чанков файла в staging; при cleaner — через olist_clean. Чанки, чей (rows, digest) совпадает со stored,
+    пропускаются; отпечатки прочитанных изменённых чанков пишутся в changed. Возвращает число чанков файла.
+    """
+    n_chunks = 0
+
+    def selected():
+        nonlocal n_chunks
+        for no, chunk in enumerate(olist_clean.iter_chunks(path, spec.columns, olist_clean.CHUNK_ROWS)):
+            n_chunks = no + 1
+            fp = (len(chunk), chunk_digest(chunk))
+            if stored.get(no) == fp:
+                continue
+            changed[no] = fp
+            yield olist_clean.encode_csv(cleaner.clean(chunk) if cleaner else chunk)
+
+    cols = ", ".join(spec.columns)
+    cur.copy_expert(f"COPY {spec.staging} ({cols}) FROM STDIN WITH (FORMAT csv)", olist_clean.CsvStream(selected()))
+    return n_chunks
+
+
+def merge_sql(spec: TableLoad, key: Tuple[str, ...], distinct: bool) -> str:
+    """
+    INSERT staging -> таблица. Без key — ON CONFLICT DO NOTHING (полная загрузка). С key — DO UPDATE неключевых
+    колонок, только если они изменились; из повторов ключа в staging берётся последняя строка файла.
+    """
+    cols = ", ".join(spec.columns)
+    if not key or set(key) == set(spec.columns):
+        target = f"({', '.join(spec.conflict)})" if spec.conflict else ""
+        return f"""
+            INSERT INTO {spec.table} ({cols})
+            SELECT {'DISTINCT ' if distinct else ''}{cols} FROM {spec.staging}
+            ON CONFLICT {target} DO NOTHING;
+        """
+    keys = ", ".join(key)
+    rest = [c for c in spec.columns if c not in key]
+    return f"""
+        INSERT INTO {spec.table} AS t ({cols})
+        SELECT DISTINCT ON ({keys}) {cols} FROM {spec.staging} ORDER BY {keys}, ctid DESC
+        ON CONFLICT ({keys}) DO UPDATE
+        SET {", ".join(f"{c} = EXCLUDED.{c}" for c in rest)}
+        WHERE ({", ".join(f"t.{c}" for c in rest)}) IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in rest)});
+    """
+
+
+def load_table(dsn: str, spec: TableLoad, data_dir: str, clean: bool = True,
+               delta: bool = False) -> Tuple[int, int, float]:
+    """
+    Грузит одну таблицу в одной транзакции вместе с чекпоинтом и отпечатками файла; (скопировано, вставлено
+    или обновлено, секунд). delta — читаются и применяются (DO UPDATE) только чанки, изменившиеся с прошлой
+    загрузки; файл с прежними размером и mtime не читается вовсе.
+    """
+    t0 = time.perf_counter()
+    path = os.path.join(data_dir, spec.csv)
+    st = os.stat(path)
+    file_fp = (st.st_size, st.st_mtime_ns, olist_clean.CHUNK_ROWS)
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            stored_file, stored = stored_fingerprints(cur, spec.table) if delta else (None, {})
+            if delta and stored_file == file_fp:
+                conn.rollback()
+                print(f"[delta] {spec.table}: file unchanged")
+                return 0, 0, time.perf_counter() - t0
+            if stored_file is not None and stored_file[2] != olist_clean.CHUNK_ROWS:
+                stored = {}  # другой размер чанка — границы не совпадают, сравнивать нечего
+
+            if not delta:
+                defer_indexes(cur, spec.table)
+            cur.execute(f"CREATE TEMP TABLE {spec.staging} (LIKE {spec.table} INCLUDING DEFAULTS) ON COMMIT DROP;")
+            cleaner = olist_clean.RowCleaner(spec.columns) if clean else None
+            changed: Dict[int, tuple] = {}
+            n_chunks = copy_staging(cur, spec, path, cleaner, stored, changed)
+            copied = sum(rows for rows, _ in changed.values())
+            if cleaner is not None:
+                copied = cleaner.stats.written
+                print(f"[clean] {spec.table}: {cleaner.stats.summary()}")
+                for sample in cleaner.stats.reject_samples:
+                    print(f"[clean] {spec.table}: rejected {sample}")
+            if delta:
+                print(f"[delta] {spec.table}: {len(changed)} of {n_chunks} chunks changed")
+
+            # DISTINCT нужен, только если дубли могли остаться в staging
+            distinct = spec.distinct and (cleaner is None or not cleaner.exact)
+            cur.execute(merge_sql(spec, upsert_key(cur, spec) if delta else (), distinct))
+            inserted = cur.rowcount
+            save_fingerprints(cur, spec.table, file_fp, changed, n_chunks)
+            seconds = time.perf_counter() - t0
+            cur.execute("""
+                INSERT INTO load_checkpoint (table_name, rows_copied, rows_inserted, rows_rejected, seconds)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (table_name) DO UPDATE
+                SET rows_copied = EXCLUDED.rows_copied, rows_inserted = EXCLUDED.rows_inserted,
+                    rows_rejected = EXCLUDED.rows_rejected, seconds = EXCLUDED.seconds, finished_at = now()
+            """, (spec.table, copied, inserted, cleaner.stats.rejected if cleaner else 0, seconds))
+        conn.commit()
+        if inserted:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"ANALYZE {spec.table};")
+        return copied, inserted, seconds
+    finally:
+        conn.close()
+
+
+def build_deferred_indexes(dsn: str):
+    """Создаёт отложенные индексы таблиц, которые уже загружены; запись удаляется вместе с созданием индекса."""
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT d.index_name, d.table_name, d.indexdef
+                FROM load_deferred_index d
+                JOIN load_checkpoint c USING (table_name)
+                ORDER BY d.table_name, d.index_name
+            """)
+            for name, table, indexdef in cur.fetchall():
+                t0 = time.perf_counter()
+                # у секционированной таблицы pg_get_indexdef даёт "ON ONLY" — индекс без секций
+                indexdef = indexdef.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1).replace(" ON ONLY ", " ON ", 1)
+                cur.execute(indexdef)
+                cur.execute("DELETE FROM load_deferred_index WHERE index_name = %s;", (name,))
+                conn.commit()
+                print(f"[index] {table}.{name} ({time.perf_counter() - t0:.2f}s)")
+    finally:
+        conn.close()
+
+
+def run(dsn: str, data_dir: str, jobs: int, force=(), clean: bool = True, delta: bool = False) -> bool:
+    """
+    Загружает все таблицы с учётом зависимостей; True — всё загружено (сейчас или раньше).
+    delta — проходит все таблицы независимо от чекпоинта, применяя только изменившиеся чанки.
+    """
+    started = time.perf_counter()
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SQL_SETUP)
+            if force:
+                cur.execute("DELETE FROM load_checkpoint WHERE table_name = ANY(%s);", (list(force),))
+            done = {} if delta else finished_tables(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+    for name, (copied, inserted, seconds) in sorted(done.items()):
+        print(f"{name:<36} skipped (checkpoint: {inserted}/{copied} rows in {seconds:.2f}s)")
+
+    pending = {spec.table: spec for spec in TABLES if spec.table not in done}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while pending or running:
+            for name, spec in list(pending.items()):
+                if any(dep in failed for dep in spec.depends):
+                    print(f"{name:<36} skipped (dependency failed)")
+                    failed.add(name)
+                    del pending[name]
+                elif all(dep in done for dep in spec.depends):
+                    running[pool.submit(load_table, dsn, spec, data_dir, clean, delta)] = name
+                    del pending[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    copied, inserted, seconds = future.result()
+                except Exception as e:
+                    print(f"{name:<36} FAILED: {e}".rstrip())
+                    failed.add(name)
+                    continue
+                done[name] = (copied, inserted, seconds)
+                print(f"{name:<36} {inserted:>9} / {copied:<9} rows {seconds:>8.2f}s")
+
+    build_deferred_indexes(dsn)
+    print(f"total {time.perf_counter() - started:.2f}s, failed: {', '.join(sorted(failed)) or 'none'}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, resumable COPY loader for the Olist CSV files")
+    parser.add_argument("--dsn", default=DEFAULT_DSN)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="каталог с CSV Olist")
+    parser.add_argument("--jobs", type=int, default=4, help="одновременно загружаемых таблиц (соединений)")
+    parser.add_argument("--force", action="append", default=[], choices=[t.table for t in TABLES],
+                        metavar="TABLE", help="загрузить таблицу заново, несмотря на чекпоинт (можно повторять)")
+    parser.add_argument("--raw", action="store_true", help="без olist_clean: CSV в COPY как есть")
+    parser.add_argument("--delta", action="store_true",
+                        help="только изменившиеся чанки файлов, изменённые строки — ON CONFLICT DO UPDATE")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.dsn, args.data_dir, args.jobs, args.force, not args.raw, args.delta) else 1)
+
+
+if __name__ == "__main__":
+    main()
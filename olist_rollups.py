@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# olist_rollups.py — обновление свёрток для дашбордов (assignment4/init/05_rollups.sql)
+#
+# Каждая свёртка обновляется своей транзакцией через refresh_rollup(name): пересчитываются только месяцы, которые
+# триггеры отметили в rollup_dirty после прошлого обновления (первый раз и с --full — полностью). Свёртки
+# независимы: их можно обновлять по отдельности и в разное время (например, state_orders — чаще остальных).
+#
+#   python olist_rollups.py
+#   python olist_rollups.py --rollup monthly_revenue --rollup state_orders
+#   ANALYTICS_ROLLUPS=1 python analytics.py   # графики читают свёртки вместо сырых таблиц
+import argparse
+import time
+
+import psycopg2
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=postgres user=postgres password=postgres"
+ROLLUPS = ("monthly_revenue", "category_revenue", "category_reviews", "state_orders")
+
+
+def refresh(dsn: str, rollups=None, full: bool = False):
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    try:
+        for name in rollups or ROLLUPS:
+            t0 = time.perf_counter()
+            with conn, conn.cursor() as cur:
+                cur.execute("SELECT refresh_rollup(%s, %s);", (name, full))
+                months = cur.fetchone()[0]
+            scope = "all months" if months < 0 else f"{months} months"
+            print(f"{name:<20} {scope:>12} {time.perf_counter() - t0:>8.2f}s")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally refresh dashboard rollup tables")
+    parser.add_argument("--dsn", default=DEFAULT_DSN)
+    parser.add_argument("--rollup", action="append", choices=ROLLUPS, metavar="ROLLUP",
+                        help="только эти свёртки (можно повторять)")
+    parser.add_argument("--full", action="store_true", help="пересчитать все месяцы")
+    args = parser.parse_args()
+    refresh(args.dsn, args.rollup, args.full)
+
+
+if __name__ == "__main__":
+    main()
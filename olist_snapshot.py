@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# olist_snapshot.py — Parquet-снимок схемы olist для офлайн-аналитики (analytics.py без нагрузки на базу)
+#
+# Каждая таблица выгружается через COPY (...) TO STDOUT (CSV) и перекладывается в Parquet потоково: вывод COPY
+# копится в SpooledTemporaryFile (больше SPOOL_BYTES — на диск), оттуда pyarrow читает его батчами в ParquetWriter.
+# Таблицы с датой (SNAPSHOT_TABLES) раскладываются по месяцам, по одному COPY на месяц (фильтр — полуинтервал по
+# столбцу, идёт по индексу / отсечению секций):
+#
+#   <dir>/orders/month=2017-10/part-0.parquet
+#   <dir>/orders/month=none/part-0.parquet        # строки без даты (пишется всегда, даже пустым)
+#   <dir>/customers/part-0.parquet
+#
+# Инкрементально (по умолчанию): для таблиц с датой выгружаются только месяцы начиная с месяца водяного знака
+# (максимальной даты прошлой выгрузки, хранится в <dir>/_snapshot.json) — последний месяц перезаписывается,
+# новые дописываются. Изменения строк в более ранних месяцах так не попадут — для них --full. Таблицы без
+# даты перевыгружаются целиком. Даты пишутся в UTC без часового пояса (TIMESTAMP в DuckDB).
+#
+#   python olist_snapshot.py --out snapshot
+#   ANALYTICS_SNAPSHOT_DIR=snapshot python analytics.py   # run_query читает снимок через DuckDB
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=postgres user=postgres password=postgres"
+SPOOL_BYTES = 64 * 1024 * 1024
+STATE_FILE = "_snapshot.json"
+NULL_MONTH = "none"
+
+# таблица -> столбец даты для помесячной раскладки (None — один файл на таблицу)
+SNAPSHOT_TABLES: Dict[str, Optional[str]] = {
+    "orders": "order_purchase_timestamp",
+    "order_items": "shipping_limit_date",
+    "order_reviews": "review_creation_date",
+    "order_payments": None,
+    "customers": None,
+    "sellers": None,
+    "products": None,
+    "geolocation": None,
+    "product_category_name_translation": None,
+}
+
+
+def arrow_type(data_type: str, precision: Optional[int], scale: Optional[int]) -> pa.DataType:
+    if data_type in ("integer", "smallint"):
+        return pa.int32()
+    if data_type == "bigint":
+        return pa.int64()
+    if data_type == "numeric":
+        return pa.decimal128(precision, scale) if precision else pa.float64()
+    if data_type in ("double precision", "real"):
+        return pa.float64()
+    if data_type == "boolean":
+        return pa.bool_()
+    if data_type == "date":
+        return pa.date32()
+    if data_type.startswith("timestamp"):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def table_schema(cur, table: str) -> Tuple[pa.Schema, List[str]]:
+    """Схема Arrow и выражения SELECT (даты — в UTC без пояса) по information_schema."""
+    cur.execute("""
+        SELECT column_name, data_type, numeric_precision, numeric_scale
+        FROM information_schema.columns
+        WHERE table_schema = 'olist' AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    fields, select = [], []
+    for name, data_type, precision, scale in cur.fetchall():
+        fields.append(pa.field(name, arrow_type(data_type, precision, scale)))
+        select.append(f"{name} AT TIME ZONE 'UTC' AS {name}" if data_type == "timestamp with time zone" else name)
+    if not fields:
+        raise ValueError(f"olist.{table} not found")
+    return pa.schema(fields), select
+
+
+def copy_to_parquet(cur, query: str, schema: pa.Schema, path: str) -> int:
+    """COPY (query) TO STDOUT -> Parquet-файл path (атомарно: через временный файл). Возвращает число строк."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", spool)
+        spool.seek(0)
+        reader = pa_csv.open_csv(
+            spool,
+            convert_options=pa_csv.ConvertOptions(
+                # NULL в CSV от COPY — только пустое поле без кавычек; "NA", "null" и т.п. — обычные строки
+                # (штат "NA" — значение по умолчанию в API, pyarrow по умолчанию читал бы его как NULL)
+                column_types=schema, null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False,
+            ),
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        rows = 0
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    os.replace(tmp, path)
+    return rows
+
+
+def month_starts(first: datetime, last: datetime) -> List[datetime]:
+    month = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def export_table(cur, out_dir: str, table: str, ts_col: Optional[str], watermark: Optional[str]):
+    """Выгружает таблицу; (строк, новый водяной знак или None, число файлов)."""
+    schema, select = table_schema(cur, table)
+    base = f"SELECT {', '.join(select)} FROM {table}"
+    table_dir = os.path.join(out_dir, table)
+    if ts_col is None:
+        rows = copy_to_parquet(cur, base, schema, os.path.join(table_dir, "part-0.parquet"))
+        return rows, None, 1
+
+    cur.execute(f"SELECT MIN({ts_col} AT TIME ZONE 'UTC'), MAX({ts_col} AT TIME ZONE 'UTC') FROM {table};")
+    first, last = cur.fetchone()
+    if watermark and first is not None:
+        first = max(first, datetime.fromisoformat(watermark))
+    elif not watermark and os.path.isdir(table_dir):
+        shutil.rmtree(table_dir)  # полная выгрузка: месяцы, которых больше нет в базе, не должны остаться
+    rows = copy_to_parquet(cur, f"{base} WHERE {ts_col} IS NULL", schema,
+                           os.path.join(table_dir, f"month={NULL_MONTH}", "part-0.parquet"))
+    files = 1
+    for month in month_starts(first, last) if first is not None else []:
+        nxt = (month + timedelta(days=32)).replace(day=1)
+        query = cur.mogrify(
+            f"{base} WHERE {ts_col} >= %s::timestamp AT TIME ZONE 'UTC' AND {ts_col} < %s::timestamp AT TIME ZONE 'UTC'",
+            (month, nxt),
+        ).decode()
+        rows += copy_to_parquet(cur, query, schema,
+                                os.path.join(table_dir, f"month={month:%Y-%m}", "part-0.parquet"))
+        files += 1
+    return rows, (last.isoformat() if last is not None else watermark), files
+
+
+def load_state(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(out_dir: str, state: dict):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_snapshot(dsn: str, out_dir: str, full: bool = False, tables=None):
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    if full:
+        # сбрасываем водяные знаки только выгружаемых таблиц — остальные продолжают инкрементально
+        for table in tables or SNAPSHOT_TABLES:
+            state.pop(table, None)
+    conn = psycopg2.connect(dsn, options="-c search_path=olist,public")
+    try:
+        # один снимок базы на все таблицы — согласованные между собой данные
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with conn.cursor() as cur:
+            for table in tables or SNAPSHOT_TABLES:
+                t0 = time.perf_counter()
+                ts_col = SNAPSHOT_TABLES[table]
+                watermark = state.get(table, {}).get("watermark")
+                rows, watermark, files = export_table(cur, out_dir, table, ts_col, watermark)
+                state[table] = {"watermark": watermark, "exported_at": datetime.now().isoformat(timespec="seconds")}
+                print(f"{table:<36} {rows:>9} rows {files:>4} files {time.perf_counter() - t0:>8.2f}s")
+        conn.rollback()
+    finally:
+        conn.close()
+    save_state(out_dir, state)
+
+
+# ---------- Чтение снимка (DuckDB): те же SQL-запросы, что и к Postgres ----------
+_duck = {}  # каталог снимка -> (соединение DuckDB, таблицы, для которых уже есть представление)
+_duck_lock = threading.Lock()
+
+
+def _connection(snapshot_dir: str):
+    """
+    DuckDB в памяти с представлениями olist-таблиц поверх Parquet (одно на каталог снимка).
+    DuckDB проверяет файлы уже при CREATE VIEW, поэтому представление создаётся только для таблиц,
+    у которых в снимке есть Parquet (частичный снимок: --table orders); недостающие добавляются
+    при следующих вызовах, когда их файлы появятся.
+    """
+    with _duck_lock:
+        con, views = _duck.get(snapshot_dir) or (None, set())
+        if con is None:
+            con = duckdb.connect()
+            _duck[snapshot_dir] = con, views
+        for table in SNAPSHOT_TABLES:
+            if table in views:
+                continue
+            pattern = os.path.join(snapshot_dir, table, "**", "*.parquet")
+            if not glob.glob(pattern, recursive=True):
+                continue
+            escaped = pattern.replace("'", "''")
+            con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{escaped}', hive_partitioning = false)")
+            views.add(table)
+        return con
+
+
+def query(snapshot_dir: str, sql: str) -> pd.DataFrame:
+    """Выполняет SQL по снимку и возвращает DataFrame (курсор на вызов — можно из нескольких потоков)."""
+    return _connection(snapshot_dir).cursor().execute(sql).df()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the olist schema to a month-partitioned Parquet snapshot")
+    parser.add_argument("--dsn", default=DEFAULT_DSN)
+    parser.add_argument("--out", default="snapshot", help="каталог снимка")
+    parser.add_argument("--full", action="store_true", help="выгрузить всё заново, без водяных знаков")
+    parser.add_argument("--table", action="append", choices=list(SNAPSHOT_TABLES), metavar="TABLE",
+                        help="только эти таблицы (можно повторять)")
+    args = parser.parse_args()
+    export_snapshot(args.dsn, args.out, args.full, args.table)
+
+
+if __name__ == "__main__":
+    main()
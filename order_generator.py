@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# order_generator.py — воспроизводимая многопроцессная генерация синтетических заказов
+#
+# Два режима, оба детерминированы seed'ом и не зависят от того, какой воркер что выполнил:
+#
+#   backfill — диапазон дней делится между процессами; день d генерируется своим
+#              np.random.default_rng([seed, d.toordinal()]), число заказов — Poisson(per_day);
+#   rate     — постоянная нагрузка на запись (orders/sec) для capacity-тестов: каждый воркер пишет
+#              свою долю потока блоками; блок b воркера w — default_rng([seed, w, b]), время покупки —
+#              логические часы (start + k / rate), так что повтор с тем же seed даёт те же строки.
+#
+# У каждого воркера одно соединение. order_id = префикс + метка прогона (--run) + день/воркер + номер,
+# поэтому параллельные воркеры и повторные прогоны с разными --run не конфликтуют.
+#
+#   python order_generator.py backfill --start 2018-09-01 --end 2018-12-31 --per-day 5000 --workers 4 --seed 42
+#   python order_generator.py rate --rate 2000 --duration 60 --workers 4 --seed 42
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import order_insert
+
+_conn = None
+
+def _init_worker():
+    global _conn
+    _conn = order_insert.get_db_connection()
+    with _conn.cursor() as cur:
+        order_insert.refresh_samplers(cur)
+    _conn.commit()
+
+def run_tag(run: str) -> str:
+    return f"g{run}_"
+
+# ---------- backfill ----------
+def _backfill_day(task):
+    day, per_day, seed, run = task
+    rng = np.random.default_rng([seed, day.toordinal()])
+    n = int(rng.poisson(per_day)) if per_day else 0
+    t0 = time.perf_counter()
+    with _conn.cursor() as cur:
+        order_insert.write_orders(cur, *order_insert.generate_day(day, n, rng, tag=run_tag(run)))
+    _conn.commit()
+    return day, n, time.perf_counter() - t0
+
+def backfill(start: date, end: date, per_day: int, workers: int, seed: int, run: str):
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    t0 = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for day, n, secs in pool.map(_backfill_day, [(d, per_day, seed, run) for d in days]):
+            total += n
+            print(f"[{day}] {n} orders in {secs:.2f}s")
+    elapsed = time.perf_counter() - t0
+    print(f"backfill: {len(days)} days, {total} orders in {elapsed:.1f}s ({total / elapsed:.0f} orders/s)")
+
+# ---------- rate ----------
+def _rate_worker(task):
+    worker, rate, duration, block, seed, run, start_at = task
+    t0 = time.monotonic()
+    written, b = 0, 0
+    lag_max = 0.0
+    tag = f"{run_tag(run)}w{worker:02d}_"
+    while True:
+        first = b * block
+        due = t0 + first / rate                  # когда по графику должен уйти блок
+        if due - t0 >= duration:
+            break
+        now = time.monotonic()
+        if due > now:
+            time.sleep(due - now)
+        else:
+            lag_max = max(lag_max, now - due)
+        rng = np.random.default_rng([seed, worker, b])
+        k = np.arange(first, first + block)
+        # логические часы: k-й заказ воркера приходится на start_at + k / rate
+        purchase = start_at + (k * 1_000_000 // rate).astype(np.int64).astype("timedelta64[us]")
+        ids = [order_insert.order_id(f"{tag}{i:09d}") for i in k]
+        with _conn.cursor() as cur:
+            order_insert.write_orders(cur, *order_insert.generate_orders(ids, purchase.astype("datetime64[s]"), rng))
+        _conn.commit()
+        written += block
+        b += 1
+    return worker, written, time.monotonic() - t0, lag_max
+
+def rate_mode(rate: float, duration: float, workers: int, seed: int, run: str, tick: float, start_at: datetime):
+    per_worker = rate / workers
+    block = max(1, int(round(per_worker * tick)))
+    start = np.datetime64(start_at, "us")
+    print(f"rate: {rate:.0f} orders/s = {workers} workers × {per_worker:.0f}/s, block={block}, duration={duration}s")
+    tasks = [(w, per_worker, duration, block, seed, run, start) for w in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        results = list(pool.map(_rate_worker, tasks))
+    total = sum(r[1] for r in results)
+    elapsed = max(r[2] for r in results)
+    for w, n, secs, lag in results:
+        print(f"  worker {w}: {n} orders in {secs:.1f}s, max lag {lag * 1000:.0f} ms")
+    print(f"achieved {total / elapsed:.0f} orders/s (target {rate:.0f})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic multi-process synthetic order generator")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    for p in (sub.add_parser("backfill"), sub.add_parser("rate")):
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--run", default=None, help="метка прогона в order_id (по умолчанию s<seed>)")
+    bf = sub.choices["backfill"]
+    bf.add_argument("--start", type=date.fromisoformat, required=True)
+    bf.add_argument("--end", type=date.fromisoformat, required=True)
+    bf.add_argument("--per-day", type=int, default=1000, help="среднее число заказов в день (Poisson)")
+    rt = sub.choices["rate"]
+    rt.add_argument("--rate", type=float, required=True, help="целевой поток, заказов/сек (на все воркеры)")
+    rt.add_argument("--duration", type=float, default=60.0, help="сек")
+    rt.add_argument("--tick", type=float, default=0.1, help="период записи блока, сек")
+    rt.add_argument("--start-at", type=datetime.fromisoformat, default=None,
+                    help="логическое время первого заказа (по умолчанию — сейчас)")
+    args = parser.parse_args()
+    run = args.run or f"s{args.seed}"
+
+    if args.mode == "backfill":
+        backfill(args.start, args.end, args.per_day, args.workers, args.seed, run)
+    else:
+        start_at = args.start_at or datetime.now().replace(microsecond=0)
+        rate_mode(args.rate, args.duration, args.workers, args.seed, run, args.tick, start_at)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,29 @@
+import argparse
+import calendar
+import csv
+import io
+import itertools
+import os
 import psycopg2
 import time
 import random
 from datetime import datetime, timedelta, date, time as dtime
 
+import numpy as np
+
+from id_sampler import olist_samplers
+
 # --- Параметры генерации ---
 ORDER_ID_PREFIX = "bb3b61a129a"  # префикс синтетических заказов для распознавания
+ORDER_ID_SUFFIX = "b10bb81a4770f3b1"
 SLEEP_BETWEEN_DAYS_SEC = 4       # пауза между днями (для наглядности на дашборде)
 BASE_COUNT_MIN = 0               # минимальное количество заказов в первый день
 BASE_COUNT_MAX = 10              # максимальное количество заказов в первый день
 DAILY_INCREMENT_MAX = 25         # максимум прироста к предыдущему дню
 FALLBACK_START_DATE = date(2018, 7, 17)  # если в БД нет ни одной записи
+MAX_ORDERS_PER_DAY = 0           # потолок заказов в день (0 — без ограничения, как раньше)
+
+PAYMENT_TYPES = ['credit_card', 'boleto', 'voucher', 'debit_card']
 
 # Режим выбора стартовой даты:
 # True  -> стартуем от последнего дня среди ВСЕХ заказов (реальные + синтетические)
@@ -26,6 +40,36 @@ def get_db_connection():
         options="-c search_path=olist,public"
     )
 
+# Запросы начального расчёта (первый запуск / --rebase). Фильтры — полуинтервалы по самому столбцу
+# и LIKE по префиксу, чтобы шли по idx_orders_purchase_ts / idx_orders_id_pattern (04_indexes.sql);
+# DATE(MAX(ts)) = MAX(DATE(ts)), но берётся из индекса одним чтением.
+SQL_LAST_DAY = "SELECT DATE(MAX(order_purchase_timestamp)) FROM orders;"
+
+SQL_LAST_SYNTHETIC_DAY = """
+    SELECT DATE(MAX(order_purchase_timestamp))
+    FROM orders
+    WHERE order_id LIKE %s || '%%'
+"""
+
+SQL_LAST_SYNTHETIC_DAY_COUNT = """
+    WITH last_day AS (
+        SELECT DATE(MAX(order_purchase_timestamp)) AS d
+        FROM orders
+        WHERE order_id LIKE %s || '%%'
+          AND order_purchase_timestamp >= %s
+    )
+    SELECT d,
+           (
+               SELECT COUNT(*)
+               FROM orders
+               WHERE order_id LIKE %s || '%%'
+                 AND order_purchase_timestamp >= d::timestamptz
+                 AND order_purchase_timestamp < (d + 1)::timestamptz
+           ) AS cnt
+    FROM last_day
+    WHERE d IS NOT NULL
+"""
+
 def get_dynamic_start_date(cur) -> date:
     """
     Берёт последнюю (максимальную) дату в orders и возвращает её.
@@ -33,13 +77,9 @@ def get_dynamic_start_date(cur) -> date:
     При USE_LAST_OF_ALL_ORDERS=False берём последнюю дату только среди синтетических заказов (по префиксу).
     """
     if USE_LAST_OF_ALL_ORDERS:
-        cur.execute("SELECT MAX(DATE(order_purchase_timestamp)) FROM orders;")
+        cur.execute(SQL_LAST_DAY)
     else:
-        cur.execute("""
-            SELECT MAX(DATE(order_purchase_timestamp))
-            FROM orders
-            WHERE order_id LIKE %s || '%%'
-        """, (ORDER_ID_PREFIX,))
+        cur.execute(SQL_LAST_SYNTHETIC_DAY, (ORDER_ID_PREFIX,))
     row = cur.fetchone()
     return row[0] if row and row[0] is not None else FALLBACK_START_DATE
 
@@ -48,24 +88,7 @@ def get_last_synthetic_day_and_count(cur, start_date: date):
     Возвращает (last_day_date, count_on_last_day) для СИНТЕТИЧЕСКИХ заказов, начиная с start_date.
     Если их нет — вернёт (start_date - 1 день, 0), чтобы следующий день стал start_date.
     """
-    cur.execute("""
-        WITH last_day AS (
-            SELECT DATE(order_purchase_timestamp) AS d
-            FROM orders
-            WHERE order_id LIKE %s || '%%'
-              AND order_purchase_timestamp >= %s
-            ORDER BY d DESC
-            LIMIT 1
-        )
-        SELECT d,
-               COALESCE((
-                   SELECT COUNT(*)
-                   FROM orders
-                   WHERE order_id LIKE %s || '%%'
-                     AND DATE(order_purchase_timestamp) = d
-               ), 0) AS cnt
-        FROM last_day
-    """, (ORDER_ID_PREFIX, start_date, ORDER_ID_PREFIX))
+    cur.execute(SQL_LAST_SYNTHETIC_DAY_COUNT, (ORDER_ID_PREFIX, start_date, ORDER_ID_PREFIX))
     row = cur.fetchone()
     if row is None:
         return (start_date - timedelta(days=1), 0)
@@ -78,20 +101,27 @@ def random_time_within_day(day: date) -> datetime:
     s = sec % 60
     return datetime.combine(day, dtime(hour=h, minute=m, second=s))
 
-def pick_random_ids(cur):
-    cur.execute("SELECT customer_id FROM customers ORDER BY RANDOM() LIMIT 1;")
-    customer_id = cur.fetchone()[0]
+# Ключи customers/sellers/products держатся в памяти (id_sampler), веса — по историческим заказам.
+# Загружаются при первом обращении и добираются refresh_samplers() раз в день.
+SAMPLERS = olist_samplers(weighted=True)
 
-    cur.execute("SELECT seller_id FROM sellers ORDER BY RANDOM() LIMIT 1;")
-    seller_id = cur.fetchone()[0]
+def refresh_samplers(cur):
+    for sampler in SAMPLERS.values():
+        sampler.refresh(cur)
 
-    cur.execute("SELECT product_id FROM products ORDER BY RANDOM() LIMIT 1;")
-    product_id = cur.fetchone()[0]
+def pick_random_ids(cur):
+    if not len(SAMPLERS["customers"]):
+        refresh_samplers(cur)
+    return SAMPLERS["customers"].one(), SAMPLERS["sellers"].one(), SAMPLERS["products"].one()
+
+_order_seq = itertools.count()
 
-    return customer_id, seller_id, product_id
+def order_id(body: str) -> str:
+    return f"{ORDER_ID_PREFIX}{body}{ORDER_ID_SUFFIX}"
 
 def make_order_id():
-    return f"{ORDER_ID_PREFIX}{int(datetime.now().timestamp())}_{random.randint(1000,9999)}b10bb81a4770f3b1"
+    # секунда + pid + счётчик процесса: без коллизий и при параллельной генерации
+    return order_id(f"{int(datetime.now().timestamp())}_{os.getpid()}_{next(_order_seq)}")
 
 def insert_order_for_timestamp(cur, purchase_dt: datetime):
     customer_id, seller_id, product_id = pick_random_ids(cur)
@@ -117,7 +147,6 @@ def insert_order_for_timestamp(cur, purchase_dt: datetime):
         ) VALUES (%s, 1, %s, %s, %s, %s, %s)
     """, (order_id, product_id, seller_id, shipping_limit, price, freight))
 
-    payment_types = ['credit_card', 'boleto', 'voucher', 'debit_card']
     cur.execute("""
         INSERT INTO order_payments (
             order_id, payment_sequential, payment_type,
@@ -125,27 +154,133 @@ def insert_order_for_timestamp(cur, purchase_dt: datetime):
         ) VALUES (%s, 1, %s, %s, %s)
     """, (
         order_id,
-        random.choice(payment_types),
+        random.choice(PAYMENT_TYPES),
         random.randint(1, 12),
         round(random.uniform(30.0, 500.0), 2)
     ))
 
-def main():
+# --- Пакетный режим: весь день генерируется векторно (NumPy) и пишется COPY в одной транзакции ---
+ORDER_COLUMNS = ("order_id", "customer_id", "order_status", "order_purchase_timestamp",
+                 "order_estimated_delivery_date")
+ITEM_COLUMNS = ("order_id", "order_item_id", "product_id", "seller_id",
+                "shipping_limit_date", "price", "freight_value")
+PAYMENT_COLUMNS = ("order_id", "payment_sequential", "payment_type",
+                   "payment_installments", "payment_value")
+
+def generate_orders(order_ids, purchase: np.ndarray, rng: np.random.Generator):
+    """
+    Заказы, позиции и оплаты для готовых order_id и моментов покупки (datetime64[s]) — те же
+    распределения, что и у insert_order_for_timestamp. Возвращает три итератора строк для COPY.
+    """
+    n = len(order_ids)
+    estimated = purchase + rng.integers(10, 46, n).astype("timedelta64[D]")
+    shipping = purchase + np.timedelta64(5, "D")
+
+    purchase_s = np.datetime_as_string(purchase, unit="s")
+    orders = zip(order_ids, SAMPLERS["customers"].sample(n, rng), ["approved"] * n, purchase_s,
+                 np.datetime_as_string(estimated, unit="s"))
+    items = zip(order_ids, [1] * n, SAMPLERS["products"].sample(n, rng), SAMPLERS["sellers"].sample(n, rng),
+                np.datetime_as_string(shipping, unit="s"),
+                np.char.mod("%.2f", rng.uniform(25.0, 450.0, n)),
+                np.char.mod("%.2f", rng.uniform(5.0, 35.0, n)))
+    payments = zip(order_ids, [1] * n, rng.choice(PAYMENT_TYPES, n), rng.integers(1, 13, n),
+                   np.char.mod("%.2f", rng.uniform(30.0, 500.0, n)))
+    return orders, items, payments
+
+def generate_day(day: date, n: int, rng: np.random.Generator, tag: str = ""):
+    """Весь день сразу: n заказов со случайным временем в пределах суток."""
+    purchase = np.datetime64(day, "s") + rng.integers(0, 24*60*60, n).astype("timedelta64[s]")
+    # id уникален в пределах дня: эпоха начала дня (UTC, не зависит от TZ машины) + порядковый номер
+    # (tag — метка прогона генератора)
+    day_epoch = calendar.timegm(day.timetuple())
+    return generate_orders([order_id(f"{tag}{day_epoch}_{i:04d}") for i in range(n)], purchase, rng)
+
+def write_orders(cur, orders, items, payments):
+    copy_csv(cur, "orders", ORDER_COLUMNS, orders)
+    copy_csv(cur, "order_items", ITEM_COLUMNS, items)
+    copy_csv(cur, "order_payments", PAYMENT_COLUMNS, payments)
+
+def copy_csv(cur, table: str, columns, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def insert_day_bulk(cur, day: date, n: int, rng: np.random.Generator):
+    refresh_samplers(cur)
+    write_orders(cur, *generate_day(day, n, rng))
+
+# --- Чекпоинт прогресса: последний день и число заказов, обновляются в той же транзакции, что и вставки ---
+# (таблица generator_checkpoint создаётся в assignment4/init/02_tables.sql)
+CHECKPOINT_NAME = f"order_insert:{ORDER_ID_PREFIX}"
+
+def ensure_checkpoint(cur, rebase: bool = False):
+    """
+    Создаёт строку генератора в generator_checkpoint. Полные сканы orders (get_dynamic_start_date,
+    get_last_synthetic_day_and_count) выполняются только здесь — один раз при первом запуске
+    или явно по rebase=True (например, если в orders появились реальные заказы новее чекпоинта).
+    """
+    cur.execute("SELECT 1 FROM generator_checkpoint WHERE generator = %s;", (CHECKPOINT_NAME,))
+    if cur.fetchone() and not rebase:
+        return
+    dynamic_start = get_dynamic_start_date(cur)
+    last_day, last_count = get_last_synthetic_day_and_count(cur, dynamic_start)
+    cur.execute("""
+        INSERT INTO generator_checkpoint (generator, last_day, last_count, increment_max)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (generator) DO UPDATE
+        SET last_day = EXCLUDED.last_day, last_count = EXCLUDED.last_count, updated_at = now()
+    """, (CHECKPOINT_NAME, last_day, last_count, DAILY_INCREMENT_MAX))
+    print(f"Checkpoint initialised from orders: last_day={last_day}, last_count={last_count}")
+
+def load_checkpoint(cur):
+    """(last_day, last_count, increment_max); FOR UPDATE — второй генератор будет ждать, а не дублировать день."""
+    cur.execute("""
+        SELECT last_day, last_count, increment_max
+        FROM generator_checkpoint
+        WHERE generator = %s
+        FOR UPDATE
+    """, (CHECKPOINT_NAME,))
+    return cur.fetchone()
+
+def save_checkpoint(cur, day: date, count: int, increment_max: int):
+    cur.execute("""
+        UPDATE generator_checkpoint
+        SET last_day = %s, last_count = %s, increment_max = %s, updated_at = now()
+        WHERE generator = %s
+    """, (day, count, increment_max, CHECKPOINT_NAME))
+
+def main(mode: str = "bulk", max_days: int = 0, seed: int = None, rebase: bool = False):
     global DAILY_INCREMENT_MAX
-    print("Starting day-by-day backfill with monotonically increasing daily counts...")
+    print(f"Starting day-by-day backfill with monotonically increasing daily counts ({mode} mode)...")
+    rng = np.random.default_rng(seed)
+    if seed is not None:
+        random.seed(seed)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            ensure_checkpoint(cur, rebase)
+        conn.commit()
+    finally:
+        conn.close()
+
+    days_done = 0
     while True:
         conn = None
         try:
             conn = get_db_connection()
             cur = conn.cursor()
 
-            # 1) Динамически определяем стартовую дату
-            dynamic_start = get_dynamic_start_date(cur)
+            # 1) Прогресс из чекпоинта — O(1) вместо сканов orders
+            checkpoint = load_checkpoint(cur)
+            if checkpoint is None:
+                # строку удалили, пока генератор работал, — заново считаем по orders (в этой же транзакции)
+                ensure_checkpoint(cur)
+                checkpoint = load_checkpoint(cur)
+            last_day, last_count, DAILY_INCREMENT_MAX = checkpoint
 
-            # 2) Узнаём, какой последний СИНТЕТИЧЕСКИЙ день уже заполнен, учитывая dynamic_start
-            last_day, last_count = get_last_synthetic_day_and_count(cur, dynamic_start)
-
-            # 3) Следующий день к вставке
+            # 2) Следующий день к вставке
             next_day = last_day + timedelta(days=1)
 
             today = datetime.now().date()
@@ -156,8 +291,8 @@ def main():
                 time.sleep(5)
                 continue
 
-            # 4) Сколько заказов вставлять в next_day
-            if last_count == 0 and last_day < dynamic_start:
+            # 3) Сколько заказов вставлять в next_day
+            if last_count == 0:
                 # первый «наш» день для этого диапазона
                 orders_today = random.randint(BASE_COUNT_MIN, BASE_COUNT_MAX)
             else:
@@ -165,19 +300,31 @@ def main():
                 if DAILY_INCREMENT_MAX < 400:
                     DAILY_INCREMENT_MAX *= 2
                 orders_today = last_count + increment
+            if MAX_ORDERS_PER_DAY:
+                orders_today = min(orders_today, MAX_ORDERS_PER_DAY)
 
-            print(f"[{next_day}] inserting {orders_today} orders (prev synthetic day had {last_count}); "
-                  f"dynamic_start={dynamic_start}")
+            print(f"[{next_day}] inserting {orders_today} orders (prev synthetic day had {last_count})")
 
-            # 5) Вставляем заказы, случайно распределяя время в пределах суток
-            for _ in range(orders_today):
-                purchase_dt = random_time_within_day(next_day)
-                insert_order_for_timestamp(cur, purchase_dt)
+            # 4) Вставляем заказы, случайно распределяя время в пределах суток
+            t0 = time.perf_counter()
+            if mode == "bulk":
+                insert_day_bulk(cur, next_day, orders_today, rng)
+            else:
+                refresh_samplers(cur)
+                for _ in range(orders_today):
+                    purchase_dt = random_time_within_day(next_day)
+                    insert_order_for_timestamp(cur, purchase_dt)
 
+            # 5) Чекпоинт — в той же транзакции: после падения продолжаем ровно со следующего дня
+            save_checkpoint(cur, next_day, orders_today, DAILY_INCREMENT_MAX)
             conn.commit()
-            print(f"[{next_day}] done.")
+            elapsed = time.perf_counter() - t0
+            print(f"[{next_day}] done in {elapsed:.2f}s ({orders_today / elapsed if elapsed else 0:.0f} orders/s).")
             cur.close()
 
+            days_done += 1
+            if max_days and days_done >= max_days:
+                break
             time.sleep(SLEEP_BETWEEN_DAYS_SEC)
 
         except Exception as e:
@@ -188,4 +335,16 @@ def main():
                 conn.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Synthetic day-by-day order generator")
+    parser.add_argument("--mode", choices=("bulk", "rows"), default="bulk",
+                        help="bulk — день целиком через COPY; rows — прежняя построчная вставка")
+    parser.add_argument("--days", type=int, default=0, help="остановиться после N дней (0 — бесконечно)")
+    parser.add_argument("--sleep", type=float, default=SLEEP_BETWEEN_DAYS_SEC, help="пауза между днями, сек")
+    parser.add_argument("--max-per-day", type=int, default=MAX_ORDERS_PER_DAY, help="потолок заказов в день")
+    parser.add_argument("--seed", type=int, default=None, help="seed для воспроизводимой генерации")
+    parser.add_argument("--rebase", action="store_true",
+                        help="пересчитать чекпоинт по таблице orders (разовый полный скан)")
+    args = parser.parse_args()
+    SLEEP_BETWEEN_DAYS_SEC = args.sleep
+    MAX_ORDERS_PER_DAY = args.max_per_day
+    main(args.mode, args.days, args.seed, args.rebase)
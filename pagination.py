@@ -0,0 +1,90 @@
+# pagination.py — keyset-пагинация и NDJSON-стриминг для списков заказов
+#
+# Порядок выдачи: (order_purchase_timestamp DESC NULLS LAST, order_id DESC).
+# Курсор next — непрозрачный токен (base64url от JSON [timestamp|null, order_id]) последней строки
+# страницы; следующая страница начинается строго после неё, без OFFSET.
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+import psycopg2.extensions
+
+import fast_json
+
+KEYSET_ORDER_BY = "ORDER BY o.order_purchase_timestamp DESC NULLS LAST, o.order_id DESC"
+
+# строк на один FETCH из серверного (named) курсора в режиме стриминга
+STREAM_CHUNK_ROWS = 2000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(purchase_ts, order_id: str) -> str:
+    ts = purchase_ts.isoformat() if purchase_ts is not None else None
+    raw = json.dumps([ts, order_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], str]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        ts, order_id = json.loads(raw)
+        return (datetime.fromisoformat(ts) if ts is not None else None), str(order_id)
+    except Exception:
+        raise InvalidCursor("invalid cursor")
+
+
+# Условия «строго после курсора» (с учётом NULLS LAST) — по одному на вид курсора, чтобы у каждого
+# был свой именованный подготовленный запрос (см. sql_registry).
+KEYSET_PREDICATES = {
+    "first": "TRUE",
+    # уже в «хвосте» из заказов без даты — двигаемся только по order_id
+    "tail": "(o.order_purchase_timestamp IS NULL AND o.order_id < %s)",
+    "after": "((o.order_purchase_timestamp, o.order_id) < (%s, %s) OR o.order_purchase_timestamp IS NULL)",
+}
+
+
+def keyset_predicate(token: Optional[str]) -> Tuple[str, tuple]:
+    """Вид курсора (ключ KEYSET_PREDICATES) и параметры его условия."""
+    if not token:
+        return "first", ()
+    ts, order_id = decode_cursor(token)
+    if ts is None:
+        return "tail", (order_id,)
+    return "after", (ts, order_id)
+
+
+def next_cursor(columns, rows, limit: int) -> Optional[str]:
+    """Токен следующей страницы по последней строке (строки — кортежи в порядке columns)."""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last[columns.index("order_purchase_timestamp")], last[columns.index("order_id")])
+
+
+def stream_ndjson(acquire, release, sql: str, params: tuple):
+    """
+    Генератор NDJSON: читает результат серверным курсором по STREAM_CHUNK_ROWS строк,
+    поэтому память не зависит от размера выборки. Соединение берётся через acquire() при первой
+    итерации (а не в обработчике — если стрим так и не начнётся, соединение не повиснет),
+    держится до конца стрима и возвращается через release(conn), в том числе при обрыве клиента.
+    """
+    conn = acquire()
+    try:
+        with conn.cursor(name="orders_stream", cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.itersize = STREAM_CHUNK_ROWS
+            cur.execute(sql, params)
+            columns = None
+            while True:
+                rows = cur.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [d.name for d in cur.description]
+                yield fast_json.encode_ndjson(columns, rows)
+        conn.rollback()
+    finally:
+        release(conn)
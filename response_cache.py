@@ -0,0 +1,184 @@
+# response_cache.py — ограниченный in-process кэш ответов API (TTL + LRU) с ETag
+#
+# Значение кэша — уже сериализованное тело ответа (bytes) и его ETag, поэтому попадание в кэш
+# не тратит время ни на БД, ни на сериализацию. Записи помечаются тегами (например,
+# ("by-customer-id", "c1")), по тегу их сбрасывают при записи в затронутые ключи.
+#
+# Кэш живёт в процессе. При нескольких воркерах (serve.py) сброс разносится через Postgres: воркер, принявший
+# запись, делает NOTIFY с тегами (notify_invalidation), а InvalidationListener каждого воркера слушает канал
+# отдельным соединением и сбрасывает те же теги у себя.
+import hashlib
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+
+import psycopg2
+
+INVALIDATION_CHANNEL = "olist_response_cache"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "status_code")
+
+    def __init__(self, body: bytes, status_code: int = 200):
+        self.body = body
+        self.status_code = status_code
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, Tuple]]" = OrderedDict()
+        self._tags = {}  # tag -> set(keys)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = item
+            if expires_at <= now:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl: float, tags: Iterable[Hashable] = ()):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags: Hashable) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if key in self._data:
+                        self._drop(key)
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def notify_invalidation(cur, tags: Iterable[Tuple]):
+    """NOTIFY с тегами в канал INVALIDATION_CHANNEL; доставляется слушателям после COMMIT транзакции cur."""
+    payload = json.dumps([list(tag) for tag in tags])
+    cur.execute("SELECT pg_notify(%s, %s);", (INVALIDATION_CHANNEL, payload))
+
+
+def _decode_tags(payload: str) -> List[Tuple]:
+    return [tuple(tag) for tag in json.loads(payload)]
+
+
+class InvalidationListener:
+    """
+    Фоновый поток: LISTEN на INVALIDATION_CHANNEL и cache.invalidate(*теги) на каждое уведомление.
+    Уведомления, пришедшие, пока соединение было потеряно, не доставляются, поэтому после
+    переподключения кэш очищается целиком.
+    """
+
+    def __init__(self, dsn: str, cache: ResponseCache, poll: float = 1.0, retry: float = 2.0):
+        self.dsn = dsn
+        self.cache = cache
+        self.poll = poll
+        self.retry = retry
+        self.received = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.poll + 1)
+
+    def _run(self):
+        reconnect = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {INVALIDATION_CHANNEL};")
+                if reconnect:
+                    self.cache.clear()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        self.received += 1
+                        self.cache.invalidate(*_decode_tags(note.payload))
+            except (psycopg2.Error, OSError) as e:
+                print(f"[cache] invalidation listener: {e}; reconnecting in {self.retry}s")
+                reconnect = True
+                self._stop.wait(self.retry)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
@@ -0,0 +1,79 @@
+# result_cache.py — дисковый кэш результатов запросов (DataFrame -> Parquet) с LRU по размеру каталога
+#
+# Ключ — хэш текста SQL и «версии данных» (водяного знака), которую вычисляет вызывающий: пока данные не
+# менялись, тот же запрос отдаётся из файла <dir>/<ключ>.parquet без обращения к базе. Старые версии не
+# удаляются явно — они просто перестают запрашиваться и вытесняются по LRU, когда суммарный размер
+# каталога превышает max_bytes (время последнего использования — mtime файла, обновляется при попадании).
+import hashlib
+import os
+import threading
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+
+class ResultCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(sql: str, watermark: str) -> str:
+        return hashlib.blake2b(f"{sql}\x00{watermark}".encode(), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)  # LRU: отметка использования
+        except (FileNotFoundError, pa.ArrowException, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp, index=False, compression="zstd")
+        except (pa.ArrowException, ValueError, TypeError):
+            # колонку не перевести в Arrow (смешанные типы и т.п.) — такой результат просто не кэшируем
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".parquet"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# serve.py — production-запуск API в несколько процессов (uvicorn workers)
+#
+# Один процесс uvicorn занимает одно ядро, поэтому здесь запускается N воркеров. Пул соединений
+# каждого воркера считается из общего бюджета соединений, так что N × PG_POOL_MAX никогда
+# не выходит за max_connections Postgres:
+#
+#   budget     = PG_CONN_BUDGET или (max_connections − superuser_reserved_connections − PG_CONN_RESERVE)
+#   PG_POOL_MAX = budget // workers  (явный PG_POOL_MAX может только уменьшить это значение)
+#
+# Каждый воркер в startup открывает PG_POOL_WARM соединений, готовит запросы каталога sql_registry
+# и прогревает кэш ответов (server.warm_up); до этого он не принимает запросы, а /ready отвечает 503.
+# Метрики всех воркеров собираются через PROMETHEUS_MULTIPROC_DIR.
+#
+# Кэш ответов server:app у каждого воркера свой. При workers > 1 включается CACHE_NOTIFY: запись, принятая
+# одним воркером, рассылается остальным через LISTEN/NOTIFY (по соединению-слушателю на воркер — оно
+# вычитается из бюджета). Между COMMIT и доставкой уведомления (обычно миллисекунды) другие воркеры ещё
+# могут отдать старую страницу; если слушатель потерял соединение — до его переподключения.
+#
+#   python serve.py --workers 4 --port 8000
+#   python serve.py --app server_async:app --workers 4 --port 8001
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import psycopg2
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_DSN = (
+    f"host={os.getenv('PGHOST', 'localhost')} port={os.getenv('PGPORT', '5432')} "
+    f"dbname={os.getenv('PGDATABASE', 'postgres')} user={os.getenv('PGUSER', 'postgres')} "
+    f"password={os.getenv('PGPASSWORD', 'postgres')}"
+)
+
+def server_connection_limit(dsn: str) -> int:
+    """max_connections минус слоты, зарезервированные за суперпользователем."""
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute("SELECT current_setting('max_connections')::int, "
+                    "current_setting('superuser_reserved_connections')::int;")
+        max_conn, reserved = cur.fetchone()
+    conn.close()
+    return max_conn - reserved
+
+def plan_pools(workers: int, limit: int, reserve: int, budget: int = None, pool_max: int = None,
+               extra_per_worker: int = 0) -> dict:
+    """
+    Размеры пула на воркер из общего бюджета; extra_per_worker — соединения воркера вне пула (слушатель
+    кэша). ValueError, если бюджета не хватает даже на 1 соединение пула.
+    """
+    available = limit - reserve
+    budget = min(budget, available) if budget else available
+    per_worker = budget // workers - extra_per_worker
+    if per_worker < 1:
+        raise ValueError(f"connection budget {budget} is too small for {workers} workers")
+    if pool_max:
+        per_worker = min(per_worker, pool_max)
+    return {"budget": budget, "per_worker": per_worker, "total": (per_worker + extra_per_worker) * workers}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with N uvicorn workers and a global DB connection budget")
+    parser.add_argument("--app", default="server:app")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--dsn", default=DEFAULT_DSN, help="для чтения max_connections")
+    parser.add_argument("--conn-budget", type=int, default=int(os.getenv("PG_CONN_BUDGET", "0")),
+                        help="общий лимит соединений API (0 — от max_connections)")
+    parser.add_argument("--conn-reserve", type=int, default=int(os.getenv("PG_CONN_RESERVE", "10")),
+                        help="соединения, оставляемые другим клиентам (Superset, скрипты, psql)")
+    args = parser.parse_args()
+
+    # сброс кэша ответов между воркерами — только у sync-API (server_async кэша ответов не держит)
+    if args.workers > 1 and args.app.split(":")[0] == "server":
+        os.environ.setdefault("CACHE_NOTIFY", "1")
+    listeners = 1 if os.environ.get("CACHE_NOTIFY") == "1" else 0
+
+    try:
+        plan = plan_pools(
+            args.workers, server_connection_limit(args.dsn), args.conn_reserve,
+            budget=args.conn_budget or None, pool_max=int(os.getenv("PG_POOL_MAX", "0")) or None,
+            extra_per_worker=listeners,
+        )
+    except (psycopg2.Error, ValueError) as e:
+        sys.exit(f"[serve] {e}")
+
+    per_worker = plan["per_worker"]
+    os.environ["PG_POOL_MAX"] = str(per_worker)
+    os.environ["PG_POOL_MIN"] = str(min(int(os.getenv("PG_POOL_MIN", "1")), per_worker))
+    os.environ.setdefault("PG_POOL_WARM", str(max(1, per_worker // 2)))
+
+    # общий каталог для метрик воркеров; чистим остатки прошлого запуска
+    mp_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "olist_api_metrics"))
+    shutil.rmtree(mp_dir, ignore_errors=True)
+    os.makedirs(mp_dir, exist_ok=True)
+
+    print(f"[serve] {args.app}: {args.workers} workers × (PG_POOL_MAX={per_worker} + {listeners} listener) "
+          f"= {plan['total']} connections (budget {plan['budget']}), warm={os.environ['PG_POOL_WARM']}")
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=args.workers, log_level="info")
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,90 @@
 import os
-from typing import Optional, List, Any, Dict
-from dataclasses import dataclass
-from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel, Field, constr, conint
-from psycopg2.pool import SimpleConnectionPool
-import psycopg2
+import time
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, constr, conint
+from psycopg2.extensions import cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-import os, time
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-
-def wait_pg_and_get_pool(max_attempts=20, delay=1.5):
-    dsn = (
-        f"host={os.getenv('PGHOST','db')} "
-        f"port={os.getenv('PGPORT','5432')} "
-        f"dbname={os.getenv('PGDATABASE','postgres')} "
-        f"user={os.getenv('PGUSER','postgres')} "
-        f"password={os.getenv('PGPASSWORD','postgres')}"
-    )
+
+import api_metrics
+import batch_ingest
+import fast_json
+from batch_ingest import BatchSpec, BatchRowError
+from db_pool import PgPool, PoolTimeout
+import pagination
+import sql_registry
+from pagination import KEYSET_ORDER_BY, InvalidCursor
+from api_metrics import db_query
+from response_cache import CachedResponse, InvalidationListener, ResponseCache, etag_matches, notify_invalidation
+from text_norm import norm_city  # ключ кэша /orders/by-city
+
+load_dotenv()
+
+PGHOST   = os.getenv("PGHOST", "localhost")
+PGPORT   = int(os.getenv("PGPORT", "5432"))
+PGDB     = os.getenv("PGDATABASE", "postgres")
+PGUSER   = os.getenv("PGUSER", "postgres")
+PGPASS   = os.getenv("PGPASSWORD", "postgres")
+PGSCHEMA = os.getenv("PGSCHEMA", "olist")
+PG_DSN   = f"host={PGHOST} port={PGPORT} dbname={PGDB} user={PGUSER} password={PGPASS}"
+
+POOL_MIN          = int(os.getenv("PG_POOL_MIN", "1"))
+POOL_MAX          = int(os.getenv("PG_POOL_MAX", "10"))
+POOL_TIMEOUT      = float(os.getenv("PG_POOL_TIMEOUT", "5.0"))
+POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "3600"))
+POOL_MAX_IDLE     = float(os.getenv("PG_POOL_MAX_IDLE", "600"))
+
+# кэш ответов read-эндпоинтов: размер (LRU) и TTL в секундах по эндпоинтам (0 — не кэшировать)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# прогрев воркера перед /ready: сколько соединений открыть заранее и сколько «горячих» городов
+# положить в кэш ответов (0 — не прогревать кэш)
+POOL_WARM         = int(os.getenv("PG_POOL_WARM", str(POOL_MIN)))
+WARM_TOP_CITIES   = int(os.getenv("WARM_TOP_CITIES", "5"))
+
+# PREPARE всех запросов каталога сразу при создании соединения (иначе — лениво, при первом вызове)
+PREPARE_ON_CONNECT = os.getenv("PG_PREPARE_ON_CONNECT", "1") == "1"
+# общий сброс кэша между воркерами через LISTEN/NOTIFY (+1 соединение на воркер); serve.py включает при workers > 1
+CACHE_NOTIFY = os.getenv("CACHE_NOTIFY", "0") == "1"
+CACHE_TTL = {
+    "by-customer-id": float(os.getenv("CACHE_TTL_BY_CUSTOMER_ID", "30")),
+    "by-city":        float(os.getenv("CACHE_TTL_BY_CITY", "120")),
+}
+
+def wait_pg_and_get_pool(max_attempts=20, delay=1.5) -> PgPool:
+    dsn = PG_DSN
     last_err = None
     for i in range(1, max_attempts+1):
+        pool = None
         try:
-            pool = SimpleConnectionPool(minconn=1, maxconn=10, dsn=dsn)
+            # search_path задаётся один раз при создании соединения (options), а не на каждый checkout
+            pool = PgPool(
+                dsn,
+                minconn=POOL_MIN, maxconn=POOL_MAX,
+                schema=PGSCHEMA,
+                timeout=POOL_TIMEOUT,
+                max_lifetime=POOL_MAX_LIFETIME,
+                max_idle=POOL_MAX_IDLE,
+                cursor_factory=RealDictCursor,
+                on_connect=sql_registry.prepare_all if PREPARE_ON_CONNECT else None,
+            )
             # проверим соединение сразу
-            conn = pool.getconn()
-            try:
+            with pool.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute("SELECT 1;")
                     cur.fetchone()
-            finally:
-                pool.putconn(conn)
             print(f"[startup] Connected to Postgres on attempt {i}")
             return pool
         except Exception as e:
             last_err = e
+            if pool is not None:
+                pool.closeall()  # пул создан, но проверка не прошла — закрываем его соединения до повтора
             print(f"[startup] Postgres not ready (attempt {i}/{max_attempts}): {e}")
             time.sleep(delay)
     raise RuntimeError(f"Cannot connect to Postgres after {max_attempts} attempts: {last_err}")
 
-
-load_dotenv()
-
-PGHOST   = os.getenv("PGHOST", "localhost")
-PGPORT   = int(os.getenv("PGPORT", "5432"))
-PGDB     = os.getenv("PGDATABASE", "postgres")
-PGUSER   = os.getenv("PGUSER", "postgres")
-PGPASS   = os.getenv("PGPASSWORD", "postgres")
-PGSCHEMA = os.getenv("PGSCHEMA", "olist")
-
 # ---------- Pydantic schemas ----------
 class CustomerIn(BaseModel):
     customer_id: str
@@ -68,36 +104,166 @@ class OrderIn(BaseModel):
     customer_id: str
     order_status: str = "created"
 
+# ---------- SQL (общие для sync- и async-режимов) ----------
+SQL_INSERT_CUSTOMER = """
+    INSERT INTO customers
+      (customer_id, customer_unique_id, customer_zip_code_prefix, customer_city, customer_state)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (customer_id) DO NOTHING;
+"""
+
+SQL_INSERT_SELLER = """
+    INSERT INTO sellers
+      (seller_id, seller_zip_code_prefix, seller_city, seller_state)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (seller_id) DO NOTHING;
+"""
+
+SQL_INSERT_ORDER = """
+    INSERT INTO orders (
+      order_id, customer_id, order_status,
+      order_purchase_timestamp, order_approved_at,
+      order_delivered_carrier_date, order_delivered_customer_date, order_estimated_delivery_date
+    )
+    VALUES (%s, %s, %s, NULL, NULL, NULL, NULL, NULL)
+    ON CONFLICT DO NOTHING;
+"""
+
+SQL_ORDERS_SELECT = """
+    SELECT
+      o.order_id, o.order_status,
+      o.order_purchase_timestamp, o.order_delivered_customer_date,
+      c.customer_id, c.customer_unique_id, c.customer_city, c.customer_state
+    FROM orders o
+    JOIN customers c ON c.customer_id = o.customer_id
+"""
+
+WHERE_BY_CUSTOMER_ID = "c.customer_id = %s"
+# Точное совпадение без учёта регистра и диакритики; norm_city() и индекс по ней — в 02_tables.sql.
+WHERE_BY_CITY = "norm_city(c.customer_city) = norm_city(%s)"
+
+SQL_CUSTOMER_CITY = "SELECT customer_city FROM customers WHERE customer_id = %s;"
+
+SQL_ORDERS_BY_CUSTOMER_ID = f"{SQL_ORDERS_SELECT} WHERE {WHERE_BY_CUSTOMER_ID} {KEYSET_ORDER_BY};"
+SQL_ORDERS_BY_CITY = f"{SQL_ORDERS_SELECT} WHERE {WHERE_BY_CITY} {KEYSET_ORDER_BY};"
+
+# ---------- Каталог именованных запросов (PREPARE на соединении, см. sql_registry.py) ----------
+sql_registry.register("insert_customer", SQL_INSERT_CUSTOMER)
+sql_registry.register("insert_seller", SQL_INSERT_SELLER)
+sql_registry.register("insert_order", SQL_INSERT_ORDER)
+sql_registry.register("customer_city", SQL_CUSTOMER_CITY)
+sql_registry.register("orders_by_customer_id", SQL_ORDERS_BY_CUSTOMER_ID)
+sql_registry.register("orders_by_city", SQL_ORDERS_BY_CITY)
+# keyset-страницы: по запросу на каждый вид курсора (first / after / tail)
+for _name, _where in (("orders_by_customer_id", WHERE_BY_CUSTOMER_ID), ("orders_by_city", WHERE_BY_CITY)):
+    for _variant, _keyset in pagination.KEYSET_PREDICATES.items():
+        sql_registry.register(
+            f"{_name}_page_{_variant}",
+            f"{SQL_ORDERS_SELECT} WHERE {_where} AND {_keyset} {KEYSET_ORDER_BY} LIMIT %s",
+        )
+sql_registry.register(
+    "top_cities",
+    "SELECT customer_city FROM customers GROUP BY customer_city ORDER BY COUNT(*) DESC LIMIT %s",
+)
+sql_registry.add_observer(api_metrics.observe_db_query)
+
+# ---------- Пакетная загрузка (COPY -> staging -> ON CONFLICT) ----------
+BATCH_SPECS = {
+    "customers": BatchSpec(
+        table="customers", model=CustomerIn,
+        columns=("customer_id", "customer_unique_id", "customer_zip_code_prefix", "customer_city", "customer_state"),
+        conflict=("customer_id",),
+        to_row=lambda b: (b.customer_id, b.customer_unique_id or b.customer_id,
+                          b.customer_zip_code_prefix, b.customer_city, b.customer_state),
+    ),
+    "sellers": BatchSpec(
+        table="sellers", model=SellerIn,
+        columns=("seller_id", "seller_zip_code_prefix", "seller_city", "seller_state"),
+        conflict=("seller_id",),
+        to_row=lambda b: (b.seller_id, b.seller_zip_code_prefix, b.seller_city, b.seller_state),
+    ),
+    "orders": BatchSpec(
+        table="orders", model=OrderIn,
+        columns=("order_id", "customer_id", "order_status"),
+        conflict=(),  # любой уникальный ключ orders: (order_id) или (order_id, order_purchase_timestamp) у секций
+        to_row=lambda b: (b.order_id, b.customer_id, b.order_status),
+    ),
+}
+
 # ---------- DB pool + helpers ----------
-pool: Optional[SimpleConnectionPool] = None
+pool: Optional[PgPool] = None
+response_cache = ResponseCache(maxsize=CACHE_MAX_ENTRIES)
+cache_listener: Optional[InvalidationListener] = None
 
 def _get_conn():
     if pool is None:
         raise RuntimeError("DB pool not initialized")
-    conn = pool.getconn()
-    with conn.cursor() as cur:
-        cur.execute("SET search_path TO %s, public;", (PGSCHEMA,))
-    return conn
+    t0 = time.perf_counter()
+    try:
+        return pool.getconn()
+    except PoolTimeout as e:
+        raise HTTPException(503, f"DB pool exhausted: {e}", headers={"Retry-After": "1"})
+    finally:
+        api_metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - t0)
 
 def _put_conn(conn):
     if pool:
         pool.putconn(conn)
 
 app = FastAPI(title="Olist API", version="1.0.0")
+api_metrics.install(app, pool_stats=lambda: pool.stats() if pool else None,
+                    cache_stats=response_cache.stats)
+
+# состояние прогрева; /ready отвечает 200 только после warm_up()
+warmup = {"ready": False, "seconds": None, "connections": 0, "cached_cities": 0}
+
+def warm_up():
+    """
+    Открывает POOL_WARM соединений (с PREPARE всего каталога на каждом), затем выполняет горячие
+    запросы и кладёт в кэш ответы /orders/by-city для WARM_TOP_CITIES самых частых городов.
+    Выполняется в startup, т.е. до того, как воркер начнёт принимать запросы.
+    """
+    t0 = time.perf_counter()
+    conns = []
+    try:
+        for _ in range(min(POOL_WARM, pool.maxconn)):
+            conns.append(pool.getconn())
+        for conn in conns:
+            sql_registry.prepare_all(conn)  # no-op, если уже подготовлено в on_connect
+            conn.commit()
+    finally:
+        warmup["connections"] = len(conns)
+        for conn in conns:
+            pool.putconn(conn)
+    cities = []
+    if WARM_TOP_CITIES > 0:
+        with pool.connection() as conn:
+            with conn.cursor(cursor_factory=TupleCursor) as cur:
+                sql_registry.execute(cur, "top_cities", (WARM_TOP_CITIES,))
+                cities = [r[0] for r in cur.fetchall() if r[0]]
+            conn.rollback()
+    for city in cities:
+        _orders_list("by-city", norm_city(city), (city,), None, None, False, "objects", None)
+    warmup.update(ready=True, seconds=round(time.perf_counter() - t0, 3), cached_cities=len(cities))
+    print(f"[startup] warm-up done in {warmup['seconds']}s: "
+          f"{warmup['connections']} connections, {len(cities)} cities cached")
 
 @app.on_event("startup")
 def startup():
-    global pool
+    global pool, cache_listener
     pool = wait_pg_and_get_pool()
-    pool = SimpleConnectionPool(
-        minconn=1, maxconn=10,
-        dsn=f"host={PGHOST} port={PGPORT} dbname={PGDB} user={PGUSER} password={PGPASS}",
-        cursor_factory=RealDictCursor,
-    )
+    if CACHE_NOTIFY:
+        cache_listener = InvalidationListener(PG_DSN, response_cache)
+        cache_listener.start()
+    warm_up()
 
 @app.on_event("shutdown")
 def shutdown():
-    global pool
+    global pool, cache_listener
+    warmup["ready"] = False
+    if cache_listener:
+        cache_listener.stop()
+        cache_listener = None
     if pool:
         pool.closeall()
         pool = None
@@ -107,6 +273,53 @@ def shutdown():
 def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """Готовность принимать трафик (в отличие от /health — liveness процесса): пул открыт, прогрев завершён."""
+    if pool is None or not warmup["ready"]:
+        raise HTTPException(503, "warming up", headers={"Retry-After": "1"})
+    return {"status": "ready", "pid": os.getpid(), "pool_maxconn": pool.maxconn, "warmup": warmup}
+
+@app.get("/pool")
+def pool_stats():
+    if pool is None:
+        raise HTTPException(503, "DB pool not initialized")
+    return pool.stats()
+
+@app.get("/cache")
+def cache_stats():
+    stats = response_cache.stats()
+    if cache_listener:
+        stats["notifications"] = cache_listener.received
+    return stats
+
+@app.get("/queries")
+def query_stats():
+    return sql_registry.stats()
+
+def _invalidate(conn, *tags):
+    """
+    Сброс тегов в кэше этого воркера и, при CACHE_NOTIFY, — NOTIFY остальным воркерам.
+    Вызывается после COMMIT записи, на том же соединении.
+    """
+    response_cache.invalidate(*tags)
+    if not CACHE_NOTIFY:
+        return
+    try:
+        with conn.cursor() as cur:
+            notify_invalidation(cur, tags)
+        conn.commit()
+    except Exception as e:
+        # запись уже закоммичена — остальные воркеры досмотрят старый ответ до конца TTL
+        conn.rollback()
+        print(f"[cache] NOTIFY failed: {e}")
+
+def _invalidate_customer(conn, customer_id: str, city: Optional[str]):
+    tags = [("by-customer-id", customer_id)]
+    if city is not None:
+        tags.append(("by-city", norm_city(city)))
+    _invalidate(conn, *tags)
+
 @app.post("/customers", status_code=201)
 def create_customer(body: CustomerIn):
     conn = _get_conn()
@@ -114,12 +327,11 @@ def create_customer(body: CustomerIn):
         cuid = body.customer_unique_id or body.customer_id
         with conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO customers
-                      (customer_id, customer_unique_id, customer_zip_code_prefix, customer_city, customer_state)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (customer_id) DO NOTHING;
-                """, (body.customer_id, cuid, body.customer_zip_code_prefix, body.customer_city, body.customer_state))
+                sql_registry.execute(cur, "insert_customer", (
+                    body.customer_id, cuid, body.customer_zip_code_prefix,
+                    body.customer_city, body.customer_state,
+                ))
+        _invalidate_customer(conn, body.customer_id, body.customer_city)
         return {"ok": True, "customer_id": body.customer_id}
     except Exception as e:
         raise HTTPException(500, str(e))
@@ -132,12 +344,9 @@ def create_seller(body: SellerIn):
     try:
         with conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO sellers
-                      (seller_id, seller_zip_code_prefix, seller_city, seller_state)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (seller_id) DO NOTHING;
-                """, (body.seller_id, body.seller_zip_code_prefix, body.seller_city, body.seller_state))
+                sql_registry.execute(cur, "insert_seller", (
+                    body.seller_id, body.seller_zip_code_prefix, body.seller_city, body.seller_state,
+                ))
         return {"ok": True, "seller_id": body.seller_id}
     except Exception as e:
         raise HTTPException(500, str(e))
@@ -148,72 +357,178 @@ def create_seller(body: SellerIn):
 def create_order(body: OrderIn):
     conn = _get_conn()
     try:
+        inserted, city = False, None
         with conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO orders (
-                      order_id, customer_id, order_status,
-                      order_purchase_timestamp, order_approved_at,
-                      order_delivered_carrier_date, order_delivered_customer_date, order_estimated_delivery_date
-                    )
-                    VALUES (%s, %s, %s, NULL, NULL, NULL, NULL, NULL)
-                    ON CONFLICT (order_id) DO NOTHING;
-                """, (body.order_id, body.customer_id, body.order_status))
+                sql_registry.execute(cur, "insert_order", (body.order_id, body.customer_id, body.order_status))
+                if cur.rowcount:
+                    inserted = True
+                    sql_registry.execute(cur, "customer_city", (body.customer_id,))
+                    row = cur.fetchone()
+                    city = row["customer_city"] if row else None
+        # после COMMIT: иначе параллельный GET успеет закэшировать старую выборку заново
+        if inserted:
+            _invalidate_customer(conn, body.customer_id, city)
         return {"ok": True, "order_id": body.order_id}
     except Exception as e:
         raise HTTPException(500, str(e))
     finally:
         _put_conn(conn)
 
-@app.get("/orders/by-customer-id/{customer_id}")
-def orders_by_customer_id(customer_id: str):
+MAX_PAGE_LIMIT = 1000
+
+def _cached_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": cached.etag}
+    if cached.status_code == 200 and etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, status_code=cached.status_code,
+                    media_type="application/json", headers=headers)
+
+def _query_orders(query_name: str, params: tuple, limit: Optional[int], cursor: Optional[str]):
+    """Возвращает (columns, rows, page_limit); строки — кортежи обычного курсора, без dict."""
     conn = _get_conn()
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  o.order_id, o.order_status,
-                  o.order_purchase_timestamp, o.order_delivered_customer_date,
-                  c.customer_id, c.customer_unique_id, c.customer_city, c.customer_state
-                FROM orders o
-                JOIN customers c ON c.customer_id = o.customer_id
-                WHERE c.customer_id = %s
-                ORDER BY o.order_purchase_timestamp DESC NULLS LAST;
-            """, (customer_id,))
+        with conn.cursor(cursor_factory=TupleCursor) as cur:
+            if limit is None and cursor is None:
+                sql_registry.execute(cur, query_name, params)
+            else:
+                limit = limit or MAX_PAGE_LIMIT
+                variant, keyset_params = pagination.keyset_predicate(cursor)
+                sql_registry.execute(cur, f"{query_name}_page_{variant}", params + keyset_params + (limit,))
             rows = cur.fetchall()
-        if not rows:
-            raise HTTPException(404, "orders not found")
-        return rows
-    except HTTPException:
-        raise
+            columns = [d.name for d in cur.description]
+        return columns, rows, limit
+    except InvalidCursor as e:
+        raise HTTPException(400, str(e))
     except Exception as e:
         raise HTTPException(500, str(e))
     finally:
         _put_conn(conn)
 
+def _orders_list(endpoint: str, cache_arg: str, params: tuple,
+                 limit: Optional[int], cursor: Optional[str], stream: bool, fmt: str,
+                 if_none_match: Optional[str]):
+    """
+    Общая выборка заказов для /orders/by-*:
+      * без limit/stream — весь результат одним списком (как раньше);
+      * limit [+ cursor]  — keyset-страница {"items": [...], "next": <токен или null>};
+      * stream=true       — NDJSON из серверного курсора, память не растёт с размером выборки.
+    format=compact отдаёт {"columns": [...], "rows": [[...]]} (+ "next" для страниц) — строки
+    кодируются orjson прямо из кортежей, без промежуточных dict.
+    Списки и страницы (включая 404) кэшируются на CACHE_TTL[endpoint] секунд вместе с ETag;
+    If-None-Match с тем же ETag даёт 304 без тела.
+    """
+    query_name = f"orders_{endpoint.replace('-', '_')}"
+    if stream:
+        # серверный (DECLARE) курсор не умеет EXECUTE — берём текст запроса из каталога;
+        # соединение генератор возьмёт сам, уже внутри стрима
+        return StreamingResponse(
+            pagination.stream_ndjson(_get_conn, _put_conn, sql_registry.sql(query_name), params),
+            media_type="application/x-ndjson",
+        )
+
+    key = (endpoint, cache_arg, limit, cursor, fmt)
+    cached = response_cache.get(key)
+    if cached is None:
+        columns, rows, page_limit = _query_orders(query_name, params, limit, cursor)
+        with api_metrics.SERIALIZE_SECONDS.labels(endpoint=endpoint).time():
+            if not rows and cursor is None:
+                cached = CachedResponse(fast_json.dumps({"detail": "orders not found"}), 404)
+            elif page_limit is None:
+                cached = CachedResponse(fast_json.encode_rows(columns, rows, fmt))
+            else:
+                next_token = pagination.next_cursor(columns, rows, page_limit)
+                cached = CachedResponse(fast_json.encode_page(columns, rows, next_token, fmt))
+        response_cache.put(key, cached, CACHE_TTL[endpoint],
+                           tags=[(endpoint, cache_arg), (endpoint,)])
+    return _cached_response(cached, if_none_match)
+
+@app.get("/orders/by-customer-id/{customer_id}")
+def orders_by_customer_id(
+    customer_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT, description="Page size (keyset pagination)"),
+    cursor: Optional[str] = Query(None, description="Opaque `next` token from the previous page"),
+    stream: bool = Query(False, description="Stream all rows as NDJSON"),
+    format: str = Query("objects", pattern="^(objects|compact)$", description="objects | compact (columns + rows)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _orders_list("by-customer-id", customer_id, (customer_id,),
+                        limit, cursor, stream, format, if_none_match)
+
 @app.get("/orders/by-city")
-def orders_by_city(city: str = Query(..., description="Exact match (case-insensitive)")):
-    conn = _get_conn()
+def orders_by_city(
+    city: str = Query(..., description="Exact match (case- and accent-insensitive)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT, description="Page size (keyset pagination)"),
+    cursor: Optional[str] = Query(None, description="Opaque `next` token from the previous page"),
+    stream: bool = Query(False, description="Stream all rows as NDJSON"),
+    format: str = Query("objects", pattern="^(objects|compact)$", description="objects | compact (columns + rows)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _orders_list("by-city", norm_city(city), (city,),
+                        limit, cursor, stream, format, if_none_match)
+
+# ---------- Batch endpoints ----------
+async def _ingest_batch(request: Request, spec: BatchSpec):
+    """
+    Тело — JSON-массив объектов или NDJSON (Content-Type: application/x-ndjson).
+    JSON-массив читается и разбирается до того, как берётся соединение из пула; NDJSON читается потоком.
+    Строки проверяются и сбрасываются в staging-таблицу чанками по COPY_CHUNK_ROWS в пуле потоков,
+    event loop занят только чтением тела.
+    """
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    objs = None
+    if not ndjson:
+        body = await request.body()
+        try:
+            objs = await run_in_threadpool(batch_ingest.parse_json_array, body)
+        except BatchRowError as e:
+            raise HTTPException(422, str(e))
+
+    conn = await run_in_threadpool(_get_conn)
     try:
-        with conn.cursor() as cur:
-            # ILIKE без % — точное (но case-insensitive) совпадение.
-            cur.execute("""
-                SELECT
-                  o.order_id, o.order_status,
-                  o.order_purchase_timestamp, o.order_delivered_customer_date,
-                  c.customer_id, c.customer_unique_id, c.customer_city, c.customer_state
-                FROM orders o
-                JOIN customers c ON c.customer_id = o.customer_id
-                WHERE c.customer_city ILIKE %s
-                ORDER BY o.order_purchase_timestamp DESC NULLS LAST;
-            """, (city,))
-            rows = cur.fetchall()
-        if not rows:
-            raise HTTPException(404, "orders not found")
-        return rows
+        await run_in_threadpool(batch_ingest.begin_staging, conn, spec)
+        received = 0
+
+        async def _copy(chunk):
+            nonlocal received
+            with db_query(f"{spec.table}_batch_copy"):
+                await run_in_threadpool(batch_ingest.copy_chunk, conn, spec, chunk, received + 1, ndjson)
+            received += len(chunk)
+
+        if ndjson:
+            async for chunk in batch_ingest.iter_ndjson_chunks(request.stream()):
+                await _copy(chunk)
+        else:
+            for i in range(0, len(objs), batch_ingest.COPY_CHUNK_ROWS):
+                await _copy(objs[i:i + batch_ingest.COPY_CHUNK_ROWS])
+
+        with db_query(f"{spec.table}_batch_merge"):
+            inserted = await run_in_threadpool(batch_ingest.merge_staging, conn, spec)
+        if inserted and spec.table in ("customers", "orders"):
+            # пакет может задеть любые ключи — сбрасываем закэшированные списки заказов целиком
+            await run_in_threadpool(_invalidate, conn, ("by-customer-id",), ("by-city",))
+        return {"ok": True, "table": spec.table, "received": received,
+                "inserted": inserted, "skipped": received - inserted}
+    except BatchRowError as e:
+        conn.rollback()
+        raise HTTPException(422, str(e))
     except HTTPException:
+        conn.rollback()
         raise
     except Exception as e:
+        conn.rollback()
         raise HTTPException(500, str(e))
     finally:
         _put_conn(conn)
+
+@app.post("/customers:batch")
+async def create_customers_batch(request: Request):
+    return await _ingest_batch(request, BATCH_SPECS["customers"])
+
+@app.post("/sellers:batch")
+async def create_sellers_batch(request: Request):
+    return await _ingest_batch(request, BATCH_SPECS["sellers"])
+
+@app.post("/orders:batch")
+async def create_orders_batch(request: Request):
+    return await _ingest_batch(request, BATCH_SPECS["orders"])
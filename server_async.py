@@ -0,0 +1,183 @@
+# server_async.py — async-режим API: async def хендлеры + пул psycopg 3 (AsyncConnectionPool)
+#
+# Запуск:
+#   uvicorn server_async:app --host 0.0.0.0 --port 8001
+#
+# Пул настраивается переменными окружения:
+#   PG_POOL_MIN          минимальное число соединений (по умолчанию 2)
+#   PG_POOL_MAX          максимальное число соединений (по умолчанию 20)
+#   PG_POOL_TIMEOUT      сколько секунд ждать свободное соединение (по умолчанию 2.0)
+#   PG_POOL_MAX_WAITING  сколько запросов может стоять в очереди к пулу (по умолчанию 100)
+# Если пул исчерпан (таймаут ожидания или переполнена очередь) — отвечаем 503 с Retry-After,
+# а не копим бесконечную очередь.
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout, TooManyRequests
+
+import api_metrics
+from api_metrics import db_query
+from server import (
+    PGHOST, PGPORT, PGDB, PGUSER, PGPASS, PGSCHEMA,
+    CustomerIn, SellerIn, OrderIn,
+    SQL_INSERT_CUSTOMER, SQL_INSERT_SELLER, SQL_INSERT_ORDER,
+    SQL_ORDERS_BY_CUSTOMER_ID, SQL_ORDERS_BY_CITY,
+)
+
+POOL_MIN = int(os.getenv("PG_POOL_MIN", "2"))
+POOL_MAX = int(os.getenv("PG_POOL_MAX", "20"))
+POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "2.0"))
+POOL_MAX_WAITING = int(os.getenv("PG_POOL_MAX_WAITING", "100"))
+RETRY_AFTER_SEC = 1
+
+# search_path задаётся в параметрах подключения — без лишнего SET на каждый запрос
+CONNINFO = (
+    f"host={PGHOST} port={PGPORT} dbname={PGDB} user={PGUSER} password={PGPASS} "
+    f"options='-c search_path={PGSCHEMA},public'"
+)
+
+# ---------- DB pool + helpers ----------
+pool: Optional[AsyncConnectionPool] = None
+
+@asynccontextmanager
+async def _get_conn():
+    """
+    Соединение из пула; при исчерпании пула (таймаут или переполненная очередь) — 503.
+    Время ожидания соединения пишется в тот же histogram, что и у sync-сервера.
+    """
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    async with AsyncExitStack() as stack:
+        t0 = time.perf_counter()
+        try:
+            conn = await stack.enter_async_context(pool.connection())
+        except (PoolTimeout, TooManyRequests) as e:
+            raise HTTPException(503, f"DB pool exhausted: {e}", headers={"Retry-After": str(RETRY_AFTER_SEC)})
+        finally:
+            api_metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - t0)
+        yield conn
+
+def _pool_metrics():
+    if pool is None:
+        return None
+    st = pool.get_stats()
+    return {"in_use": st["pool_size"] - st["pool_available"], "idle": st["pool_available"], "maxconn": POOL_MAX}
+
+app = FastAPI(title="Olist API (async)", version="1.0.0")
+api_metrics.install(app, pool_stats=_pool_metrics)
+
+@app.on_event("startup")
+async def startup():
+    global pool
+    pool = AsyncConnectionPool(
+        CONNINFO,
+        min_size=POOL_MIN,
+        max_size=POOL_MAX,
+        timeout=POOL_TIMEOUT,
+        max_waiting=POOL_MAX_WAITING,
+        kwargs={"row_factory": dict_row},
+        open=False,
+    )
+    await pool.open(wait=True, timeout=30)  # min_size соединений уже открыты — это и есть прогрев
+    print(f"[startup] async pool ready: min={POOL_MIN} max={POOL_MAX} "
+          f"timeout={POOL_TIMEOUT}s max_waiting={POOL_MAX_WAITING}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    global pool
+    if pool:
+        await pool.close()
+        pool = None
+
+# ---------- Endpoints ----------
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    if pool is None or pool.closed:
+        raise HTTPException(503, "warming up", headers={"Retry-After": str(RETRY_AFTER_SEC)})
+    return {"status": "ready", "pid": os.getpid(), "pool_maxconn": POOL_MAX}
+
+@app.get("/pool")
+async def pool_stats():
+    if pool is None:
+        raise HTTPException(503, "DB pool not initialized")
+    return pool.get_stats()
+
+@app.post("/customers", status_code=201)
+async def create_customer(body: CustomerIn):
+    try:
+        cuid = body.customer_unique_id or body.customer_id
+        async with _get_conn() as conn:
+            with db_query("insert_customer"):
+                await conn.execute(SQL_INSERT_CUSTOMER, (
+                    body.customer_id, cuid, body.customer_zip_code_prefix,
+                    body.customer_city, body.customer_state,
+                ))
+        return {"ok": True, "customer_id": body.customer_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+@app.post("/sellers", status_code=201)
+async def create_seller(body: SellerIn):
+    try:
+        async with _get_conn() as conn:
+            with db_query("insert_seller"):
+                await conn.execute(SQL_INSERT_SELLER, (
+                    body.seller_id, body.seller_zip_code_prefix, body.seller_city, body.seller_state,
+                ))
+        return {"ok": True, "seller_id": body.seller_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+@app.post("/orders", status_code=201)
+async def create_order(body: OrderIn):
+    try:
+        async with _get_conn() as conn:
+            with db_query("insert_order"):
+                await conn.execute(SQL_INSERT_ORDER, (body.order_id, body.customer_id, body.order_status))
+        return {"ok": True, "order_id": body.order_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+@app.get("/orders/by-customer-id/{customer_id}")
+async def orders_by_customer_id(customer_id: str):
+    try:
+        async with _get_conn() as conn:
+            with db_query("orders_by_customer_id"):
+                cur = await conn.execute(SQL_ORDERS_BY_CUSTOMER_ID, (customer_id,))
+                rows = await cur.fetchall()
+        if not rows:
+            raise HTTPException(404, "orders not found")
+        return rows
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+@app.get("/orders/by-city")
+async def orders_by_city(city: str = Query(..., description="Exact match (case- and accent-insensitive)")):
+    try:
+        async with _get_conn() as conn:
+            with db_query("orders_by_city"):
+                cur = await conn.execute(SQL_ORDERS_BY_CITY, (city,))
+                rows = await cur.fetchall()
+        if not rows:
+            raise HTTPException(404, "orders not found")
+        return rows
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
@@ -0,0 +1,153 @@
+# sql_registry.py — единый каталог именованных SQL-запросов проекта (server.py, main.py, analytics.py)
+#
+# Запрос регистрируется один раз под именем и дальше выполняется только по имени:
+#
+#   sql_registry.register("orders_by_city", "SELECT ... WHERE norm_city(c.customer_city) = norm_city(%s)")
+#   sql_registry.execute(cur, "orders_by_city", (city,))
+#
+# prepare=True (по умолчанию): на каждом соединении запрос один раз проходит PREPARE — заранее
+# (prepare_all как on_connect-хук пула) или лениво при первом execute, — затем выполняется как
+# EXECUTE name(...): текст не пересылается и не разбирается заново, а после нескольких выполнений
+# Postgres может перейти на generic-план и перестать планировать join на каждый вызов.
+# prepare=False — разовые тяжёлые аналитические запросы: выполняются текстом (custom-план под
+# реальные данные), но учитываются в той же статистике.
+#
+# Плейсхолдеры — %s, как в psycopg2; для PREPARE они переписываются в $1..$n.
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+class Statement:
+    __slots__ = ("name", "sql", "prepare", "nparams", "prepare_sql",
+                 "calls", "errors", "total_seconds", "max_seconds")
+
+    def __init__(self, name: str, sql: str, prepare: bool):
+        self.name = name
+        self.sql = sql
+        self.prepare = prepare
+        counter = iter(range(1, 10_000))
+
+        def _sub(m):
+            return "%" if m.group(0) == "%%" else f"${next(counter)}"
+
+        self.prepare_sql = f"PREPARE {name} AS {_PLACEHOLDER.sub(_sub, sql)}"
+        self.nparams = next(counter) - 1
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+_statements: Dict[str, Statement] = {}
+_prepared = weakref.WeakKeyDictionary()  # соединение -> set(имён, уже подготовленных на нём)
+_observers: List[Callable[[str, float], None]] = []
+_lock = threading.Lock()
+
+
+def register(name: str, sql: str, prepare: bool = True) -> str:
+    """Добавляет запрос в каталог; повторная регистрация того же текста — no-op."""
+    if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        raise ValueError(f"invalid statement name: {name!r}")
+    sql = sql.strip().rstrip(";").strip()
+    with _lock:
+        st = _statements.get(name)
+        if st is not None:
+            if st.sql != sql or st.prepare != prepare:
+                raise ValueError(f"statement {name!r} already registered with different SQL")
+            return name
+        _statements[name] = Statement(name, sql, prepare)
+    return name
+
+
+def sql(name: str) -> str:
+    """Текст запроса (для EXPLAIN, серверных курсоров и т.п.)."""
+    return _statements[name].sql
+
+
+def names() -> List[str]:
+    return sorted(_statements)
+
+
+def add_observer(fn: Callable[[str, float], None]):
+    """fn(name, seconds) вызывается после каждого выполнения (например, гистограмма Prometheus)."""
+    _observers.append(fn)
+
+
+def _prepared_on(conn) -> set:
+    with _lock:
+        names_ = _prepared.get(conn)
+        if names_ is None:
+            names_ = _prepared[conn] = set()
+        return names_
+
+
+def prepare_all(conn, only: Optional[Iterable[str]] = None):
+    """PREPARE всех (или перечисленных) prepare=True запросов одним обращением к серверу."""
+    done = _prepared_on(conn)
+    todo = [
+        st for st in (_statements[n] for n in (only if only is not None else list(_statements)))
+        if st.prepare and st.name not in done
+    ]
+    if not todo:
+        return
+    with conn.cursor() as cur:
+        cur.execute(";\n".join(st.prepare_sql for st in todo) + ";")
+    done.update(st.name for st in todo)
+
+
+@contextmanager
+def timed(name: str):
+    """Учитывает выполнение в статистике запроса name (для вызовов не через execute)."""
+    st = _statements[name]
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        elapsed = time.perf_counter() - t0
+        with _lock:
+            st.calls += 1
+            st.errors += not ok
+            st.total_seconds += elapsed
+            if elapsed > st.max_seconds:
+                st.max_seconds = elapsed
+        for fn in _observers:
+            fn(name, elapsed)
+
+
+def execute(cur, name: str, params: tuple = ()):
+    """Выполняет запрос по имени на DB-API курсоре psycopg2 (результат — в cur, как после cur.execute)."""
+    st = _statements[name]
+    if not st.prepare:
+        with timed(name):
+            cur.execute(st.sql, params or None)
+        return
+    if len(params) != st.nparams:
+        raise ValueError(f"{name}: expected {st.nparams} params, got {len(params)}")
+    if st.name not in _prepared_on(cur.connection):
+        prepare_all(cur.connection, only=(name,))
+    args = f" ({', '.join(['%s'] * st.nparams)})" if st.nparams else ""
+    with timed(name):
+        cur.execute(f"EXECUTE {name}{args}", params or None)
+
+
+def stats() -> Dict[str, dict]:
+    with _lock:
+        return {
+            st.name: {
+                "prepared": st.prepare,
+                "calls": st.calls,
+                "errors": st.errors,
+                "total_ms": round(st.total_seconds * 1000, 3),
+                "avg_ms": round(st.total_seconds * 1000 / st.calls, 3) if st.calls else 0.0,
+                "max_ms": round(st.max_seconds * 1000, 3),
+            }
+            for st in sorted(_statements.values(), key=lambda s: s.name)
+        }
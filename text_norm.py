@@ -0,0 +1,15 @@
+# text_norm.py — нормализация текстовых ключей, общая для загрузчика (olist_clean.py) и API (server.py)
+#
+# norm_city() повторяет SQL-функцию norm_city() из assignment4/init/02_tables.sql: нижний регистр, без
+# диакритики и крайних пробелов ("São Paulo" и "sao paulo" -> "sao paulo"). Модуль без зависимостей,
+# чтобы API не тянул код очистки CSV ради одной функции.
+
+_CITY_FOLD = str.maketrans(
+    "ÁÀÂÃÄáàâãäÉÈÊËéèêëÍÌÎÏíìîïÓÒÔÕÖóòôõöÚÙÛÜúùûüÇçÑñ",
+    "AAAAAaaaaaEEEEeeeeIIIIiiiiOOOOOoooooUUUUuuuuCcNn",
+)
+
+
+def norm_city(city: str) -> str:
+    """Python-двойник SQL-функции norm_city()."""
+    return city.translate(_CITY_FOLD).strip(" ").lower()